@@ -4,7 +4,7 @@
 modname = 'localizer'
 distname = 'cubicweb-localizer'
 
-numversion = (0, 4, 0)
+numversion = (0, 5, 0)
 version = '.'.join(str(num) for num in numversion)
 
 license = 'LGPL'
@@ -16,6 +16,7 @@ web = 'http://brainomics.cea.fr'
 __depends__ =  {
     'cubicweb': '>= 3.16.1',
     'cubicweb-brainomics': None,  # actually it should be '< 0.5.0'
+    'numpy': None,
 }
 __recommends__ = {}
 
@@ -46,6 +47,10 @@ data_files = [
 for dname in ('entities', 'views', 'sobjects', 'hooks', 'schema', 'data', 'wdoc', 'i18n', 'migration'):
     if isdir(dname):
         data_files.append([join(THIS_CUBE_DIR, dname), listdir(dname)])
+# importer package
+for dname in ('importers', join('importers', 'localizer')):
+    if isdir(dname):
+        data_files.append([join(THIS_CUBE_DIR, dname), listdir(dname)])
 # Note: here, you'll need to add subdirectories if you want
 # them to be included in the debian package
 
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+# copyright 2013 CEA (Saclay, FRANCE), all rights reserved.
+# copyright 2013 LOGILAB S.A. (Paris, FRANCE), all rights reserved.
+# contact http://brainomics.cea.fr -- mailto:localizer94@cea.fr
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""cubicweb-localizer genotype-phenotype association scan
+
+Test the association of a phenotype with every SNP of the genotyping file:
+
+* quantitative phenotypes: linear regression of the phenotype on the number of
+  A1 alleles, tested with a Student t statistic;
+* binary phenotypes: logistic model, tested with a score (chi-square)
+  statistic, which needs no iterative fitting.
+
+Statistics are computed for blocks of SNPs at once with numpy, genotypes
+being read from the memory-mapped .bed file; blocks are spread over a pool of
+processes. Each study is scanned on its own PLINK file, with its own subjects.
+Results are stored in the localizer cache directory, by study, named after
+the state of the genotypes file and the phenotype values. Phenotypes are
+given as `score:<score name>` (e.g. `score:language`) or
+`question:<question text>`. Run with::
+
+    cubicweb-ctl shell <instance> association.py <phenotype> [linear|logistic]
+"""
+
+import sys
+import os
+import os.path as osp
+import hashlib
+from multiprocessing import Pool
+
+import numpy as np
+
+from cubicweb.web import RequestError
+
+from cubes.localizer.caches import atomic_write, cache_directory
+from cubes.localizer.genotypes import (BLOCK_SNPS, bed_file, decode,
+                                       study_bed_paths)
+
+# number of SNPs blocks per task sent to the pool
+TASK_BLOCKS = 16
+
+PHENOTYPE_QUERIES = {
+    'score': ('Any SI, V WHERE S is Subject, S identifier SI, '
+              'S related_infos SV, SV definition D, D name %(name)s, '
+              'SV text V'),
+    'question': ('Any SI, V WHERE S is Subject, S identifier SI, '
+                 'R concerns S, R is QuestionnaireRun, A questionnaire_run R, '
+                 'A question Q, Q text %(name)s, A value V'),
+}
+
+
+###############################################################################
+### Statistics ################################################################
+###############################################################################
+def _sums(genotypes, phenotype):
+    """Return per-SNP sums over subjects with a known genotype"""
+    known = genotypes >= 0
+    g = np.where(known, genotypes, 0).astype(np.float64)
+    y = known * phenotype[:, np.newaxis]
+    n = known.sum(axis=0).astype(np.float64)
+    sx, sy = g.sum(axis=0), y.sum(axis=0)
+    cxx = (g * g).sum(axis=0) - sx * sx / n
+    cyy = (y * y).sum(axis=0) - sy * sy / n
+    cxy = (g * y).sum(axis=0) - sx * sy / n
+    return n, sy, cxx, cyy, cxy
+
+def linear_test(genotypes, phenotype):
+    """Return the t statistics, p-values and numbers of subjects of the
+    regression of `phenotype` on each column of the (subjects x SNPs)
+    `genotypes` matrix"""
+    from scipy import stats
+    n, _, cxx, cyy, cxy = _sums(genotypes, phenotype)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r = cxy / np.sqrt(cxx * cyy)
+        df = n - 2
+        t = r * np.sqrt(df / (1 - r * r))
+    return t, 2 * stats.t.sf(np.abs(t), df), n
+
+def logistic_test(genotypes, phenotype):
+    """Return the score statistics, p-values and numbers of subjects of the
+    logistic regression of the 0/1 `phenotype` on each column of the
+    (subjects x SNPs) `genotypes` matrix"""
+    from scipy import stats
+    n, sy, cxx, _, cxy = _sums(genotypes, phenotype)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ybar = sy / n
+        chi2 = cxy * cxy / (ybar * (1 - ybar) * cxx)
+    return chi2, stats.chi2.sf(chi2, 1), n
+
+TESTS = {'linear': linear_test, 'logistic': logistic_test}
+
+
+###############################################################################
+### Scan ######################################################################
+###############################################################################
+def scan_blocks(task):
+    """Test the SNPs of a range of blocks, run in a worker process"""
+    bed_path, first, last, rows, phenotype, model = task
+    bed = bed_file(bed_path)
+    results = []
+    for index in xrange(first, last):
+        start = index * BLOCK_SNPS
+        # decoded blocks are not cached, each block is read once
+        genotypes = decode(bed.bed[start:start + BLOCK_SNPS],
+                           bed.n_subjects)[:, rows].T
+        results.append(TESTS[model](genotypes, phenotype))
+    return [np.concatenate(arrays) for arrays in zip(*results)]
+
+def parse_phenotype(phenotype):
+    """Return the (kind, name) of a `<kind>:<name>` phenotype, raise
+    RequestError if it is malformed or of an unknown kind"""
+    kind, colon, name = phenotype.partition(':')
+    if not (colon and name and kind in PHENOTYPE_QUERIES):
+        raise RequestError('phenotype should be %s, not %r' % (
+            ' or '.join('%s:<name>' % kind for kind in
+                        sorted(PHENOTYPE_QUERIES)), phenotype))
+    return kind, name
+
+def phenotype_values(session, phenotype):
+    """Return a {subject identifier: value} dictionary for `phenotype`"""
+    kind, name = parse_phenotype(phenotype)
+    values = {}
+    for identifier, value in session.execute(PHENOTYPE_QUERIES[kind],
+                                             {'name': name}):
+        try:
+            values[identifier] = float(value)
+        except (TypeError, ValueError):
+            continue
+    return values
+
+def results_path(config, study, bed, rows, y, model):
+    """Return the path of the results of a scan, named after the state of
+    the genotypes file and the tested phenotype values, so that a new import
+    changing either is scanned again"""
+    key = hashlib.sha1(repr((bed.key, model)).encode('utf-8'))
+    key.update(np.ascontiguousarray(rows, dtype=np.int64))
+    key.update(np.ascontiguousarray(y, dtype=np.float64))
+    return osp.join(cache_directory(config), 'associations', str(study),
+                    '%s.npz' % key.hexdigest())
+
+def association_scan(session, phenotype, model=None, processes=None):
+    """Run the association scan of `phenotype` in each study with genomic
+    measures, if it is not in cache, and return a {study eid: path of the
+    .npz results file} dictionary (arrays `snps`, `statistic`, `pvalue` and
+    `n`, in the .bim order of the study).
+
+    Raise RequestError if the phenotype is malformed, ValueError if it has
+    less than two distinct numeric values; studies whose subjects have less
+    than two distinct values are not scanned.
+    """
+    config = session.repo.config
+    values = phenotype_values(session, phenotype)
+    distinct = set(values.values())
+    if not distinct:
+        raise ValueError('no numeric value of phenotype %s' % phenotype)
+    if len(distinct) == 1:
+        raise ValueError('phenotype %s is constant' % phenotype)
+    if model is None:
+        model = 'logistic' if len(distinct) == 2 else 'linear'
+    elif model not in TESTS:
+        raise ValueError('unknown model %s' % model)
+    paths, scans = {}, []
+    for study, (bed_path, identifiers) in study_bed_paths(session).items():
+        # subjects are only tested against the genotypes of their study
+        identifiers = set(identifiers).intersection(values)
+        bed = bed_file(bed_path)
+        rows = [i for i, identifier in enumerate(bed.subjects)
+                if identifier in identifiers]
+        y = np.array([values[bed.subjects[i]] for i in rows])
+        if model == 'logistic':
+            y = (y == max(distinct)).astype(np.float64)
+        if len(np.unique(y)) < 2:
+            continue
+        paths[study] = path = results_path(config, study, bed, rows, y,
+                                           model)
+        if not osp.exists(path):
+            scans.append((bed, rows, y, path))
+    if not scans:
+        return paths
+    pool = Pool(processes)
+    try:
+        for bed, rows, y, path in scans:
+            n_blocks = (bed.n_snps + BLOCK_SNPS - 1) // BLOCK_SNPS
+            tasks = [(bed.path, first, min(first + TASK_BLOCKS, n_blocks),
+                      rows, y, model)
+                     for first in xrange(0, n_blocks, TASK_BLOCKS)]
+            chunks = pool.map(scan_blocks, tasks)
+            statistic, pvalue, n = [np.concatenate(arrays)
+                                    for arrays in zip(*chunks)]
+            if not osp.isdir(osp.dirname(path)):
+                os.makedirs(osp.dirname(path))
+            # readers never see a partial results file
+            atomic_write(path, lambda stream: np.savez(
+                stream, snps=np.array(bed.snps), statistic=statistic,
+                pvalue=pvalue, n=n, phenotype=phenotype, model=model))
+    finally:
+        pool.close()
+        pool.join()
+    return paths
+
+
+###############################################################################
+### MAIN ######################################################################
+###############################################################################
+if __name__ == '__main__':
+    from cubes.localizer.pools import importable
+    association_scan = importable(association_scan)
+    phenotype = sys.argv[4]
+    model = sys.argv[5] if len(sys.argv) > 5 else None
+    for study, path in sorted(association_scan(session, phenotype,
+                                               model).items()):
+        print study, path
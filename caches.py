@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+# copyright 2013 CEA (Saclay, FRANCE), all rights reserved.
+# copyright 2013 LOGILAB S.A. (Paris, FRANCE), all rights reserved.
+# contact http://brainomics.cea.fr -- mailto:localizer94@cea.fr
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""cubicweb-localizer caches of precomputed data
+
+Data which are expensive to compute from the database at each request (counts,
+summaries, ...) are computed once, e.g. at the end of the import, and stored as
+JSON documents in the localizer cache directory, from where web instances load
+them lazily.
+"""
+
+import os
+import os.path as osp
+import json
+import fcntl
+import tempfile
+import threading
+from datetime import datetime
+from collections import OrderedDict
+
+from cubes.localizer.schema import FACET_ATTRIBUTES
+
+
+def file_state(path):
+    """Return the size and modification time of a file, which identify its
+    version in the results computed from it"""
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime]
+
+def atomic_write(path, write):
+    """Write a file with `write(stream)` in a temporary file renamed to
+    `path`, so that readers never see a partial file; return the result of
+    `write`"""
+    fd, tmppath = tempfile.mkstemp(dir=osp.dirname(path),
+                                   prefix=osp.basename(path))
+    try:
+        with os.fdopen(fd, 'wb') as stream:
+            result = write(stream)
+        os.rename(tmppath, path)
+    except:
+        os.unlink(tmppath)
+        raise
+    return result
+
+def cache_directory(config):
+    """Return the localizer cache directory of an instance, create it if needed"""
+    path = config['localizer-cache-dir'] or osp.join(config.appdatahome,
+                                                     'localizer')
+    if not osp.isdir(path):
+        os.makedirs(path)
+    return path
+
+
+class JSONCache(object):
+    """A JSON document stored in the localizer cache directory
+
+    The document is kept in memory and reloaded when the file is modified,
+    e.g. by an import running in another process. Use `update` to modify it
+    from several threads or processes.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._data = None
+        self._mtime = None
+
+    def path(self, config):
+        return osp.join(cache_directory(config), self.name)
+
+    def load(self, config):
+        """Return the document, or an empty dict if it was never dumped"""
+        path = self.path(config)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return {}
+        # documents are replaced by a new file, see `dump`
+        mtime = (stat.st_ino, stat.st_mtime)
+        if mtime != self._mtime:
+            with open(path) as stream:
+                self._data = json.load(stream)
+            self._mtime = mtime
+        return self._data
+
+    def dump(self, config, data):
+        """Atomically replace the document by `data`"""
+        atomic_write(self.path(config), lambda stream: json.dump(data, stream))
+        self._data, self._mtime = None, None
+
+    def update(self, config, update):
+        """Replace the document by `update(document)` while holding an
+        exclusive lock, so that concurrent updates from other threads or
+        processes are not lost; return the new document"""
+        path = self.path(config)
+        with open(path + '.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                try:
+                    with open(path) as stream:
+                        data = json.load(stream)
+                except IOError:
+                    data = {}
+                data = update(data)
+                self.dump(config, data)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        return data
+
+
+class LRUCache(object):
+    """A thread-safe least recently used cache, bounded by the total size of
+    its values as computed by `sizeof` (by default, the number of values)
+    """
+
+    def __init__(self, maxsize, sizeof=None):
+        self.maxsize = maxsize
+        self.sizeof = sizeof or (lambda value: 1)
+        self.size = 0
+        self.hits = self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value, size = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data[key] = (value, size)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        size = self.sizeof(value)
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            if size > self.maxsize:
+                return
+            self._data[key] = (value, size)
+            self.size += size
+            while self.size > self.maxsize:
+                _, (_, oldsize) = self._data.popitem(last=False)
+                self.size -= oldsize
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+
+    def stats(self):
+        return {'entries': len(self._data), 'size': self.size,
+                'maxsize': self.maxsize, 'hits': self.hits,
+                'misses': self.misses}
+
+
+###############################################################################
+### IMPORT VERSION ############################################################
+###############################################################################
+IMPORT_VERSION = JSONCache('import-version.json')
+
+def mark_import(session):
+    """Record that an import just ended; results cached by import version
+    are then outdated"""
+    version = datetime.now().strftime('%Y%m%d%H%M%S')
+    IMPORT_VERSION.dump(session.repo.config, {'version': version})
+    return version
+
+def import_version(config):
+    """Return the version of the last import, or None if it was not
+    recorded"""
+    return IMPORT_VERSION.load(config).get('version')
+
+
+###############################################################################
+### STUDY IMPORTS #############################################################
+###############################################################################
+STUDY_IMPORTS = JSONCache('study-imports.json')
+
+def start_study_imports(config, names):
+    """Record that the studies `names` are being imported"""
+    def update(data):
+        incomplete = set(data.get('incomplete', ())).union(names)
+        data['incomplete'] = sorted(incomplete)
+        return data
+    STUDY_IMPORTS.update(config, update)
+
+def end_study_imports(config, names):
+    """Record that the import of the studies `names` is complete"""
+    def update(data):
+        incomplete = set(data.get('incomplete', ())).difference(names)
+        data['incomplete'] = sorted(incomplete)
+        return data
+    STUDY_IMPORTS.update(config, update)
+
+def incomplete_studies(config):
+    """Return the names of the studies whose import did not complete"""
+    return set(STUDY_IMPORTS.load(config).get('incomplete', ()))
+
+
+###############################################################################
+### FACET COUNTS ##############################################################
+###############################################################################
+FACET_COUNTS = JSONCache('facet-counts.json')
+# facet attributes whose counts are cached here, kept current by hooks; the
+# Subject facets read the cohort statistics (see statistics.py)
+COUNTED_FACETS = tuple((etype, attr) for etype, attr in FACET_ATTRIBUTES
+                       if etype == 'Scan')
+
+def count_facet_values(session, etypes=None):
+    """Return the {'etype.attr': {value: count}} counts of the counted facet
+    attributes of `etypes` (all if None)"""
+    counts = {}
+    for etype, attr in COUNTED_FACETS:
+        if etypes is not None and etype not in etypes:
+            continue
+        rset = session.execute('Any V, COUNT(X) GROUPBY V WHERE X is %s, '
+                               'X %s V' % (etype, attr))
+        counts['%s.%s' % (etype, attr)] = dict((value, count)
+                                               for value, count in rset)
+    return counts
+
+def store_facet_counts(config, counts):
+    """Replace the cached counts of the facet attributes of `counts`"""
+    def update(data):
+        data.update(counts)
+        return data
+    FACET_COUNTS.update(config, update)
+
+def refresh_facet_counts(session, etypes=None):
+    """Count entities for each value of the counted facet attributes of
+    `etypes` (all if None)"""
+    counts = count_facet_values(session, etypes)
+    store_facet_counts(session.repo.config, counts)
+    return counts
+
+def facet_counts(config, etype, attr):
+    """Return a {value: count} dictionary for the facet attribute"""
+    return FACET_COUNTS.load(config).get('%s.%s' % (etype, attr), {})
+
+
+###############################################################################
+### SCAN DERIVED DATA #########################################################
+###############################################################################
+def derived_data_directory(config, eid):
+    """Return the directory of the data derived from a Scan (thumbnail,
+    histogram and statistics), see importers/localizer/derived.py"""
+    return osp.join(cache_directory(config), 'derived', str(eid))
+
+def derived_data(config, eid):
+    """Return the statistics derived from a Scan, or None if they were not
+    computed yet"""
+    path = osp.join(derived_data_directory(config, eid), 'stats.json')
+    try:
+        with open(path) as stream:
+            return json.load(stream)
+    except IOError:
+        return None
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+# copyright 2013 CEA (Saclay, FRANCE), all rights reserved.
+# copyright 2013 LOGILAB S.A. (Paris, FRANCE), all rights reserved.
+# contact http://brainomics.cea.fr -- mailto:localizer94@cea.fr
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""cubicweb-localizer checksums of the files referenced by the database
+
+The manifest records, for each file referenced by the `filepath` attribute of
+a Scan, ExternalResource or GenomicMeasure, its SHA-256 checksum, size and
+modification time. Files are read by chunks in a pool of threads. It is
+built at the end of the import and may be checked again with::
+
+    cubicweb-ctl shell <instance> checksums.py [--verify] [--threads=8]
+
+Files whose size or modification time changed since they were recorded are
+hashed again, others are assumed unchanged. Without `--verify`, e.g. after
+an import replaced some files, their new checksums are recorded. With
+`--verify`, they are compared with the recorded checksums, which are kept as
+reference.
+"""
+
+import os
+import os.path as osp
+import sys
+import hashlib
+from multiprocessing.pool import ThreadPool
+
+from cubes.localizer.caches import JSONCache
+
+CHUNK_SIZE = 2**20
+MANIFEST = JSONCache('checksums.json')
+
+FILES_QUERIES = (
+    'Any F, D WHERE X is Scan, X filepath F, X related_study S, '
+    'S data_filepath D',
+    'Any F, D WHERE X is ExternalResource, X filepath F, X related_study S, '
+    'S data_filepath D',
+    'Any F, D WHERE X is GenomicMeasure, X filepath F, X related_study S, '
+    'S data_filepath D',
+)
+
+
+def file_checksum(path):
+    """Return the SHA-256 checksum of a file, read by chunks"""
+    checksum = hashlib.sha256()
+    with open(path, 'rb') as stream:
+        for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+            checksum.update(chunk)
+    return checksum.hexdigest()
+
+def _stat(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime
+
+def _hash(path):
+    try:
+        return path, file_checksum(path)
+    except (IOError, OSError):
+        return path, None
+
+def referenced_files(session):
+    """Return the absolute paths of the files referenced by the database"""
+    paths = set()
+    for rql in FILES_QUERIES:
+        for filepath, root in session.execute(rql):
+            paths.add(osp.join(root, filepath))
+    return paths
+
+def update_manifest(session, verify=False, threads=8):
+    """Hash new files and files whose stat changed, store the manifest and
+    return a {status: [paths]} dictionary.
+
+    Changed files are recorded with their new checksum, unless `verify` is
+    true: they are then reported as modified if their checksum differs.
+    Files which are no longer referenced or no longer exist are dropped from
+    the manifest.
+    """
+    config = session.repo.config
+    recorded = MANIFEST.load(config)
+    report = {'missing': [], 'new': [], 'unchanged': [], 'verified': [],
+              'modified': [], 'updated': []}
+    tohash, stats = [], {}
+    for path in sorted(referenced_files(session)):
+        try:
+            stats[path] = _stat(path)
+        except OSError:
+            report['missing'].append(path)
+            continue
+        entry = recorded.get(path)
+        if entry is None or stats[path] != (entry['size'], entry['mtime']):
+            tohash.append(path)
+        else:
+            report['unchanged'].append(path)
+    # the loaded document is shared with the other callers of the cache
+    manifest = dict((path, dict(entry)) for path, entry in recorded.iteritems()
+                    if path in stats)
+    pool = ThreadPool(threads)
+    try:
+        for path, checksum in pool.imap_unordered(_hash, tohash):
+            entry = manifest.get(path)
+            size, mtime = stats[path]
+            if checksum is None:
+                report['missing'].append(path)
+            elif entry is None:
+                manifest[path] = {'sha256': checksum, 'size': size,
+                                  'mtime': mtime}
+                report['new'].append(path)
+            elif entry['sha256'] == checksum:
+                # touched but identical: do not hash it again next time
+                entry['size'], entry['mtime'] = size, mtime
+                report['verified'].append(path)
+            elif verify:
+                # keep the imported checksum as reference
+                report['modified'].append(path)
+            else:
+                # replaced by an import
+                manifest[path] = {'sha256': checksum, 'size': size,
+                                  'mtime': mtime}
+                report['updated'].append(path)
+    finally:
+        pool.close()
+        pool.join()
+    MANIFEST.dump(config, manifest)
+    return report
+
+def checksum(config, path):
+    """Return the recorded checksum of a file, or None"""
+    entry = MANIFEST.load(config).get(path)
+    return entry and entry['sha256']
+
+
+###############################################################################
+### MAIN ######################################################################
+###############################################################################
+if __name__ == '__main__':
+    verify = '--verify' in sys.argv[4:]
+    threads = 8
+    for arg in sys.argv[4:]:
+        if arg.startswith('--threads='):
+            threads = int(arg[len('--threads='):])
+    report = update_manifest(session, verify, threads)
+    for status in ('modified', 'missing'):
+        for path in report[status]:
+            print status, path
+    for status, paths in sorted(report.items()):
+        print '%s: %s' % (status, len(paths))
@@ -17,3 +17,86 @@
 # with this program. If not, see <http://www.gnu.org/licenses/>.
 
 """cubicweb-localizer entity's classes"""
+
+from cubes.brainomics.entities import BrainomicsGenomicMeasure
+
+from cubes.localizer.schema import RESTRICTED_ATTRIBUTES
+
+
+def _request_data(req):
+    """Return a dictionary living as long as the request (web request) or the
+    transaction (repository session)"""
+    try:
+        return req.transaction_data
+    except AttributeError:
+        return req.data
+
+def can_read_attribute(req, etype, attr):
+    """Tell whether the user of `req` may read a restricted attribute.
+
+    Permissions of restricted attributes only depend on the user's groups, so
+    the result is computed once and memoized for the rest of the request
+    instead of being checked for each entity. Other attributes are checked
+    without memo.
+    """
+    key = (etype, attr)
+    if key not in RESTRICTED_ATTRIBUTES:
+        rdef = req.vreg.schema[etype].rdef(attr)
+        return rdef.has_perm(req, 'read')
+    memo = _request_data(req).setdefault('localizer.readable-attributes', {})
+    try:
+        return memo[key]
+    except KeyError:
+        groups = RESTRICTED_ATTRIBUTES[key]['read']
+        readable = memo[key] = bool(req.user.matching_groups(groups))
+        return readable
+
+def completed_attributes(req, eschema, skip_bytes=True, skip_pwd=True):
+    """Return the attributes to fetch when completing entities of `eschema`
+    and those left to None, as CubicWeb does.
+
+    Both lists are computed once per request, so that listings don't check the
+    read permissions of the attributes of each row; the read permissions of
+    restricted attributes come from `can_read_attribute`.
+    """
+    memo = _request_data(req).setdefault('localizer.completed-attributes', {})
+    key = (eschema.type, skip_bytes, skip_pwd)
+    try:
+        return memo[key]
+    except KeyError:
+        pass
+    fetched, unreadable = [], []
+    for rschema, attrschema in eschema.attribute_definitions():
+        attr = rschema.type
+        if attr == 'eid' or (skip_bytes and attrschema.type == 'Bytes'):
+            continue
+        if (eschema.type, attr) in RESTRICTED_ATTRIBUTES:
+            readable = can_read_attribute(req, eschema.type, attr)
+        else:
+            rdef = rschema.rdef(eschema, attrschema)
+            readable = req.user.matching_groups(rdef.get_groups('read'))
+        if not readable or (skip_pwd and attrschema.type == 'Password'):
+            unreadable.append(attr)
+        else:
+            fetched.append(attr)
+    memo[key] = fetched, unreadable
+    return fetched, unreadable
+
+
+class LocalizerGenomicMeasure(BrainomicsGenomicMeasure):
+    """Genomic measure whose attributes to complete are computed once per
+    request, see `completed_attributes`"""
+
+    def _cw_to_complete_attributes(self, skip_bytes=True, skip_pwd=True):
+        fetched, unreadable = completed_attributes(self._cw, self.e_schema,
+                                                   skip_bytes, skip_pwd)
+        for attr in unreadable:
+            self.cw_attr_cache[attr] = None
+        return iter(fetched)
+
+
+def registration_callback(vreg):
+    vreg.register_all(globals().values(), __name__,
+                      (LocalizerGenomicMeasure,))
+    vreg.register_and_replace(LocalizerGenomicMeasure,
+                              BrainomicsGenomicMeasure)
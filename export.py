@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+# copyright 2013 CEA (Saclay, FRANCE), all rights reserved.
+# copyright 2013 LOGILAB S.A. (Paris, FRANCE), all rights reserved.
+# contact http://brainomics.cea.fr -- mailto:localizer94@cea.fr
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""cubicweb-localizer export of the imported dataset in a BIDS-like layout
+
+Image files are not copied when possible: they are reflinked (copy-on-write
+clone, on file systems supporting it), hard linked or symbolically linked, in
+the order given by `--methods`; files which can not be linked are copied by a
+pool of threads. Sidecar JSON files hold the MRIData and Assessment
+attributes, which are fetched with one query for all scans. Run with::
+
+    cubicweb-ctl shell <instance> export.py <destination>
+        [--methods=reflink,hardlink,symlink] [--threads=8]
+
+Exporting again in the same destination only processes new files.
+"""
+
+import os
+import os.path as osp
+import re
+import sys
+import csv
+import json
+import errno
+import fcntl
+import shutil
+from multiprocessing.pool import ThreadPool
+
+from cubicweb.schema import META_RTYPES
+
+from cubes.localizer.caches import atomic_write
+
+# ioctl request cloning a file (linux/fs.h)
+FICLONE = 0x40049409
+DEFAULT_METHODS = ('reflink', 'hardlink', 'symlink')
+ASSESSMENT_ATTRIBUTES = ('identifier', 'protocol', 'age_for_assessment',
+                         'timepoint', 'datetime')
+
+# Scan type -> path template, relative to the destination directory
+LAYOUT = {
+    u'raw T1': 'sub-%(sub)s/anat/sub-%(sub)s_T1w.nii.gz',
+    u'normalized T1': ('derivatives/preprocessed/sub-%(sub)s/anat/'
+                       'sub-%(sub)s_space-MNI_T1w.nii.gz'),
+    u'raw fMRI': 'sub-%(sub)s/func/sub-%(sub)s_task-localizer_bold.nii.gz',
+    u'preprocessed fMRI': ('derivatives/preprocessed/sub-%(sub)s/func/'
+                           'sub-%(sub)s_task-localizer_space-MNI_desc-preproc'
+                           '_bold.nii.gz'),
+    u'boolean mask': ('derivatives/preprocessed/sub-%(sub)s/func/'
+                      'sub-%(sub)s_task-localizer_space-MNI_desc-brain'
+                      '_mask.nii.gz'),
+    u'c map': ('derivatives/contrasts/sub-%(sub)s/func/'
+               'sub-%(sub)s_task-localizer_contrast-%(contrast)s'
+               '_stat-effect_statmap.nii.gz'),
+    u't map': ('derivatives/contrasts/sub-%(sub)s/func/'
+               'sub-%(sub)s_task-localizer_contrast-%(contrast)s'
+               '_stat-t_statmap.nii.gz'),
+}
+
+
+###############################################################################
+### Files #####################################################################
+###############################################################################
+def reflink(src, dst):
+    """Clone `src` into `dst`, sharing their data blocks"""
+    with open(src, 'rb') as source:
+        with open(dst, 'wb') as dest:
+            try:
+                fcntl.ioctl(dest.fileno(), FICLONE, source.fileno())
+            except IOError:
+                os.unlink(dst)
+                raise
+
+LINK_METHODS = {
+    'reflink': reflink,
+    'hardlink': os.link,
+    'symlink': os.symlink,
+}
+
+def link(src, dst, methods):
+    """Materialize `src` as `dst` with the first working method, return
+    its name or None if the file has to be copied"""
+    for method in methods:
+        try:
+            LINK_METHODS[method](src, dst)
+            return method
+        except (IOError, OSError):
+            continue
+    return None
+
+def copy(paths):
+    """Copy a file through a temporary file, so that an interrupted export
+    does not leave a partial file taken as exported"""
+    src, dst = paths
+    def write(stream):
+        os.fchmod(stream.fileno(), os.stat(src).st_mode & 0o777)
+        with open(src, 'rb') as source:
+            shutil.copyfileobj(source, stream, 2**20)
+    atomic_write(dst, write)
+
+def _makedirs(path):
+    try:
+        os.makedirs(path)
+    except OSError as exc:
+        if exc.errno != errno.EEXIST:
+            raise
+
+def _alnum(label):
+    return re.sub('[^a-zA-Z0-9]', '', label.title())
+
+def _unique_alnum(names, label):
+    """Return the name of `label` in the layout, raising ValueError if
+    another label of `names` ({name: label}) has the same name"""
+    name = _alnum(label)
+    if names.setdefault(name, label) != label:
+        raise ValueError('%r and %r are both exported as %r'
+                         % (names[name], label, name))
+    return name
+
+def _json_value(value):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+###############################################################################
+### Export ####################################################################
+###############################################################################
+def scans_query(schema):
+    """Return the query fetching scans with their MRIData and Assessment
+    attributes, and the names of the attributes it selects"""
+    mri_attributes = [rschema.type for rschema, _ in
+                      schema['MRIData'].attribute_definitions()
+                      if rschema.type not in META_RTYPES]
+    selection = ['XT', 'XL', 'XF', 'SI', 'D']
+    restrictions = ['X is Scan', 'X type XT', 'X label XL', 'X filepath XF',
+                    'X concerns S', 'S identifier SI', 'X related_study T',
+                    'T data_filepath D', 'X has_data M', 'A generates X']
+    for prefix, var, attributes in (('M', 'M', mri_attributes),
+                                    ('A', 'A', ASSESSMENT_ATTRIBUTES)):
+        for i, attr in enumerate(attributes):
+            selection.append('%s%s' % (prefix, i))
+            restrictions.append('%s %s %s%s' % (var, attr, prefix, i))
+    rql = 'Any %s WHERE %s' % (', '.join(selection), ', '.join(restrictions))
+    return rql, mri_attributes
+
+def export_dataset(session, destination, methods=DEFAULT_METHODS,
+                   threads=8):
+    """Export the dataset in `destination`, return a {method: number of
+    files} dictionary; raise ValueError if two subjects, contrasts or files
+    would have the same name in the layout"""
+    _makedirs(destination)
+    description = osp.join(destination, 'dataset_description.json')
+    with open(description, 'w') as stream:
+        json.dump({'Name': 'Localizer', 'BIDSVersion': '1.0.0'}, stream,
+                  indent=2)
+    # names are checked before writing anything, so that distinct subjects
+    # or scans never overwrite each other's files
+    subjects, participants = {}, []
+    for identifier, gender, handedness in session.execute(
+        'Any SI, SG, SH ORDERBY SI WHERE S is Subject, S identifier SI, '
+        'S gender SG, S handedness SH'):
+        # same label as the subject directories
+        participants.append(('sub-%s' % _unique_alnum(subjects, identifier),
+                             gender, handedness))
+    rql, mri_attributes = scans_query(session.repo.schema)
+    exports = {}
+    for row in session.execute(rql):
+        scan_type, label, filepath, subject, root = row[:5]
+        if scan_type not in LAYOUT:
+            continue
+        dst = osp.join(destination, LAYOUT[scan_type] % {
+            'sub': _unique_alnum(subjects, subject),
+            'contrast': _alnum(label)})
+        src = osp.join(root, filepath)
+        if dst in exports:
+            raise ValueError('%s and %s are both exported as %s'
+                             % (exports[dst][0], src, dst))
+        exports[dst] = (src, row)
+    with open(osp.join(destination, 'participants.tsv'), 'w') as stream:
+        writer = csv.writer(stream, delimiter='\t', lineterminator='\n')
+        writer.writerow(('participant_id', 'sex', 'handedness'))
+        writer.writerows(participants)
+    report, copies = {}, []
+    for dst, (src, row) in sorted(exports.items()):
+        scan_type, label = row[:2]
+        mri = dict(zip(mri_attributes, row[5:5 + len(mri_attributes)]))
+        assessment = dict(zip(ASSESSMENT_ATTRIBUTES,
+                              row[5 + len(mri_attributes):]))
+        _makedirs(osp.dirname(dst))
+        sidecar = dict((key, _json_value(value)) for key, value
+                       in mri.items() + assessment.items()
+                       if value is not None)
+        sidecar['ScanType'] = scan_type
+        sidecar['Label'] = label
+        with open(dst[:-len('.nii.gz')] + '.json', 'w') as stream:
+            json.dump(sidecar, stream, indent=2, sort_keys=True)
+        if osp.lexists(dst):
+            method = 'existing'
+        else:
+            method = link(src, dst, methods)
+            if method is None:
+                copies.append((src, dst))
+                method = 'copy'
+        report[method] = report.get(method, 0) + 1
+    if copies:
+        pool = ThreadPool(threads)
+        try:
+            pool.map(copy, copies)
+        finally:
+            pool.close()
+            pool.join()
+    return report
+
+
+###############################################################################
+### MAIN ######################################################################
+###############################################################################
+if __name__ == '__main__':
+    destination = osp.abspath(sys.argv[4])
+    methods, threads = DEFAULT_METHODS, 8
+    for arg in sys.argv[5:]:
+        if arg.startswith('--methods='):
+            methods = tuple(arg[len('--methods='):].split(','))
+        elif arg.startswith('--threads='):
+            threads = int(arg[len('--threads='):])
+    report = export_dataset(session, destination, methods, threads)
+    for method, count in sorted(report.items()):
+        print '%s: %s' % (method, count)
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+# copyright 2013 CEA (Saclay, FRANCE), all rights reserved.
+# copyright 2013 LOGILAB S.A. (Paris, FRANCE), all rights reserved.
+# contact http://brainomics.cea.fr -- mailto:localizer94@cea.fr
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""cubicweb-localizer genotypes access
+
+The GenomicMeasure entities of a study point to the same PLINK binary file,
+each study having its own. This module memory-maps them and decodes genotypes
+of a few SNPs and subjects without reading the whole file. Decoded blocks of
+SNPs are kept in a LRU cache.
+
+The PLINK .bed format (SNP-major mode) stores, after a 3 bytes magic number,
+one record per SNP (in .bim order) of one byte per 4 subjects (in .fam order),
+each genotype being 2 bits wide, low-order bits first.
+
+Memory maps and decoded blocks are keyed on the size and modification time
+of the PLINK files, so that files replaced by an import are opened again.
+"""
+
+import os.path as osp
+import threading
+
+import numpy as np
+
+from cubes.localizer.caches import LRUCache, file_state
+
+BED_MAGIC = b'\x6c\x1b\x01'
+# number of SNPs decoded at once
+BLOCK_SNPS = 1024
+# 2 bits code -> number of copies of the first allele (A1 in .bim), -1 for
+# missing genotypes
+GENOTYPE_CODES = np.array([2, -1, 1, 0], dtype=np.int8)
+_SHIFTS = np.array([0, 2, 4, 6], dtype=np.uint8)
+
+# (PLINK files key, block index) -> decoded genotypes, 256MB at most
+DECODED_BLOCKS = LRUCache(256 * 2**20, sizeof=lambda array: array.nbytes)
+
+
+def plink_key(bed_path):
+    """Return the path and the state of the .bed, .bim and .fam files of a
+    PLINK file set"""
+    basepath = osp.splitext(bed_path)[0]
+    return (bed_path,) + tuple(tuple(file_state(basepath + extension))
+                               for extension in ('.bed', '.bim', '.fam'))
+
+
+def decode(raw, n_subjects):
+    """Decode `raw` bytes of a .bed file (one row per SNP) into a
+    (SNPs x subjects) int8 array"""
+    codes = (raw[:, :, np.newaxis] >> _SHIFTS) & 3
+    return GENOTYPE_CODES[codes.reshape(len(raw), -1)[:, :n_subjects]]
+
+
+class BedFile(object):
+    """A memory-mapped PLINK .bed file, with its .bim and .fam companions"""
+
+    def __init__(self, bed_path):
+        self.path = bed_path
+        # before reading the files, so that files replaced meanwhile are
+        # opened again
+        self.key = plink_key(bed_path)
+        basepath = osp.splitext(bed_path)[0]
+        with open(basepath + '.fam') as stream:
+            self.subjects = [line.split()[1] for line in stream if line.strip()]
+        with open(basepath + '.bim') as stream:
+            self.snps = [line.split()[1] for line in stream if line.strip()]
+        with open(bed_path, 'rb') as stream:
+            if stream.read(3) != BED_MAGIC:
+                raise ValueError('%s is not a SNP-major PLINK .bed file'
+                                 % bed_path)
+        self.n_subjects, self.n_snps = len(self.subjects), len(self.snps)
+        self.bed = np.memmap(bed_path, dtype=np.uint8, mode='r', offset=3,
+                             shape=(self.n_snps, (self.n_subjects + 3) // 4))
+        self._subject_index = dict((ident, i)
+                                   for i, ident in enumerate(self.subjects))
+        self._snp_index = dict((rs_id, i) for i, rs_id in enumerate(self.snps))
+
+    def subject_indexes(self, identifiers):
+        """Return the indexes of subjects given their identifiers"""
+        return [self._subject_index[ident] for ident in identifiers]
+
+    def snp_indexes(self, rs_ids):
+        """Return the indexes of SNPs given their rs ids"""
+        return [self._snp_index[rs_id] for rs_id in rs_ids]
+
+    def block(self, index):
+        """Return the decoded genotypes of a block of SNPs, as a
+        (SNPs x subjects) array"""
+        key = (self.key, index)
+        decoded = DECODED_BLOCKS.get(key)
+        if decoded is None:
+            start = index * BLOCK_SNPS
+            decoded = decode(self.bed[start:start + BLOCK_SNPS],
+                             self.n_subjects)
+            DECODED_BLOCKS.set(key, decoded)
+        return decoded
+
+    def genotypes(self, snps, subjects=None):
+        """Return a (subjects x SNPs) int8 array of the genotypes of SNPs
+        `snps` for subjects `subjects` (all subjects if None), both given
+        as indexes"""
+        snps = np.asarray(snps, dtype=np.intp)
+        if subjects is None:
+            subjects = np.arange(self.n_subjects)
+        subjects = np.asarray(subjects, dtype=np.intp)
+        result = np.empty((len(subjects), len(snps)), dtype=np.int8)
+        blocks = snps // BLOCK_SNPS
+        for index in np.unique(blocks):
+            columns = np.nonzero(blocks == index)[0]
+            rows = snps[columns] - index * BLOCK_SNPS
+            result[:, columns] = self.block(index)[rows][:, subjects].T
+        return result
+
+
+_BED_FILES = {}
+_BED_FILES_LOCK = threading.Lock()
+
+def bed_file(bed_path):
+    """Return the (shared) `BedFile` instance for `bed_path`, opened again
+    when the PLINK files changed"""
+    key = plink_key(bed_path)
+    with _BED_FILES_LOCK:
+        bed = _BED_FILES.get(bed_path)
+        if bed is None or bed.key != key:
+            bed = _BED_FILES[bed_path] = BedFile(bed_path)
+        return bed
+
+def study_bed_paths(session, identifiers=None):
+    """Return a {study eid: (.bed path, subject identifiers)} dictionary of
+    the studies with genomic measures, with the subjects of each study
+    (only those of `identifiers` if not None).
+
+    The filepath attribute is restricted to managers: the query fails for
+    other users.
+    """
+    rql = ('Any T, F, D, SI WHERE X is GenomicMeasure, X filepath F, '
+           'X concerns S, S identifier SI, X related_study T, '
+           'T data_filepath D')
+    args = {}
+    if identifiers is not None:
+        if not identifiers:
+            return {}
+        for index, identifier in enumerate(identifiers):
+            args['i%s' % index] = identifier
+        rql += ', S identifier IN (%s)' % ','.join(
+            '%%(i%s)s' % index for index in range(len(identifiers)))
+    studies = {}
+    for study, path, root, identifier in session.execute(rql, args):
+        bed_path, subjects = studies.setdefault(
+            study, (osp.join(root, path), set()))
+        subjects.add(identifier)
+    return dict((study, (bed_path, sorted(subjects)))
+                for study, (bed_path, subjects) in studies.items())
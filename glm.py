@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+# copyright 2013 CEA (Saclay, FRANCE), all rights reserved.
+# copyright 2013 LOGILAB S.A. (Paris, FRANCE), all rights reserved.
+# contact http://brainomics.cea.fr -- mailto:localizer94@cea.fr
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""cubicweb-localizer first-level contrasts computed on demand
+
+Fit the general linear model of the preprocessed fMRI of a subject on its
+`design_matrix.json`, over the voxels of its mask, and compute the effect
+and t maps of a contrast. The model is fitted with numpy least squares by
+chunks of voxels, subjects are spread over a pool of processes.
+
+Results are stored in the localizer cache directory, by (bold checksum, design
+matrix, contrast): a contrast is only computed once for a subject, and results
+remain valid across imports as long as the data do not change. Contrasts are
+given as weights (`1,-1`), missing weights being null, or by the name of a
+Contrast whose definition holds weights, as a list or by design matrix
+column. Run with::
+
+    cubicweb-ctl shell <instance> glm.py <contrast> [subject identifiers]
+"""
+
+import os
+import os.path as osp
+import sys
+import json
+import hashlib
+from multiprocessing import Pool
+
+import numpy as np
+
+from cubes.localizer.caches import cache_directory
+from cubes.localizer.checksums import checksum, file_checksum
+from cubes.localizer.storage import (image_header, iter_volumes, read_volume,
+                                     scan_path, write_volume)
+
+CHUNK_VOXELS = 10000
+INFO_FILE = 'contrast.json'
+MAPS = ('effect', 't')
+
+TASKS_QUERIES = {
+    'bold': ('Any SI, F, RF, D WHERE X is Scan, X type "preprocessed fMRI", '
+             'X concerns S, S identifier SI, X filepath F, '
+             'X localizer_random_access_filepath RF, X related_study T, '
+             'T data_filepath D'),
+    'mask': ('Any SI, F, RF, D WHERE X is Scan, X type "boolean mask", '
+             'X concerns S, S identifier SI, X filepath F, '
+             'X localizer_random_access_filepath RF, X related_study T, '
+             'T data_filepath D'),
+    'design': ('DISTINCT Any SI, F, D WHERE R is ExternalResource, '
+               'R name "design_matrix", X external_resources R, X concerns S, '
+               'S identifier SI, R filepath F, R related_study T, '
+               'T data_filepath D'),
+}
+
+
+###############################################################################
+### Model #####################################################################
+###############################################################################
+def load_design(path):
+    """Return the (scans x regressors) design matrix of a design_matrix.json
+    file, and the names of its columns (or None)"""
+    with open(path) as stream:
+        data = json.load(stream)
+    columns = None
+    if isinstance(data, dict):
+        columns = data.get('columns') or data.get('names')
+        data = data.get('matrix', data.get('X', data.get('data')))
+    return np.array(data, dtype=np.float64), columns
+
+def contrast_vector(contrast, columns, n_regressors):
+    """Return the weights of `contrast`, a list of weights or a {column:
+    weight} dictionary, for the `n_regressors` columns of a design matrix"""
+    weights = np.zeros(n_regressors)
+    if isinstance(contrast, dict):
+        if columns is None:
+            raise ValueError('the design matrix columns are not named')
+        for name, weight in contrast.items():
+            weights[list(columns).index(name)] = weight
+    else:
+        if len(contrast) > n_regressors:
+            raise ValueError('%s weights for %s regressors'
+                             % (len(contrast), n_regressors))
+        weights[:len(contrast)] = contrast
+    return weights
+
+def glm_contrast(timeseries, design, weights, chunk=CHUNK_VOXELS):
+    """Fit the (scans x voxels) `timeseries` on `design`, and return the
+    effects and t statistics of the contrast `weights` for each voxel, and
+    the degrees of freedom"""
+    pinv = np.linalg.pinv(design)
+    dof = design.shape[0] - np.linalg.matrix_rank(design)
+    # variance factor of the contrast, c (X'X)^-1 c'
+    factor = weights.dot(pinv).dot(pinv.T).dot(weights)
+    n_voxels = timeseries.shape[1]
+    effect = np.zeros(n_voxels, dtype=np.float32)
+    tstat = np.zeros(n_voxels, dtype=np.float32)
+    for start in range(0, n_voxels, chunk):
+        y = timeseries[:, start:start + chunk].astype(np.float64)
+        beta = pinv.dot(y)
+        residuals = y - design.dot(beta)
+        variance = (residuals ** 2).sum(axis=0) / dof * factor
+        contrast = weights.dot(beta)
+        effect[start:start + chunk] = contrast
+        valid = variance > 0
+        tstat[start:start + chunk][valid] = (contrast[valid]
+                                             / np.sqrt(variance[valid]))
+    return effect, tstat, dof
+
+
+###############################################################################
+### Workers ###################################################################
+###############################################################################
+def contrast_key(bold_checksum, design, weights):
+    key = hashlib.sha1(bold_checksum.encode('ascii'))
+    key.update(np.ascontiguousarray(design, dtype='<f8').tobytes())
+    key.update(np.ascontiguousarray(weights, dtype='<f8').tobytes())
+    return key.hexdigest()
+
+def fit_subject(task):
+    """Compute the contrast maps of a subject if they are not in cache, run
+    in a worker process; return (subject, status, results directory)"""
+    (subject, bold_path, original_path, bold_checksum, mask_path, design_path,
+     contrast, directory) = task
+    try:
+        design, columns = load_design(design_path)
+        weights = contrast_vector(contrast, columns, design.shape[1])
+        if bold_checksum is None:
+            bold_checksum = file_checksum(original_path)
+        outdir = osp.join(directory, contrast_key(bold_checksum, design,
+                                                  weights))
+        if osp.exists(osp.join(outdir, INFO_FILE)):
+            return subject, 'cached', outdir
+        mask = read_volume(mask_path) > 0
+        if not mask.any():
+            raise ValueError('empty mask %s' % mask_path)
+        timeseries = np.array([volume[mask] for volume
+                               in iter_volumes(bold_path)])
+        if timeseries.shape[0] != design.shape[0]:
+            raise ValueError('%s scans for %s design matrix rows'
+                             % (timeseries.shape[0], design.shape[0]))
+        effect, tstat, dof = glm_contrast(timeseries, design, weights)
+        if not osp.isdir(outdir):
+            os.makedirs(outdir)
+        header = image_header(mask_path)
+        for name, values in zip(MAPS, (effect, tstat)):
+            volume = np.zeros(mask.shape, dtype=np.float32)
+            volume[mask] = values
+            write_volume(osp.join(outdir, '%s.nii.gz' % name), header,
+                         volume)
+        with open(osp.join(outdir, INFO_FILE), 'w') as stream:
+            json.dump({'subject': subject, 'weights': weights.tolist(),
+                       'columns': columns, 'dof': int(dof),
+                       'bold_checksum': bold_checksum}, stream)
+        return subject, 'done', outdir
+    except Exception as exc:
+        return subject, 'error: %s' % exc, None
+
+
+###############################################################################
+### Stage #####################################################################
+###############################################################################
+def contrast_weights(session, contrast):
+    """Return the weights of `contrast`, comma separated weights or the name
+    of a Contrast"""
+    try:
+        return [float(weight) for weight in contrast.split(',')]
+    except ValueError:
+        rset = session.execute('Any D WHERE C is Contrast, C name %(n)s, '
+                               'C definition D', {'n': contrast})
+        if not rset or not rset[0][0]:
+            raise ValueError('unknown contrast %s' % contrast)
+        return json.loads(rset[0][0])
+
+def contrast_tasks(session, contrast, subjects=None):
+    """Return the tasks computing `contrast` for `subjects` (all subjects
+    if None), using three queries"""
+    config = session.repo.config
+    weights = contrast_weights(session, contrast)
+    paths = {}
+    for kind in ('bold', 'mask'):
+        for identifier, filepath, rapath, root in session.execute(
+            TASKS_QUERIES[kind]):
+            paths.setdefault(identifier, {})[kind] = (
+                osp.join(root, filepath), scan_path(root, filepath, rapath))
+    for identifier, filepath, root in session.execute(TASKS_QUERIES['design']):
+        paths.setdefault(identifier, {})['design'] = osp.join(root, filepath)
+    directory = osp.join(cache_directory(config), 'contrasts')
+    tasks = []
+    for identifier, files in sorted(paths.items()):
+        if subjects is not None and identifier not in subjects:
+            continue
+        if len(files) < 3:
+            continue
+        original, bold_path = files['bold']
+        tasks.append((identifier, bold_path, original,
+                      checksum(config, original), files['mask'][1],
+                      files['design'], weights, directory))
+    return tasks
+
+def compute_contrast(session, contrast, subjects=None, processes=None):
+    """Compute the effect and t maps of `contrast` for `subjects` (all
+    subjects if None) in a pool of processes; return a {subject identifier:
+    (status, results directory)} dictionary"""
+    tasks = contrast_tasks(session, contrast, subjects)
+    results = {}
+    pool = Pool(processes)
+    try:
+        for subject, status, outdir in pool.imap_unordered(fit_subject, tasks):
+            results[subject] = (status, outdir)
+    finally:
+        pool.close()
+        pool.join()
+    return results
+
+
+###############################################################################
+### MAIN ######################################################################
+###############################################################################
+if __name__ == '__main__':
+    from cubes.localizer.pools import importable
+    compute_contrast = importable(compute_contrast)
+    contrast = sys.argv[4]
+    subjects = set(sys.argv[5:]) or None
+    results = compute_contrast(session, contrast, subjects)
+    for subject, (status, outdir) in sorted(results.items()):
+        print subject, status, outdir or ''
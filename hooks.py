@@ -17,3 +17,224 @@
 # with this program. If not, see <http://www.gnu.org/licenses/>.
 
 """cubicweb-localizer specific hooks and operations"""
+
+from cubicweb.predicates import is_instance
+from cubicweb.server import hook
+
+from cubes.localizer import instrumentation, warmstart
+from cubes.localizer.caches import (COUNTED_FACETS, count_facet_values,
+                                    store_facet_counts)
+from cubes.localizer.rqlcache import (CACHED_ETYPES, CACHED_RTYPES,
+                                      GENERATIONS)
+from cubes.localizer.statistics import store_profiles, subject_profiles
+from cubes.localizer.summaries import (SUBJECTS_OF, refresh_subject_summaries,
+                                       subjects_of)
+
+
+###############################################################################
+### WARM START ################################################################
+###############################################################################
+class WarmStartHook(hook.Hook):
+    """preload rendered cards before the web instance serves requests"""
+    __regid__ = 'localizer.warm-start'
+    events = ('server_startup',)
+
+    def __call__(self):
+        if self.repo.config['localizer-warm-start']:
+            warmstart.preload(self.repo)
+
+
+class CardModifiedOp(hook.DataOperationMixIn, hook.Operation):
+    """forget the rendered cards in every process once the transaction is
+    committed"""
+
+    def postcommit_event(self):
+        warmstart.forget_cards(self.session.repo.config)
+
+
+class CardModifiedHook(hook.Hook):
+    """forget the rendered versions of a modified card"""
+    __regid__ = 'localizer.card-modified'
+    __select__ = hook.Hook.__select__ & is_instance('Card')
+    events = ('after_update_entity', 'after_delete_entity')
+
+    def __call__(self):
+        CardModifiedOp.get_instance(self._cw).add_data(self.entity.eid)
+
+
+###############################################################################
+### SUBJECTS SUMMARIES ########################################################
+###############################################################################
+class SubjectSummaryOp(hook.DataOperationMixIn, hook.Operation):
+    """refresh the summaries of the subjects whose related entities changed"""
+
+    def precommit_event(self):
+        eids = [eid for eid in self.get_data()
+                if not self.session.deleted_in_transaction(eid)]
+        if eids:
+            refresh_subject_summaries(self.session, eids)
+
+
+class SubjectSummaryEntityHook(hook.Hook):
+    __regid__ = 'localizer.subject-summary-entity'
+    __select__ = hook.Hook.__select__ & is_instance(*SUBJECTS_OF)
+    events = ('after_add_entity', 'after_update_entity',
+              'before_delete_entity')
+    category = 'localizer.cache'
+
+    def __call__(self):
+        op = SubjectSummaryOp.get_instance(self._cw)
+        for eid in subjects_of(self._cw, self.entity.e_schema.type,
+                               self.entity.eid):
+            op.add_data(eid)
+
+
+class SubjectSummaryRelationHook(hook.Hook):
+    __regid__ = 'localizer.subject-summary-relation'
+    __select__ = hook.Hook.__select__ & hook.match_rtype(
+        'concerns', 'concerned_by', 'related_infos', 'holds')
+    events = ('after_add_relation', 'before_delete_relation')
+    category = 'localizer.cache'
+
+    def __call__(self):
+        op = SubjectSummaryOp.get_instance(self._cw)
+        if self.rtype == 'holds':
+            for eid in subjects_of(self._cw, 'Assessment', self.eidto):
+                op.add_data(eid)
+            return
+        eid = self.eidto if self.rtype == 'concerns' else self.eidfrom
+        if self._cw.describe(eid)[0] == 'Subject':
+            op.add_data(eid)
+
+
+###############################################################################
+### COHORT STATISTICS #########################################################
+###############################################################################
+class CohortStatisticsOp(hook.DataOperationMixIn, hook.Operation):
+    """update the cohort statistics of the subjects whose demographics,
+    scores or centers changed, once the transaction is committed"""
+    profiles = None
+
+    def precommit_event(self):
+        alive = [eid for eid in self.get_data()
+                 if not self.session.deleted_in_transaction(eid)]
+        self.profiles = alive and subject_profiles(self.session, alive) or {}
+
+    def postcommit_event(self):
+        if self.profiles is not None:
+            store_profiles(self.session.repo.config, self.profiles,
+                           self.get_data())
+
+
+class CohortStatisticsEntityHook(hook.Hook):
+    __regid__ = 'localizer.cohort-statistics-entity'
+    __select__ = hook.Hook.__select__ & is_instance('Subject', 'ScoreValue',
+                                                    'Center')
+    events = ('after_add_entity', 'after_update_entity',
+              'before_delete_entity')
+    category = 'localizer.cache'
+
+    def __call__(self):
+        op = CohortStatisticsOp.get_instance(self._cw)
+        for eid in subjects_of(self._cw, self.entity.e_schema.type,
+                               self.entity.eid):
+            op.add_data(eid)
+
+
+class CohortStatisticsRelationHook(hook.Hook):
+    __regid__ = 'localizer.cohort-statistics-relation'
+    __select__ = hook.Hook.__select__ & hook.match_rtype(
+        'related_infos', 'concerned_by', 'holds')
+    events = ('after_add_relation', 'before_delete_relation')
+    category = 'localizer.cache'
+
+    def __call__(self):
+        op = CohortStatisticsOp.get_instance(self._cw)
+        if self.rtype == 'holds':
+            for eid in subjects_of(self._cw, 'Assessment', self.eidto):
+                op.add_data(eid)
+            return
+        op.add_data(self.eidfrom)
+
+
+###############################################################################
+### FACET COUNTS ##############################################################
+###############################################################################
+class FacetCountsOp(hook.DataOperationMixIn, hook.Operation):
+    """count again the facet values of the modified entity types, stored once
+    the transaction is committed"""
+    counts = None
+
+    def precommit_event(self):
+        self.counts = count_facet_values(self.session, self.get_data())
+
+    def postcommit_event(self):
+        if self.counts:
+            store_facet_counts(self.session.repo.config, self.counts)
+
+
+class FacetCountsHook(hook.Hook):
+    __regid__ = 'localizer.facet-counts'
+    __select__ = hook.Hook.__select__ & is_instance(
+        *set(etype for etype, attr in COUNTED_FACETS))
+    events = ('after_add_entity', 'after_update_entity',
+              'after_delete_entity')
+    category = 'localizer.cache'
+
+    def __call__(self):
+        etype = self.entity.e_schema.type
+        if self.event == 'after_update_entity':
+            attrs = set(attr for facet_etype, attr in COUNTED_FACETS
+                        if facet_etype == etype)
+            if not attrs.intersection(self.entity.cw_edited):
+                return
+        FacetCountsOp.get_instance(self._cw).add_data(etype)
+
+
+###############################################################################
+### RESULT SETS CACHE #########################################################
+###############################################################################
+class GenerationOp(hook.DataOperationMixIn, hook.Operation):
+    """bump the generations of the modified entity types once the
+    transaction is committed, so that no result set read before the commit
+    is cached as current"""
+
+    def postcommit_event(self):
+        GENERATIONS.bump(self.session.repo.config, *self.get_data())
+
+
+class GenerationEntityHook(hook.Hook):
+    """outdate the cached result sets involving the entity type"""
+    __regid__ = 'localizer.generation-entity'
+    __select__ = hook.Hook.__select__ & is_instance(*CACHED_ETYPES)
+    events = ('after_add_entity', 'after_update_entity',
+              'after_delete_entity')
+    category = 'localizer.cache'
+
+    def __call__(self):
+        GenerationOp.get_instance(self._cw).add_data(self.entity.e_schema.type)
+
+
+class GenerationRelationHook(hook.Hook):
+    """outdate the cached result sets involving the related entity types"""
+    __regid__ = 'localizer.generation-relation'
+    __select__ = hook.Hook.__select__ & hook.match_rtype(*CACHED_RTYPES)
+    events = ('after_add_relation', 'before_delete_relation')
+    category = 'localizer.cache'
+
+    def __call__(self):
+        op = GenerationOp.get_instance(self._cw)
+        op.add_data(self._cw.describe(self.eidfrom)[0])
+        op.add_data(self._cw.describe(self.eidto)[0])
+
+
+###############################################################################
+### INSTRUMENTATION ###########################################################
+###############################################################################
+class InstrumentationHook(hook.Hook):
+    """time the queries when the localizer-instrumentation option is set"""
+    __regid__ = 'localizer.instrumentation'
+    events = ('server_startup',)
+
+    def __call__(self):
+        instrumentation.install(self.repo)
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""Localizer importer
+
+This package only holds the metadata part of the importer, so that it can be
+imported without the imaging and genetics dependencies: nibabel (through
+`get_image_info`) is only imported when image information is first read. The
+import itself is run with::
+
+    cubicweb-ctl shell <instance> importers/localizer/__main__.py <root_dir>
+"""
+
+import os
+import json
+from datetime import datetime
+
+
+###############################################################################
+### Global Mappings ###########################################################
+###############################################################################
+GENDER_MAP = {
+    '1': u'male',
+    '2': u'female',
+    '3': u'unknown',
+}
+
+HANDEDNESS_MAP = {
+    'Right handed': u'right',
+    'Left handed': u'left',
+    'Ambidextrous': u'ambidextrous',
+    'Unknown': u'unknown',
+}
+
+SCORE_TYPES = (
+    u'language',
+    u'family',
+    u'schizophrenic',
+    u'dyslexic',
+    u'dyscalculic',
+    u'synaesthete',
+)
+
+# centers and devices of the known acquisition sites
+SITES = {
+    u'SHFJ': {
+        'center': {'name': u'SHFJ', 'department': u'Essonne',
+                   'city': u'Orsay', 'country': u'France'},
+        'device': {'name': u'3T Brucker', 'manufacturer': u'Brucker',
+                   'model': u'3T Brucker', 'hosted_by': u'SHFJ'},
+    },
+    u'Neurospin': {
+        'center': {'name': u'Neurospin', 'department': u'Essonne',
+                   'city': u'Saclay', 'country': u'France'},
+        'device': {'name': u'3T SIEMENS Trio', 'manufacturer': u'SIEMENS',
+                   'model': u'Trio', 'hosted_by': u'Neurospin'},
+    },
+}
+
+SEQ_TYPES = (
+    u'localizer_long_complex',
+    u'localizer_long_easy',
+    u'localizer_short_complex',
+    u'localizer_short_easy',
+)
+
+
+###############################################################################
+### MedicalExp entities #######################################################
+###############################################################################
+def import_subject(data_dir):
+    """Import a subject from a data dir"""
+    data, score_values = {}, []
+    info = json.load(open('%s/subject.json' % data_dir))
+    data['identifier'] = info['nip']
+    # age varies with time: it should not be stored as an attribute of Subject
+    # keep it for later use: store as an attribute of Assessment
+    age_for_assessment = info['age']
+    data['gender'] = GENDER_MAP.get(info['sex'], GENDER_MAP['3'])
+    data['handedness'] = HANDEDNESS_MAP.get(info['laterality'],
+                                            HANDEDNESS_MAP['Unknown'])
+    for score in SCORE_TYPES:
+        score_values.append({'name': score,
+                             'value': info.get(score)})
+    return data, age_for_assessment, score_values
+
+def import_study(data_dir):
+    """Import a study from a data dir; its name is read from an optional
+    study.json file, and defaults to the name of the data dir"""
+    data = {}
+    data['data_filepath'] = os.path.abspath(data_dir)
+    info = {}
+    if os.path.exists(os.path.join(data_dir, 'study.json')):
+        info = json.load(open(os.path.join(data_dir, 'study.json')))
+    data['name'] = info.get('name', unicode(os.path.basename(
+        data['data_filepath'])))
+    data['description'] = info.get('description', u'%s db' % data['name'])
+    return data
+
+def _site(data_dir):
+    info = json.load(open(os.path.join(data_dir, 'subject.json')))
+    return info['site'], SITES.get(info['site'], {})
+
+def import_center(data_dir):
+    """Import a center; sites which are not in `SITES` only have a name"""
+    site, known = _site(data_dir)
+    data = {'identifier': site, 'name': site}
+    data.update(known.get('center', {}))
+    return data
+
+def import_device(data_dir):
+    """Import a device; devices of sites which are not in `SITES` are named
+    after their site"""
+    site, known = _site(data_dir)
+    data = {'name': u'%s device' % site, 'hosted_by': site}
+    data.update(known.get('device', {}))
+    return data
+
+def import_assessment(data_dir, age_for_assessment, label, study_eid):
+    """Import an assessment"""
+    info = json.load(open('%s/subject.json' % data_dir))
+    data = {}
+    data['identifier'] = u'%s_%s' % (info['nip'], label)
+    data['protocol'] = info['protocol']
+    data['age_for_assessment'] = age_for_assessment
+    data['timepoint'] = info['date']
+    data['related_study'] = study_eid
+    if info.get('date'):
+        data['datetime'] = datetime.strptime(info['date'],
+                                             '%Y-%m-%d %H:%M:%S')
+    else:
+        data['datetime'] = None
+    return data
+
+
+# entities importers needing the imaging and genetics dependencies defer their
+# heavy imports, they may be imported with the metadata ones
+from cubes.localizer.importers.localizer.neuroimaging import (
+    import_neuroimaging, import_maps, import_mask, import_images)
+from cubes.localizer.importers.localizer.questionnaire import (
+    import_questionnaire, import_questionnaire_run)
+from cubes.localizer.importers.localizer.genomics import (
+    import_genomic_measures)
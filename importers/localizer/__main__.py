@@ -0,0 +1,468 @@
+# -*- coding: utf-8 -*-
+"""Localizer import script, run with::
+
+    cubicweb-ctl shell <instance> importers/localizer/__main__.py <root_dir>
+        [<root_dir>...] [--processes=<n>] [--inline-indexation]
+        [--throttle [--entities-per-second=200] [--files-per-second=5]
+        [--commit-every=1000] [--probe-url=<url>]] [--verify-images]
+        [--no-derived-data] [--no-similarity]
+
+Several studies may be imported in a single run, one by root directory, the
+name of a study being read from its optional study.json file (the name of its
+root directory by default). Studies which already exist are skipped, unless
+their import did not complete: the import is then aborted, so that the
+partially imported study is deleted first. Several directories of a same
+study are refused. Reference data existing in the instance (chromosomes,
+genes, SNPs, centers, devices, questionnaires...) are reused, see
+reference.py. Images of the subjects of all studies are read in a pool
+of `--processes` processes, while entities are written in the main process
+through a single store.
+
+By default the full-text index is rebuilt at the end of the import, see
+bulk.py; `--inline-indexation` maintains it while entities are created.
+`--throttle` slows down the import when it runs besides a web instance, see
+throttle.py; images are then read in the main process. `--verify-images`
+checks the integrity of the images before importing anything, and aborts if
+some are corrupted, see integrity.py. The data derived from the new scans
+and the similarity index of their c-maps are updated at the end of the
+import, unless `--no-derived-data` or `--no-similarity` is given, see
+derived.py and similarity.py.
+"""
+
+import sys
+import os
+import glob
+from itertools import imap, izip, izip_longest
+from multiprocessing import Pool
+from time import time
+
+from cubes.brainomics.importers.helpers import (import_genes,
+                                                import_chromosomes, import_snps)
+
+from cubes.localizer.importers.localizer import (
+    import_subject, import_study, import_center, import_device,
+    import_assessment, import_images, import_questionnaire,
+    import_questionnaire_run, import_genomic_measures)
+from cubes.localizer.importers.localizer.genomics import snps_in_genes
+from cubes.localizer.importers.localizer.bulk import (
+    BulkImport, finish_inline, inline_indexation)
+from cubes.localizer.importers.localizer.reference import ReferenceData
+from cubes.localizer.importers.localizer import neuroimaging
+from cubes.localizer.importers.localizer.throttle import (
+    Throttle, ThrottledStore, lower_priority)
+
+
+class StudyImport(object):
+    """A study being imported, with the reference data of its subjects"""
+
+    def __init__(self, root_dir, eid):
+        self.root_dir = root_dir
+        self.eid = eid
+        self.subjects_dir = os.path.join(root_dir, 'subjects')
+        self.genetics_dir = os.path.join(root_dir, 'genetics')
+        self.platform = None
+        self.measures = {}
+        self.questionnaire = None
+        self.questions = {}
+
+
+###############################################################################
+### Reference data ############################################################
+###############################################################################
+def import_genetics_reference(store, refs, genetics_dir, sqlgen_store):
+    """Create the chromosomes, genes and SNPs of a genetics directory which do
+    not exist yet, relate the new ones; return the genomic platform eid and
+    the basename of the PLINK files"""
+    chromosomes_path = os.path.join(genetics_dir, 'chromosomes.json')
+    bim_paths = glob.glob(os.path.join(genetics_dir, '*.bim'))
+    if not (os.path.exists(chromosomes_path) and bim_paths):
+        return None, None
+    # Chromosomes
+    chr_map = {}
+    for _chr in import_chromosomes(chromosomes_path):
+        chr_map[_chr['name']] = refs.get_or_create('Chromosome', _chr['name'],
+                                                   **_chr)
+    # Genes
+    genes = import_genes(chromosomes_path,
+                         os.path.join(genetics_dir, 'hg18.refGene.meta'))
+    gene_eids, gene_intervals = [], []
+    for gene in genes:
+        gene['chromosome'] = chr_map[gene['chromosome']]
+        gene_eids.append(refs.get_or_create(
+            'Gene', (gene['name'], gene['chromosome']), **gene))
+        gene_intervals.append((gene['chromosome'], gene['start_position'],
+                               gene['stop_position']))
+    # Flush/Commit
+    if sqlgen_store:
+        store.flush()
+    # Snps
+    snps = import_snps(chromosomes_path, bim_paths[0])
+    snp_eids, snp_positions = [], []
+    for ind, snp in enumerate(snps):
+        snp['chromosome'] = chr_map[snp['chromosome']]
+        snp_eids.append(refs.get_or_create('Snp', snp['rs_id'], **snp))
+        snp_positions.append((snp['chromosome'], snp['position']))
+        if sqlgen_store and ind and ind % 100000 == 0:
+            store.flush()
+    # Flush/Commit
+    if sqlgen_store:
+        store.flush()
+    new_snps = [refs.is_new('Snp', eid) for eid in snp_eids]
+    new_genes = [refs.is_new('Gene', eid) for eid in gene_eids]
+    print 'genetics: %s new genes, %s new snps' % (sum(new_genes),
+                                                   sum(new_snps))
+    # Platform
+    platform = refs.get_or_create('GenomicPlatform', u'Affymetrix_6.0',
+                                  identifier=u'Affymetrix_6.0')
+    for snp_eid, new in zip(snp_eids, new_snps):
+        if new:
+            store.relate(platform, 'related_snps', snp_eid)
+    # Snps in genes, pairs of existing SNPs and genes are already related
+    if any(new_snps) or any(new_genes):
+        for snp_eid, gene_eid in snps_in_genes(gene_intervals, snp_positions,
+                                               gene_eids, snp_eids):
+            if refs.is_new('Snp', snp_eid) or refs.is_new('Gene', gene_eid):
+                store.relate(snp_eid, 'in_gene', gene_eid)
+    basename = os.path.splitext(os.path.basename(bim_paths[0]))[0]
+    return platform, basename
+
+def import_questionnaire_reference(refs, data_dir):
+    """Return the eids of the questionnaire and of its questions by text,
+    create them if they do not exist yet"""
+    questionnaire, questions = import_questionnaire(data_dir)
+    identifier = questionnaire['identifier']
+    questionnaire_eid = refs.get_or_create('Questionnaire', identifier,
+                                           **questionnaire)
+    questions_id = {}
+    for question in questions:
+        question['questionnaire'] = questionnaire_eid
+        questions_id[question['text']] = refs.get_or_create(
+            'Question', (identifier, question['text']), **question)
+    return questionnaire_eid, questions_id
+
+
+###############################################################################
+### Subjects ##################################################################
+###############################################################################
+def import_subject_entities(store, refs, contrasts, study, sid, images):
+    """Create the entities of a subject, `images` being returned
+    by `import_images`"""
+    root_dir = study.root_dir
+    # Centers #############################################################
+    center = import_center(sid)
+    center_eid = refs.get_or_create('Center', center['name'], **center)
+
+    # Devices #############################################################
+    device = import_device(sid)
+    device['hosted_by'] = refs.get('Center', device['hosted_by'])
+    device_id = refs.get_or_create('Device', device['name'], **device)
+
+    # Subject #############################################################
+    subject, age_for_assessment, score_values = import_subject(sid)
+    subject = store.create_entity('Subject', **subject)
+    store.relate(subject.eid, 'related_studies', study.eid)
+    for score_val in score_values:
+        value = score_val['value']
+        if not value:
+            continue
+        def_eid = refs.get_or_create('ScoreDefinition', score_val['name'],
+                                     name=score_val['name'],
+                                     category=u'demographics',
+                                     type=u'string')
+        score_val = store.create_entity('ScoreValue', definition=def_eid,
+                                        text=value)
+        store.relate(subject.eid, 'related_infos', score_val.eid)
+
+    # Design matrix #######################################################
+    dm_res = store.create_entity('ExternalResource',
+                                 name=u'design_matrix',
+                                 related_study=study.eid,
+                                 filepath=unicode(os.path.relpath(
+                                     os.path.join(sid, 'design_matrix.json'),
+                                     start=root_dir)))
+
+    # Genetics ############################################################
+    measure = study.measures.get(subject.identifier)
+    if measure is not None:
+        gen_assessment = import_assessment(sid, age_for_assessment, 'genetics', study.eid)
+        gen_assessment = store.create_entity('Assessment', **gen_assessment)
+        store.relate(center_eid, 'holds', gen_assessment.eid)
+        store.relate(subject.eid, 'concerned_by', gen_assessment.eid)
+        measure['platform'] = study.platform
+        measure['related_study'] = study.eid
+        measure['filepath'] = os.path.relpath(measure['filepath'], start=root_dir)
+        measure = store.create_entity('GenomicMeasure', **measure)
+        store.relate(measure.eid, 'concerns', subject.eid, subjtype='GenomicMeasure')
+        store.relate(gen_assessment.eid, 'generates', measure.eid, subjtype='Assessment')
+
+    # Anat & fMRI ############################################################
+    # anat assessment
+    anat_assessment = import_assessment(sid, age_for_assessment, 'anat', study.eid)
+    anat_assessment = store.create_entity('Assessment', **anat_assessment)
+    store.relate(center_eid, 'holds', anat_assessment.eid)
+    store.relate(subject.eid, 'concerned_by', anat_assessment.eid)
+    for scan_anat, mri_anat in images['anat']:
+        mri_anat = store.create_entity('MRIData', **mri_anat)
+        scan_anat['has_data'] = mri_anat.eid
+        scan_anat['related_study'] = study.eid
+        # Get the relative filepath
+        scan_anat['filepath'] = os.path.relpath(scan_anat['filepath'], start=root_dir)
+        scan_anat = store.create_entity('Scan', **scan_anat)
+        store.relate(scan_anat.eid, 'concerns', subject.eid, subjtype='Scan')
+        store.relate(scan_anat.eid, 'uses_device', device_id)
+        store.relate(anat_assessment.eid, 'generates', scan_anat.eid, subjtype='Assessment')
+    # fmri assessment
+    fmri_assessment = import_assessment(sid, age_for_assessment, 'fmri', study.eid)
+    fmri_assessment = store.create_entity('Assessment', **fmri_assessment)
+    store.relate(center_eid, 'holds', fmri_assessment.eid)
+    store.relate(subject.eid, 'concerned_by', fmri_assessment.eid)
+    for scan_fmri, mri_fmri in images['fmri']:
+        mri_fmri = store.create_entity('MRIData', **mri_fmri)
+        scan_fmri['has_data'] = mri_fmri.eid
+        scan_fmri['related_study'] = study.eid
+        # Get the relative filepath
+        scan_fmri['filepath'] = os.path.relpath(scan_fmri['filepath'], start=root_dir)
+        scan_fmri = store.create_entity('Scan', **scan_fmri)
+        store.relate(scan_fmri.eid, 'concerns', subject.eid, subjtype='Scan')
+        store.relate(scan_fmri.eid, 'uses_device', device_id)
+        store.relate(fmri_assessment.eid, 'generates', scan_fmri.eid, subjtype='Assessment')
+
+    # c-maps & t-maps #####################################################
+    for dtype, label in (('c', 'c_maps'), ('t', 't_maps')):
+        assessment = import_assessment(sid, age_for_assessment, label, study.eid)
+        assessment = store.create_entity('Assessment', **assessment)
+        store.relate(center_eid, 'holds', assessment.eid)
+        store.relate(subject.eid, 'concerned_by', assessment.eid)
+        for scan, mri, con_res, contrast in images['maps'][dtype]:
+            mri = store.create_entity('MRIData', **mri)
+            scan['contrast'] = contrasts.eid(contrast, con_res['filepath'])
+            con_res['related_study'] = study.eid
+            con_res['filepath'] = os.path.relpath(con_res['filepath'], start=root_dir)
+            con_res = store.create_entity('ExternalResource', **con_res)
+            scan['has_data'] = mri.eid
+            scan['related_study'] = study.eid
+            # Get the relative filepath
+            scan['filepath'] = os.path.relpath(scan['filepath'], start=root_dir)
+            scan = store.create_entity('Scan', **scan)
+            store.relate(scan.eid, 'concerns', subject.eid, subjtype='Scan')
+            store.relate(scan.eid, 'uses_device', device_id)
+            store.relate(assessment.eid, 'generates', scan.eid, subjtype='Assessment')
+            store.relate(scan.eid, 'external_resources', con_res.eid)
+            store.relate(scan.eid, 'external_resources', dm_res.eid)
+
+    # mask ################################################################
+    assessment = import_assessment(sid, age_for_assessment, 'mask', study.eid)
+    assessment = store.create_entity('Assessment', **assessment)
+    store.relate(center_eid, 'holds', assessment.eid)
+    store.relate(subject.eid, 'concerned_by', assessment.eid)
+    scan, mri = images['mask']
+    mri = store.create_entity('MRIData', **mri)
+    scan['has_data'] = mri.eid
+    scan['related_study'] = study.eid
+    # Get the relative filepath
+    scan['filepath'] = os.path.relpath(scan['filepath'], start=root_dir)
+    scan = store.create_entity('Scan', **scan)
+    store.relate(scan.eid, 'concerns', subject.eid, subjtype='Scan')
+    store.relate(scan.eid, 'uses_device', device_id)
+    store.relate(assessment.eid, 'generates', scan.eid, subjtype='Assessment')
+
+    # Questionnaire run ###################################################
+    assessment = import_assessment(sid, age_for_assessment, 'questionnaire', study.eid)
+    assessment = store.create_entity('Assessment', **assessment)
+    store.relate(center_eid, 'holds', assessment.eid)
+    store.relate(subject.eid, 'concerned_by', assessment.eid)
+    run, answers = import_questionnaire_run(sid, study.questionnaire,
+                                            study.questions)
+    run['related_study'] = study.eid
+    run = store.create_entity('QuestionnaireRun', **run)
+    # Answers
+    for answer in answers:
+        answer['questionnaire_run'] = run.eid
+        answer = store.create_entity('Answer', **answer)
+    store.relate(run.eid, 'concerns', subject.eid, subjtype='QuestionnaireRun')
+    store.relate(assessment.eid, 'generates', run.eid, subjtype='Assessment')
+
+
+###############################################################################
+### MAIN ######################################################################
+###############################################################################
+if __name__ == '__main__':
+    # Create store
+    from cubicweb.dataimport import SQLGenObjectStore
+    store = SQLGenObjectStore(session)
+    sqlgen_store = True
+
+    root_dirs = [os.path.abspath(arg) for arg in sys.argv[4:]
+                 if not arg.startswith('--')]
+
+    # Command line options, --name or --name=value
+    options = dict((arg[2:].split('=', 1) + [True])[:2]
+                   for arg in sys.argv[4:] if arg.startswith('--'))
+    processes = int(options['processes']) if 'processes' in options else None
+
+    # Integrity of the images, checked before anything is imported
+    if 'verify-images' in options:
+        from cubes.localizer.caches import cache_directory
+        from cubes.localizer.integrity import (failures, results_file,
+                                               verify_tree)
+        # statuses by absolute path, relative paths being the same in each
+        # study directory
+        statuses = {}
+        for root_dir in root_dirs:
+            results_path = os.path.join(cache_directory(session.repo.config),
+                                        results_file(root_dir))
+            results = verify_tree(root_dir, results_path)
+            for relpath, status in results.iteritems():
+                statuses[os.path.join(root_dir, relpath)] = status
+        for path, status in failures(statuses):
+            print path, status
+        if failures(statuses):
+            sys.exit('%s corrupted images, nothing imported'
+                     % len(failures(statuses)))
+
+    # Full-text index is rebuilt in bulk at the end of the import, unless
+    # --inline-indexation is given
+    inline = 'inline-indexation' in options
+    start = time()
+    if inline:
+        inline_indexation(session, store)
+    else:
+        bulk = BulkImport(session, store)
+        bulk.start()
+
+    # Throttled import
+    if 'throttle' in options:
+        lower_priority()
+        # the throttle commits through the underlying store, `store` being
+        # rebound to the throttled one below
+        sql_store = store
+        def commit():
+            sql_store.flush()
+            sql_store.commit()
+        throttle = Throttle(
+            session, commit,
+            entities_per_second=float(options.get('entities-per-second', 200)),
+            files_per_second=float(options.get('files-per-second', 5)),
+            commit_every=int(options.get('commit-every', 1000)),
+            probe_url=options.get('probe-url'))
+        neuroimaging.BEFORE_IMAGE_READ = throttle.file
+        store = ThrottledStore(store, throttle)
+
+    ### Reference data ########################################################
+    refs = ReferenceData(session, store)
+    contrasts = neuroimaging.ContrastRegistry(store, refs.eids['Contrast'])
+
+    ### Studies ###############################################################
+    from cubes.localizer.caches import (end_study_imports, incomplete_studies,
+                                        start_study_imports)
+    config = session.repo.config
+    new_studies = []
+    for root_dir in root_dirs:
+        study = import_study(data_dir=root_dir)
+        if study['name'] in [data['name'] for _, data in new_studies]:
+            sys.exit('several directories of study %s, nothing imported'
+                     % study['name'])
+        if refs.get('Study', study['name']) is None:
+            new_studies.append((root_dir, study))
+        elif study['name'] in incomplete_studies(config):
+            # e.g. entities committed by a throttled import which then failed
+            sys.exit('study %s was partially imported, it should be deleted '
+                     'before being imported again' % study['name'])
+        else:
+            print 'study %s already imported, skipped' % study['name']
+    start_study_imports(config, [data['name'] for _, data in new_studies])
+    studies = []
+    for root_dir, study in new_studies:
+        study = StudyImport(root_dir, refs.get_or_create(
+            'Study', study['name'], **study))
+        print '-------->', 'study', root_dir
+        # Questionnaire
+        one_subject = glob.glob('%s/*' % study.subjects_dir)[0]
+        study.questionnaire, study.questions = \
+            import_questionnaire_reference(refs, one_subject)
+        # Genetics
+        study.platform, basename = import_genetics_reference(
+            store, refs, study.genetics_dir, sqlgen_store)
+        if basename is not None:
+            study.measures = import_genomic_measures(study.genetics_dir,
+                                                     basename)
+        studies.append(study)
+
+    # Flush/Commit
+    if sqlgen_store:
+        store.flush()
+
+    ###########################################################################
+    ### Subjects ##############################################################
+    ###########################################################################
+    # subjects of the studies in turn, their images being read concurrently
+    subjects = [subject for subjects in izip_longest(*[
+        [(study, sid) for sid in glob.glob('%s/*' % study.subjects_dir)]
+        for study in studies]) for subject in subjects if subject is not None]
+    if 'throttle' in options:
+        pool = None
+        images = imap(import_images, [sid for _, sid in subjects])
+    else:
+        pool = Pool(processes)
+        images = pool.imap(import_images, [sid for _, sid in subjects])
+    try:
+        for (study, sid), subject_images in izip(subjects, images):
+            print '-------->', sid, os.path.split(sid)[1]
+            import_subject_entities(store, refs, contrasts, study, sid,
+                                    subject_images)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    # Flush/Commit
+    if sqlgen_store:
+        store.flush()
+    store.commit()
+
+    ### Full-text index and integrity #########################################
+    if inline:
+        print finish_inline(session, start)
+    else:
+        print bulk.finish()
+
+    ### Facet counts ##########################################################
+    from cubes.localizer.caches import mark_import, refresh_facet_counts
+    mark_import(session)
+    refresh_facet_counts(session)
+
+    ### Derived data ##########################################################
+    # thumbnails and statistics of the new scans, see derived.py
+    if 'no-derived-data' not in options:
+        from cubes.localizer.importers.localizer.derived import \
+            compute_derived_data
+        report = compute_derived_data(session, processes,
+                                      low_priority='throttle' in options)
+        print 'derived data: %s' % ', '.join(
+            '%s %s' % item for item in sorted(report.items()))
+
+    ### Similarity index ######################################################
+    # vectors of the new or modified c-maps, see similarity.py
+    if 'no-similarity' not in options:
+        from cubes.localizer.similarity import update_index
+        report = update_index(session, processes)
+        print 'similarity index: %s' % ', '.join(
+            '%s %s' % item for item in sorted(report.items()))
+
+    ### Subjects summaries ####################################################
+    from cubes.localizer.summaries import refresh_subject_summaries
+    refresh_subject_summaries(session)
+    session.commit()
+
+    ### Cohort statistics #####################################################
+    from cubes.localizer.statistics import refresh_cohort_statistics
+    refresh_cohort_statistics(session)
+
+    ### Checksums #############################################################
+    from cubes.localizer.checksums import update_manifest
+    report = update_manifest(session)
+    print 'checksums: %s new, %s updated, %s missing files' % (
+        len(report['new']), len(report['updated']), len(report['missing']))
+
+    ### End ###################################################################
+    end_study_imports(config, [data['name'] for _, data in new_studies])
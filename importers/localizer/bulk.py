@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""Localizer importer: bulk mode
+
+During a bulk import, the full-text index is not maintained. Once data are
+committed, the full-text index of the imported entity types is rebuilt and
+integrity is checked with a few set-based queries. Durations of each step are
+recorded in the localizer cache directory, so that successive imports (with
+or without `--inline-indexation`, which indexes entities as they are
+inserted) can be compared. Hooks are not concerned: the SQL generating store
+of the importer never runs them.
+"""
+
+from time import time
+
+from cubes.localizer.caches import JSONCache
+
+# entity types created by the importer
+IMPORTED_ETYPES = (
+    'Study', 'Center', 'Device', 'Subject', 'ScoreDefinition', 'ScoreValue',
+    'Assessment', 'Contrast', 'Scan', 'MRIData', 'ExternalResource',
+    'Questionnaire', 'Question', 'QuestionnaireRun', 'Answer', 'Chromosome',
+    'Gene', 'Snp', 'GenomicPlatform', 'GenomicMeasure',
+)
+
+IMPORT_TIMINGS = JSONCache('import-timings.json')
+
+
+def _sources(session, store=None):
+    sources = [session.repo.system_source]
+    # stores generating SQL have their own source wrapper
+    if getattr(store, 'source', None) is not None:
+        sources.append(store.source)
+    return sources
+
+def check_integrity(session):
+    """Run the repository integrity checks, each one being a few queries for
+    all entities, without fixing anything"""
+    from cubicweb.server import checkintegrity
+    schema, eids = session.repo.schema, {}
+    for check in (checkintegrity.check_entities,
+                  checkintegrity.check_relations,
+                  checkintegrity.check_mandatory_relations,
+                  checkintegrity.check_mandatory_attributes):
+        check(schema, session, eids, fix=False)
+
+def inline_indexation(session, store=None):
+    """Index the entities as they are inserted, including by stores
+    generating SQL whose source wrapper does not by default"""
+    for source in _sources(session, store):
+        source.do_fti = True
+
+
+class BulkImport(object):
+    """Switch off the full-text indexation until `finish()` is called, then
+    rebuild the index and check integrity"""
+
+    def __init__(self, session, store=None):
+        self.session = session
+        self.sources = _sources(session, store)
+        self.do_fti = [source.do_fti for source in self.sources]
+        self.timings = {}
+        self.started = time()
+
+    def start(self):
+        for source in self.sources:
+            source.do_fti = False
+
+    def indexable_etypes(self):
+        schema = self.session.repo.schema
+        return [etype for etype in IMPORTED_ETYPES
+                if etype in schema and schema[etype].indexable_attributes()]
+
+    def rebuild_fulltext_index(self):
+        """Rebuild the full-text index of the imported entity types"""
+        from cubicweb.server.checkintegrity import reindex_entities
+        reindex_entities(self.session.repo.schema, self.session,
+                         withpb=False, etypes=self.indexable_etypes())
+        self.session.commit()
+
+    def finish(self):
+        """Restore indexation, then run the bulk passes and record their
+        durations"""
+        self.timings['import'] = time() - self.started
+        for source, do_fti in zip(self.sources, self.do_fti):
+            source.do_fti = do_fti
+        start = time()
+        self.rebuild_fulltext_index()
+        self.timings['indexation'] = time() - start
+        start = time()
+        check_integrity(self.session)
+        self.timings['integrity'] = time() - start
+        return record_timings(self.session, 'bulk', self.timings)
+
+
+def finish_inline(session, started):
+    """Check integrity after an import indexed inline, and record the
+    durations of the same steps as `BulkImport.finish` but the indexation,
+    which is part of the import"""
+    timings = {'import': time() - started}
+    start = time()
+    check_integrity(session)
+    timings['integrity'] = time() - start
+    return record_timings(session, 'inline', timings)
+
+def record_timings(session, mode, timings):
+    """Record the durations of an import in `mode` ('bulk' or 'inline') and
+    return a report comparing them with the last import in the other mode"""
+    config = session.repo.config
+    timings['total'] = sum(timings.values())
+    history = IMPORT_TIMINGS.load(config)
+    history[mode] = timings
+    IMPORT_TIMINGS.dump(config, history)
+    lines = ['%s import: %s' % (mode, ', '.join(
+        '%s %.1fs' % item for item in sorted(timings.items())))]
+    other = history.get('inline' if mode == 'bulk' else 'bulk')
+    if other:
+        saved = other['total'] - timings['total']
+        if mode == 'inline':
+            saved = -saved
+        lines.append('time saved by the bulk mode: %.1fs' % saved)
+    return '\n'.join(lines)
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""Localizer importer: data derived from the imported scans
+
+For each Scan, compute in a pool of processes:
+
+* a PNG thumbnail of the middle axial slice (first volume for 4D images),
+* an intensity histogram and summary statistics, restricted to the subject's
+  mask for c/t maps.
+
+Results are stored in the localizer cache directory, where the Scan primary
+view reads them, so that displaying a scan never loads its image. Scans whose
+file did not change since the last run are skipped. Run after the import
+with::
+
+    cubicweb-ctl shell <instance> importers/localizer/derived.py [processes]
+        [--low-priority]
+
+With `--low-priority`, workers run with the lowest CPU and I/O priorities, so
+that a web instance running on the same host stays responsive.
+"""
+
+import os
+import os.path as osp
+import sys
+import json
+import zlib
+import struct
+from multiprocessing import Pool
+
+from cubes.localizer.caches import (atomic_write, derived_data_directory,
+                                    file_state)
+from cubes.localizer.storage import CHUNKED_SUFFIX, read_volume, scan_path
+from cubes.localizer.importers.localizer.throttle import lower_priority
+
+MAP_TYPES = (u'c map', u't map')
+HISTOGRAM_BINS = 50
+THUMBNAIL_FILE = 'thumbnail.png'
+STATS_FILE = 'stats.json'
+
+
+###############################################################################
+### Images ####################################################################
+###############################################################################
+def png_bytes(pixels):
+    """Encode a 2D uint8 array as a grayscale PNG image"""
+    height, width = pixels.shape
+    raw = b''.join(b'\x00' + pixels[row].tobytes() for row in range(height))
+    def chunk(tag, data):
+        crc = zlib.crc32(tag + data) & 0xffffffff
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', crc)
+    header = struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0)
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header)
+            + chunk(b'IDAT', zlib.compress(raw, 9)) + chunk(b'IEND', b''))
+
+def thumbnail(volume):
+    """Return the middle axial slice of a 3D volume as uint8 pixels, with
+    intensities scaled between the 1st and 99th percentiles"""
+    import numpy as np
+    section = np.rot90(np.nan_to_num(volume[:, :, volume.shape[2] // 2]))
+    low, high = np.percentile(section, (1, 99))
+    if high <= low:
+        return np.zeros(section.shape, dtype=np.uint8)
+    scaled = (np.clip(section, low, high) - low) * (255. / (high - low))
+    return scaled.astype(np.uint8)
+
+def summary(values):
+    """Return the histogram and summary statistics of the 1D array `values`"""
+    import numpy as np
+    values = values[np.isfinite(values)]
+    if not values.size:
+        return {'nvoxels': 0}
+    counts, edges = np.histogram(values, bins=HISTOGRAM_BINS)
+    p5, p50, p95 = np.percentile(values, (5, 50, 95))
+    return {'nvoxels': int(values.size),
+            'mean': float(values.mean()),
+            'std': float(values.std()),
+            'min': float(values.min()),
+            'max': float(values.max()),
+            'p5': float(p5), 'median': float(p50), 'p95': float(p95),
+            'histogram': {'counts': counts.tolist(),
+                          'edges': edges.tolist()}}
+
+
+###############################################################################
+### Workers ###################################################################
+###############################################################################
+def derive(task):
+    """Compute the derived data of a scan, run in a worker process.
+
+    `task` is a (eid, scan type, image path, mask path, output directory)
+    tuple, the mask path is None for scans other than c/t maps.
+    """
+    eid, scan_type, path, mask_path, outdir = task
+    try:
+        import numpy as np
+        import nibabel as nb
+        state = {'image': file_state(path),
+                 'mask': mask_path and file_state(mask_path)}
+        stats_path = osp.join(outdir, STATS_FILE)
+        if osp.exists(stats_path):
+            with open(stats_path) as stream:
+                if json.load(stream).get('state') == state:
+                    return eid, 'skipped'
+        if path.endswith(('.nii', CHUNKED_SUFFIX)):
+            # random access version, only the first volume is read
+            volume = read_volume(path, 0)
+        else:
+            image = nb.load(path)
+            if len(image.shape) > 3:
+                volume = np.asarray(image.dataobj[..., 0], dtype=np.float32)
+            else:
+                volume = np.asarray(image.dataobj, dtype=np.float32)
+        if mask_path is not None:
+            mask = np.asarray(nb.load(mask_path).dataobj) > 0
+            values = volume[mask]
+        else:
+            values = volume[volume != 0]
+        data = summary(values)
+        data['type'] = scan_type
+        data['state'] = state
+        if not osp.isdir(outdir):
+            os.makedirs(outdir)
+        pixels = png_bytes(thumbnail(volume))
+        atomic_write(osp.join(outdir, THUMBNAIL_FILE),
+                     lambda stream: stream.write(pixels))
+        # written last: an existing stats file means the scan is done
+        atomic_write(stats_path, lambda stream: json.dump(data, stream))
+        return eid, 'done'
+    except Exception as exc:
+        return eid, 'error: %s' % exc
+
+
+###############################################################################
+### Stage #####################################################################
+###############################################################################
+def derived_data_tasks(session):
+    """Yield the tasks of all Scans, using two queries"""
+    config = session.repo.config
+    masks = {}
+    for subject_eid, path, root in session.execute(
+        'Any S, F, D WHERE X is Scan, X type "boolean mask", X filepath F, '
+        'X concerns S, X related_study T, T data_filepath D'):
+        masks[subject_eid] = osp.join(root, path)
+    for eid, scan_type, path, rapath, root, subject_eid in session.execute(
+        'Any X, XT, F, RF, D, S WHERE X is Scan, X type XT, X filepath F, '
+        'X localizer_random_access_filepath RF, X concerns S, '
+        'X related_study T, T data_filepath D'):
+        mask_path = masks.get(subject_eid) if scan_type in MAP_TYPES else None
+        yield (eid, scan_type, scan_path(root, path, rapath), mask_path,
+               derived_data_directory(config, eid))
+
+def compute_derived_data(session, processes=None, low_priority=False):
+    """Compute the derived data of all Scans in a pool of processes, return
+    a {status: count} dictionary"""
+    tasks = list(derived_data_tasks(session))
+    report = {}
+    pool = Pool(processes, initializer=lower_priority if low_priority else None)
+    try:
+        for eid, status in pool.imap_unordered(derive, tasks, chunksize=4):
+            if status.startswith('error'):
+                print 'scan', eid, status
+                status = 'error'
+            report[status] = report.get(status, 0) + 1
+    finally:
+        pool.close()
+        pool.join()
+    return report
+
+
+###############################################################################
+### MAIN ######################################################################
+###############################################################################
+if __name__ == '__main__':
+    from cubes.localizer.pools import importable
+    compute_derived_data = importable(compute_derived_data)
+    args = [arg for arg in sys.argv[4:] if not arg.startswith('--')]
+    processes = int(args[0]) if args else None
+    report = compute_derived_data(session, processes,
+                                  '--low-priority' in sys.argv[4:])
+    for status, count in sorted(report.items()):
+        print '%s: %s' % (status, count)
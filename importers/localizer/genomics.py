@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""Localizer importer: genomics entities"""
+
+import os
+import csv
+
+
+###############################################################################
+### Genomics entities #########################################################
+###############################################################################
+# XXX These functions may be pushed in helpers, as they may be more general
+def import_genomic_measures(measure_path, genetics_basename):
+    """Import a genomic measures"""
+    g_measures = {}
+    # path to BED / BIM / FAM files
+    bed_path = os.path.join(measure_path, genetics_basename + '.bed')
+    bim_path = os.path.join(measure_path, genetics_basename + '.bim')
+    fam_path = os.path.join(measure_path, genetics_basename + '.fam')
+    # read FAM file as CSV file
+    fam_file = open(fam_path, 'rU')
+    fam_reader = csv.reader(fam_file, delimiter=' ')
+    # one subject per line
+    for row in fam_reader:
+        subject_id = row[1]
+        genomic_measure = {}
+        genomic_measure['identifier'] = u'genomic_measure_%s' % subject_id
+        genomic_measure['type'] = u'SNP'
+        genomic_measure['format'] = u'plink'
+        genomic_measure['filepath'] = unicode(bed_path)
+        genomic_measure['chip_serialnum'] = None
+        genomic_measure['completed'] = True
+        genomic_measure['valid'] = True
+        genomic_measure['platform'] = None
+        g_measures[subject_id] = genomic_measure
+    return g_measures
+
+def assign_snps_to_genes(genes, snps, chunksize=100000):
+    """Return the (SNP index, gene index) pairs of SNPs located in genes.
+
+    `genes` is a sequence of (chromosome, start, stop) and `snps` a sequence
+    of (chromosome, position). For each chromosome, genes are sorted by start
+    position: the genes which may contain a SNP are those starting between
+    `position - longest gene length` and `position`, found with
+    `searchsorted`; their stop positions are then checked, all SNPs of a
+    chunk at once.
+    """
+    import numpy as np
+    gene_chrs = np.array([gene[0] for gene in genes])
+    gene_starts = np.array([gene[1] for gene in genes], dtype=np.int64)
+    gene_stops = np.array([gene[2] for gene in genes], dtype=np.int64)
+    snp_chrs = np.array([snp[0] for snp in snps])
+    snp_positions = np.array([snp[1] for snp in snps], dtype=np.int64)
+    pairs_snps, pairs_genes = [], []
+    for chromosome in np.intersect1d(np.unique(gene_chrs), np.unique(snp_chrs)):
+        gindexes = np.nonzero(gene_chrs == chromosome)[0]
+        order = np.argsort(gene_starts[gindexes], kind='mergesort')
+        gindexes = gindexes[order]
+        starts, stops = gene_starts[gindexes], gene_stops[gindexes]
+        longest = (stops - starts).max()
+        sindexes = np.nonzero(snp_chrs == chromosome)[0]
+        for offset in xrange(0, len(sindexes), chunksize):
+            chunk = sindexes[offset:offset + chunksize]
+            positions = snp_positions[chunk]
+            first = np.searchsorted(starts, positions - longest, 'left')
+            last = np.searchsorted(starts, positions, 'right')
+            counts = last - first
+            # candidates (snp, gene) pairs, genes indexed in the sorted arrays
+            candidate_snps = np.repeat(np.arange(len(chunk)), counts)
+            candidate_genes = (np.arange(counts.sum())
+                               - np.repeat(np.cumsum(counts) - counts, counts)
+                               + np.repeat(first, counts))
+            inside = stops[candidate_genes] >= positions[candidate_snps]
+            pairs_snps.append(chunk[candidate_snps[inside]])
+            pairs_genes.append(gindexes[candidate_genes[inside]])
+    if not pairs_snps:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+    return np.concatenate(pairs_snps), np.concatenate(pairs_genes)
+
+def snps_in_genes(genes, snps, gene_eids, snp_eids):
+    """Return the sorted distinct (SNP eid, gene eid) pairs of SNPs located in
+    genes; the records of a gene sharing its eid (alternative transcripts on
+    one chromosome) give a single pair"""
+    snp_indexes, gene_indexes = assign_snps_to_genes(genes, snps)
+    return sorted(set((snp_eids[snp_index], gene_eids[gene_index])
+                      for snp_index, gene_index in zip(snp_indexes,
+                                                       gene_indexes)))
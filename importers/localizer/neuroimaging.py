@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""Localizer importer: neuroimaging entities"""
+
+import os
+import glob
+import json
+
+from cubes.localizer.importers.localizer import SEQ_TYPES
+
+
+# callable called before an image is read, see throttle.py
+BEFORE_IMAGE_READ = None
+
+def get_image_info(image_path, get_tr=True):
+    """Return the MRIData attributes read from an image header.
+
+    The brainomics helpers are imported here as they import nibabel, numpy
+    and scipy, which are not needed by the metadata parts of the importer.
+    """
+    from cubes.brainomics.importers.helpers import get_image_info
+    if BEFORE_IMAGE_READ is not None:
+        BEFORE_IMAGE_READ()
+    return get_image_info(image_path, get_tr=get_tr)
+
+
+###############################################################################
+### Neuroimaging entities #####################################################
+###############################################################################
+def import_neuroimaging(data_dir, dtype='anat', norm_prep=False):
+    """Import a neuorimaging scan"""
+    scan_data, mri_data = {}, {}
+    info = json.load(open('%s/subject.json' % data_dir))
+    # Label and id
+    if dtype == 'anat':
+        mri_data['sequence'] = u'T1'
+        scan_data['identifier'] = u'%s_anat' % info['exam']
+        scan_data['label'] = u'anatomy' if norm_prep else u'raw anatomy'
+        scan_data['type'] = u'normalized T1' if norm_prep else u'raw T1'
+        if norm_prep:
+            scan_data['filepath'] = os.path.join(data_dir, 'anat', 'anat_defaced.nii.gz')
+        else:
+            scan_data['filepath'] = os.path.join(data_dir, 'anat', 'raw_anat_defaced.nii.gz')
+    else:
+        mri_data['sequence'] = u'EPI'
+        scan_data['identifier'] = u'%s_fmri' % info['exam'] if norm_prep  \
+                                  else u'%s_raw_fmri' % info['exam']
+        scan_data['label'] = u'bold' if norm_prep else u'raw bold'
+        scan_data['type'] = u'preprocessed fMRI' if norm_prep else u'raw fMRI'
+        if norm_prep:
+            scan_data['filepath'] = os.path.join(data_dir, 'fmri', 'bold.nii.gz')
+        else:
+            scan_data['filepath'] = os.path.join(data_dir, 'fmri', 'raw_bold.nii.gz')
+    # Data properties
+    scan_data['format'] = u'nii.gz'
+    scan_data['timepoint'] = info['date']
+    scan_data['completed'] = True
+    scan_data['valid'] = True
+    # Description
+    if dtype == 'anat':
+        scan_data['description'] = info['anatomy']
+    else:
+        scan_data['description'] = (
+            u'epi_problem=%(epi_problem)s '
+            'sound_problem=%(sound_problem)s '
+            'video_problem=%(video_problem)s '
+            'motor_error=%(motor_error)s' % info)
+        for seq_type in SEQ_TYPES:
+            if info[seq_type]:
+                scan_data['description'] += u' %s' % seq_type
+    # Update mri data
+    mri_data.update(get_image_info(scan_data['filepath']))
+    return scan_data, mri_data
+
+class ContrastRegistry(object):
+    """Contrasts by name: a Contrast entity is created for the first map of
+    each contrast, from its definition in `contrasts/<name>.json`, and reused
+    for the maps of the other subjects and studies; `eids` holds the eids
+    of the existing contrasts by name"""
+
+    def __init__(self, store, eids=None):
+        self.store = store
+        self.eids = {} if eids is None else eids
+
+    def eid(self, name, definition_path):
+        """Return the eid of the contrast `name`, create it if needed"""
+        if name not in self.eids:
+            definition = None
+            if os.path.exists(definition_path):
+                with open(definition_path) as stream:
+                    definition = unicode(json.dumps(json.load(stream),
+                                                    sort_keys=True))
+            self.eids[name] = self.store.create_entity(
+                'Contrast', name=name, definition=definition).eid
+        return self.eids[name]
+
+
+def import_maps(data_dir, dtype='c'):
+    """Import c/t maps, yield (scan, mri data, contrast definition resource,
+    contrast name)"""
+    info = json.load(open('%s/subject.json' % data_dir))
+    base_path = os.path.join(data_dir, '%s_maps' % dtype)
+    for img_path in glob.iglob(os.path.join(base_path, '*.nii.gz')):
+        scan_data, mri_data = {}, {}
+        name = unicode(os.path.split(img_path)[1].split('.nii.gz')[0])
+        scan_data['identifier'] = u'%s_%s_map_%s' % (info['exam'], dtype, name)
+        scan_data['label'] = unicode(os.path.split(img_path)[1].split(
+            '.nii.gz')[0].replace('_', ' '))
+        scan_data['format'] = u'nii.gz'
+        scan_data['type'] = u'%s map' % dtype
+        scan_data['filepath'] = img_path
+        scan_data['timepoint'] = info['date']
+        scan_data['completed'] = True
+        scan_data['valid'] = True
+        # Mri data
+        mri_data['sequence'] = None
+        mri_data.update(get_image_info(scan_data['filepath'], get_tr=False))
+        ext_resource = {}
+        ext_resource['name'] = u'contrast definition'
+        ext_resource['filepath'] = unicode(os.path.join(data_dir,
+                                                        'contrasts',
+                                                        '%s.json' % name))
+        yield scan_data, mri_data, ext_resource, name
+
+def import_mask(data_dir):
+    """Import a mask"""
+    scan_data, mri_data = {}, {}
+    info = json.load(open('%s/subject.json' % data_dir))
+    scan_data['identifier'] = u'%s_mask' % info['exam']
+    scan_data['label'] = u'mask'
+    scan_data['format'] = u'nii.gz'
+    scan_data['type'] = u'boolean mask'
+    scan_data['filepath'] = unicode(os.path.join(data_dir, 'mask.nii.gz'))
+    scan_data['timepoint'] = info['date']
+    scan_data['completed'] = True
+    scan_data['valid'] = True
+    mri_data['sequence'] = None
+    mri_data.update(get_image_info(scan_data['filepath']))
+    return scan_data, mri_data
+
+def import_images(data_dir):
+    """Import the scans and MRI data of a subject, reading only the images
+    headers; run in a pool of processes by the importer"""
+    return {'anat': [import_neuroimaging(data_dir, 'anat', normalized)
+                     for normalized in (False, True)],
+            'fmri': [import_neuroimaging(data_dir, 'fmri', preprocessed)
+                     for preprocessed in (False, True)],
+            'maps': dict((dtype, list(import_maps(data_dir, dtype)))
+                         for dtype in ('c', 't')),
+            'mask': import_mask(data_dir)}
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""Localizer importer: questionnaire entities"""
+
+import os
+import json
+from datetime import datetime
+
+
+###############################################################################
+### Questionnaire entities ####################################################
+###############################################################################
+def import_questionnaire(data_dir):
+    """Import a questionnaire and its questions"""
+    questionnaire = {}
+    questionnaire['name'] = u'localizer questionnaire'
+    questionnaire['identifier'] = u'localizer_questionnaire'
+    questionnaire['type'] = u'behavioural'
+    questionnaire['version'] = u'1.0'
+    questionnaire['language'] = u'French'
+    behave = json.load(open('%s/behavioural.json' % data_dir))
+    del behave['date']
+    # Questions
+    questions = []
+    values = [behave[k] for k in sorted(behave.keys())]
+    for i, (val, item) in enumerate(zip(values, sorted(behave.keys()))):
+        question = {}
+        question['identifier'] = u'localizer_%s' % i
+        question['position'] = i
+        question['text'] = unicode(item)
+        question['type'] = u'boolean' if isinstance(val, bool) else u'float'
+        question['possible_answers'] = None
+        questions.append(question)
+    return questionnaire, questions
+
+def import_questionnaire_run(data_dir, questionnaire_id, questions_id):
+    """Import a questionnaire run"""
+    run = {}
+    behave = json.load(open('%s/behavioural.json' % data_dir))
+    sid = os.path.split(data_dir)[1]
+    run['identifier'] = u'localizer_questionnaire_%s' % (sid)
+    run['user_ident'] = u'subject'
+    if behave.get('date'):
+        run['datetime'] = datetime.strptime(
+            behave['date'],
+            '%Y-%m-%d %H:%M:%S')
+    else:
+        run['datetime'] = None
+    del behave['date']
+    del behave['nip']
+    run['iteration'] = 1
+    run['completed'] = True
+    run['valid'] = True
+    run['instance_of'] = questionnaire_id
+    # Answers
+    answers = []
+    values = [behave[k] for k in sorted(behave.keys())]
+    for i, (val, item) in enumerate(zip(values, sorted(behave.keys()))):
+        answer = {}
+        # XXX: handle str answers
+        if not isinstance(val, (str, unicode)):
+            answer['value'] = float(val) if val else None
+            answer['datetime'] = run['datetime']
+            answer['question'] = questions_id[item]
+            answers.append(answer)
+    return run, answers
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""Localizer importer: reference data shared by the studies
+
+Chromosomes, genes, SNPs, centers, devices, questionnaires, score
+definitions, genomic platforms and contrasts are shared by all the studies
+of an instance. The existing ones are looked up once, with one query by
+entity type, and are reused by the importer instead of being created again.
+"""
+
+# natural key of the reference entity types: the query returning (eid, key
+# attributes...) of the existing entities
+REFERENCE_QUERIES = {
+    'Study': 'Any X, N WHERE X is Study, X name N',
+    'Chromosome': 'Any X, N WHERE X is Chromosome, X name N',
+    'Gene': 'Any X, N, C WHERE X is Gene, X name N, X chromosome C',
+    'Snp': 'Any X, R WHERE X is Snp, X rs_id R',
+    'Center': 'Any X, N WHERE X is Center, X name N',
+    'Device': 'Any X, N WHERE X is Device, X name N',
+    'Questionnaire': 'Any X, I WHERE X is Questionnaire, X identifier I',
+    'Question': 'Any X, QI, T WHERE X is Question, X questionnaire Q, '
+                'Q identifier QI, X text T',
+    'ScoreDefinition': 'Any X, N WHERE X is ScoreDefinition, X name N',
+    'GenomicPlatform': 'Any X, I WHERE X is GenomicPlatform, X identifier I',
+    'Contrast': 'Any X, N WHERE X is Contrast, X name N',
+}
+
+
+class ReferenceData(object):
+    """Eids of the reference entities by natural key, for the entities
+    existing before the import and those created by it"""
+
+    def __init__(self, session, store):
+        self.store = store
+        self.eids = {}
+        self.created = dict((etype, set()) for etype in REFERENCE_QUERIES)
+        for etype, rql in REFERENCE_QUERIES.iteritems():
+            eids = self.eids[etype] = {}
+            for row in session.execute(rql):
+                eids[len(row) > 2 and tuple(row[1:]) or row[1]] = row[0]
+
+    def get(self, etype, key):
+        """Return the eid of an existing entity, or None"""
+        return self.eids[etype].get(key)
+
+    def get_or_create(self, etype, key, **attributes):
+        """Return the eid of the entity of natural key `key`, create it with
+        `attributes` if it does not exist"""
+        eid = self.eids[etype].get(key)
+        if eid is None:
+            eid = self.store.create_entity(etype, **attributes).eid
+            self.eids[etype][key] = eid
+            self.created[etype].add(eid)
+        return eid
+
+    def is_new(self, etype, eid):
+        """Return True if the entity was created by this import"""
+        return eid in self.created[etype]
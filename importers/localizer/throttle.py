@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""Localizer importer: throttled mode
+
+When importing into an instance serving users, the import is slowed down so
+that the web instance stays responsive:
+
+* entities creation and image files reading are capped to a number per
+  second;
+* data are committed every few entities, so that transactions stay short;
+* caps are divided by a load factor, computed from the local load average
+  and, with PostgreSQL, the number of other active queries;
+* the importer and its workers run with the lowest CPU and I/O priorities.
+
+Rates, load factor and, if a probe url is given, the latency of the web
+instance are printed regularly, so that the effect of the import can be
+observed.
+"""
+
+import os
+import subprocess
+import urllib2
+from time import time, sleep
+from multiprocessing import cpu_count
+
+
+def lower_priority(niceness=10):
+    """Lower the CPU priority of the current process and put it in the idle
+    I/O scheduling class"""
+    os.nice(niceness)
+    try:
+        subprocess.call(['ionice', '-c', '3', '-p', str(os.getpid())])
+    except OSError:
+        # ionice (util-linux) is not available
+        pass
+
+
+class Throttle(object):
+    """Cap the rate of entities creation and files reading"""
+    # seconds between two load checks
+    interval = 10
+
+    def __init__(self, session, commit, entities_per_second=200,
+                 files_per_second=5, commit_every=1000, max_active_queries=4,
+                 probe_url=None):
+        self.session = session
+        self.commit = commit
+        self.rates = {'entities': float(entities_per_second),
+                      'files': float(files_per_second)}
+        self.commit_every = commit_every
+        self.max_active_queries = max_active_queries
+        self.probe_url = probe_url
+        self.factor = 1.
+        self.uncommitted = 0
+        self._start_window()
+
+    def _start_window(self):
+        self.window_start = time()
+        self.counts = {'entities': 0, 'files': 0}
+
+    def _wait(self, kind):
+        if time() - self.window_start > self.interval:
+            self.adapt()
+        # counted in the window started by `adapt`
+        self.counts[kind] += 1
+        rate = self.rates[kind] / self.factor
+        if rate > 0:
+            delay = self.counts[kind] / rate - (time() - self.window_start)
+            if delay > 0:
+                sleep(delay)
+
+    def entity(self):
+        """To be called before an entity is created"""
+        self._wait('entities')
+        self.uncommitted += 1
+        if self.uncommitted >= self.commit_every:
+            self.commit()
+            self.uncommitted = 0
+
+    def file(self):
+        """To be called before an image file is read"""
+        self._wait('files')
+
+    def active_queries(self):
+        """Return the number of active queries of other connections, or None
+        if it can not be known"""
+        source = self.session.repo.system_source
+        if source.dbdriver != 'postgres':
+            return None
+        cursor = self.session.system_sql(
+            "SELECT count(*) FROM pg_stat_activity "
+            "WHERE state = 'active' AND pid <> pg_backend_pid()")
+        return cursor.fetchone()[0]
+
+    def probe_latency(self):
+        """Return the time to get the probe url, in seconds"""
+        start = time()
+        try:
+            urllib2.urlopen(self.probe_url, timeout=30).read()
+        except Exception:
+            return None
+        return time() - start
+
+    def adapt(self):
+        """Compute the load factor and report the current rates"""
+        elapsed = time() - self.window_start
+        load = os.getloadavg()[0] / cpu_count()
+        active = self.active_queries()
+        factors = [1., load]
+        if active is not None:
+            factors.append(float(active) / self.max_active_queries)
+        self.factor = max(factors)
+        report = ['%.1f entities/s, %.1f files/s' % (
+            self.counts['entities'] / elapsed, self.counts['files'] / elapsed),
+                  'load %.2f' % load]
+        if active is not None:
+            report.append('%s active queries' % active)
+        if self.probe_url:
+            latency = self.probe_latency()
+            report.append('web latency %s' % (
+                'timeout' if latency is None else '%.3fs' % latency))
+        report.append('slow down factor %.1f' % self.factor)
+        print 'throttle:', ', '.join(report)
+        self._start_window()
+
+
+class ThrottledStore(object):
+    """Store proxy waiting for the throttle before creating entities"""
+
+    def __init__(self, store, throttle):
+        self._store = store
+        self._throttle = throttle
+
+    def create_entity(self, *args, **kwargs):
+        self._throttle.entity()
+        return self._store.create_entity(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._store, name)
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+# copyright 2013 CEA (Saclay, FRANCE), all rights reserved.
+# copyright 2013 LOGILAB S.A. (Paris, FRANCE), all rights reserved.
+# contact http://brainomics.cea.fr -- mailto:localizer94@cea.fr
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""cubicweb-localizer instrumentation of the web requests
+
+When the `localizer-instrumentation` option is set, the RQL queries of the
+repository and the SQL statements of the system source are timed, and each
+request handled by the view controller is recorded with its view, render
+time, number and total time of queries, and slowest queries:
+
+* aggregated histograms are kept in memory and returned to managers by the
+  `localizer-instrumentation` endpoint (see views/instrumentation.py);
+* each request is written as a JSON line in a rotating log file.
+
+When the option is not set, nothing is wrapped and the view controller only
+checks the option.
+"""
+
+import os.path as osp
+import json
+import heapq
+import logging
+import threading
+from logging.handlers import RotatingFileHandler
+from time import time
+
+from cubes.localizer.caches import cache_directory
+
+# upper bounds of the histogram buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10.)
+QUERY_COUNT_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000)
+SLOWEST_QUERIES = 5
+LOG_SIZE = 10 * 2**20
+LOG_BACKUPS = 5
+
+LOGGER = logging.getLogger('cubicweb.localizer.instrumentation')
+LOGGER.propagate = False
+
+_CURRENT = threading.local()
+
+
+def _bucket(bounds, value):
+    for index, bound in enumerate(bounds):
+        if value <= bound:
+            return index
+    return len(bounds)
+
+
+class RequestRecord(object):
+    """Queries and timings of a request"""
+
+    def __init__(self, path):
+        self.path = path
+        self.vid = None
+        self.started = time()
+        self.duration = None
+        self.counts = {'rql': 0, 'sql': 0}
+        self.times = {'rql': 0., 'sql': 0.}
+        self.slowest = []
+
+    def add_query(self, kind, query, duration):
+        self.counts[kind] += 1
+        self.times[kind] += duration
+        entry = (duration, kind, query)
+        if len(self.slowest) < SLOWEST_QUERIES:
+            heapq.heappush(self.slowest, entry)
+        elif duration > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, entry)
+
+    def as_dict(self):
+        return {'path': self.path, 'vid': self.vid,
+                'duration': self.duration, 'counts': self.counts,
+                'times': self.times,
+                'slowest': [{'kind': kind, 'duration': duration,
+                             'query': query} for duration, kind, query
+                            in sorted(self.slowest, reverse=True)]}
+
+
+class Statistics(object):
+    """Histograms of the render times and query counts by view"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.views = {}
+
+    def add(self, record):
+        with self._lock:
+            stats = self.views.get(record.vid)
+            if stats is None:
+                stats = self.views[record.vid] = {
+                    'requests': 0, 'duration': 0., 'sql': 0, 'sql_time': 0.,
+                    'rql': 0, 'rql_time': 0.,
+                    'duration_histogram': [0] * (len(BUCKETS) + 1),
+                    'sql_histogram': [0] * (len(QUERY_COUNT_BUCKETS) + 1)}
+            stats['requests'] += 1
+            stats['duration'] += record.duration
+            for kind in ('sql', 'rql'):
+                stats[kind] += record.counts[kind]
+                stats[kind + '_time'] += record.times[kind]
+            stats['duration_histogram'][_bucket(BUCKETS,
+                                                record.duration)] += 1
+            stats['sql_histogram'][_bucket(QUERY_COUNT_BUCKETS,
+                                           record.counts['sql'])] += 1
+
+    def as_dict(self):
+        with self._lock:
+            return {'buckets': BUCKETS,
+                    'query_count_buckets': QUERY_COUNT_BUCKETS,
+                    'views': dict((vid or '', dict(stats)) for vid, stats
+                                  in self.views.items())}
+
+    def clear(self):
+        with self._lock:
+            self.views.clear()
+
+STATISTICS = Statistics()
+
+
+###############################################################################
+### Requests ##################################################################
+###############################################################################
+def start_request(path):
+    _CURRENT.record = RequestRecord(path)
+    return _CURRENT.record
+
+def current_request():
+    """Return the record of the request handled by the current thread, or
+    None"""
+    return getattr(_CURRENT, 'record', None)
+
+def end_request():
+    record = current_request()
+    if record is None:
+        return None
+    _CURRENT.record = None
+    record.duration = time() - record.started
+    STATISTICS.add(record)
+    LOGGER.info(json.dumps(record.as_dict()))
+    return record
+
+
+###############################################################################
+### Installation ##############################################################
+###############################################################################
+def _timed(kind, func, query_index):
+    def wrapper(*args, **kwargs):
+        record = current_request()
+        if record is None:
+            return func(*args, **kwargs)
+        start = time()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            record.add_query(kind, unicode(args[query_index])[:500],
+                             time() - start)
+    return wrapper
+
+def install(repo):
+    """Time the queries of `repo` and set up the log file, if the
+    instrumentation is enabled"""
+    config = repo.config
+    if not config['localizer-instrumentation']:
+        return False
+    # Repository.execute(sessionid, rqlstring, ...)
+    repo.execute = _timed('rql', repo.execute, 1)
+    source = repo.system_source
+    # doexec(session, query, args=None, rollback=True)
+    source.doexec = _timed('sql', source.doexec, 1)
+    source.doexecmany = _timed('sql', source.doexecmany, 1)
+    path = (config['localizer-instrumentation-log']
+            or osp.join(cache_directory(config), 'instrumentation.log'))
+    if not LOGGER.handlers:
+        handler = RotatingFileHandler(path, maxBytes=LOG_SIZE,
+                                      backupCount=LOG_BACKUPS)
+        handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+        LOGGER.addHandler(handler)
+        LOGGER.setLevel(logging.INFO)
+    return True
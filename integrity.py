@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+# copyright 2013 CEA (Saclay, FRANCE), all rights reserved.
+# copyright 2013 LOGILAB S.A. (Paris, FRANCE), all rights reserved.
+# contact http://brainomics.cea.fr -- mailto:localizer94@cea.fr
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""cubicweb-localizer integrity check of the imaging files
+
+Each `.nii.gz` file of the subjects directories is fully decompressed by
+chunks, so that the gzip CRC and size are checked, and its NIfTI header is
+checked against the expected number of dimensions for its kind (3D anatomy,
+maps and mask, 4D bold), with voxel sizes in `VOXEL_SIZE_RANGE` and data
+fitting in the decompressed size. Files are checked in a pool of processes,
+each reading `CHUNK_SIZE` bytes at a time.
+
+Results are stored by file, with the file size and modification time, so
+that unchanged files are not checked again. Run with::
+
+    python integrity.py <root_dir> <results file> [processes]
+    cubicweb-ctl shell <instance> integrity.py <root_dir> [processes]
+
+the results being stored in the localizer cache directory in the second
+case, in one file by study directory. The importer runs this check first with
+`--verify-images`.
+"""
+
+import os.path as osp
+import sys
+import json
+import glob
+import zlib
+import hashlib
+import gzip
+from multiprocessing import Pool
+
+from cubes.localizer.caches import atomic_write, file_state
+from cubes.localizer.storage import parse_header
+
+CHUNK_SIZE = 2**20
+VOXEL_SIZE_RANGE = (0.1, 20.)
+
+# subject directory patterns and number of dimensions of the images
+EXPECTED_DIMENSIONS = (
+    ('anat/*.nii.gz', 3),
+    ('fmri/*.nii.gz', 4),
+    ('c_maps/*.nii.gz', 3),
+    ('t_maps/*.nii.gz', 3),
+    ('mask.nii.gz', 3),
+)
+
+
+###############################################################################
+### Checks ####################################################################
+###############################################################################
+def check_header(header, ndim):
+    """Return the problems of a parsed NIfTI header for an image of `ndim`
+    dimensions"""
+    problems = []
+    shape = header['shape']
+    # trailing dimensions of size 1 are allowed (e.g. 4D anatomy of 1 volume)
+    significant = len(shape)
+    while significant > ndim and shape[significant - 1] == 1:
+        significant -= 1
+    if significant != ndim:
+        problems.append('%s dimensions, expected %s' % (len(shape), ndim))
+    if min(shape or (0,)) < 1:
+        problems.append('invalid shape %s' % (shape,))
+    low, high = VOXEL_SIZE_RANGE
+    for size in header['voxel_size'][:3]:
+        if not low <= abs(size) <= high:
+            problems.append('invalid voxel size %s' % (header['voxel_size'],))
+            break
+    return problems
+
+def check_file(task):
+    """Return (path, status) for a (path, number of dimensions) task, run
+    in a worker process"""
+    path, ndim = task
+    try:
+        stream = gzip.open(path, 'rb')
+        try:
+            data = stream.read(348)
+            size = len(data)
+            # reading up to the end checks the CRC and size of the data
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                size += len(chunk)
+        finally:
+            stream.close()
+        header = parse_header(data, path)
+        problems = check_header(header, ndim)
+        nvoxels = 1
+        for dim in header['shape']:
+            nvoxels *= dim
+        expected = header['vox_offset'] + nvoxels * int(header['dtype'][2:])
+        if size < expected:
+            problems.append('%s bytes of data, expected %s' % (size,
+                                                                expected))
+        return path, problems and 'error: %s' % '; '.join(problems) or 'ok'
+    except (IOError, EOFError, ValueError, zlib.error) as exc:
+        return path, 'error: %s' % exc
+
+
+###############################################################################
+### Tree ######################################################################
+###############################################################################
+def image_files(root_dir):
+    """Yield (path, number of dimensions) for the images of the subjects"""
+    for subject_dir in sorted(glob.glob(osp.join(root_dir, 'subjects', '*'))):
+        for pattern, ndim in EXPECTED_DIMENSIONS:
+            for path in sorted(glob.glob(osp.join(subject_dir, pattern))):
+                yield path, ndim
+
+def results_file(root_dir):
+    """Return the name of the results file of `root_dir` in the localizer
+    cache directory"""
+    return 'integrity-%s.json' % hashlib.sha1(
+        osp.abspath(root_dir)).hexdigest()[:12]
+
+def load_results(results_path):
+    try:
+        with open(results_path) as stream:
+            return json.load(stream)
+    except (IOError, ValueError):
+        return {}
+
+def save_results(results_path, results):
+    atomic_write(results_path, lambda stream: json.dump(results, stream))
+
+def verify_tree(root_dir, results_path, processes=None):
+    """Check the images of `root_dir` which changed since the last run,
+    return a {path relative to root_dir: status} dictionary of all images"""
+    previous = load_results(results_path)
+    results, tasks = {}, []
+    for path, ndim in image_files(root_dir):
+        relpath = osp.relpath(path, root_dir)
+        state = file_state(path)
+        entry = previous.get(relpath)
+        if entry is not None and entry['state'] == state:
+            results[relpath] = entry
+        else:
+            results[relpath] = {'state': state, 'status': None}
+            tasks.append((path, ndim))
+    pool = Pool(processes)
+    try:
+        for path, status in pool.imap_unordered(check_file, tasks,
+                                                chunksize=4):
+            results[osp.relpath(path, root_dir)]['status'] = status
+    finally:
+        pool.close()
+        pool.join()
+    save_results(results_path, results)
+    return dict((relpath, entry['status'])
+                for relpath, entry in results.items())
+
+def failures(statuses):
+    return sorted((relpath, status) for relpath, status in statuses.items()
+                  if status != 'ok')
+
+
+###############################################################################
+### MAIN ######################################################################
+###############################################################################
+if __name__ == '__main__':
+    if 'session' in globals():
+        from cubes.localizer.caches import cache_directory
+        from cubes.localizer.pools import importable
+        verify_tree = importable(verify_tree)
+        args = sys.argv[4:]
+        results_path = osp.join(cache_directory(session.repo.config),
+                                results_file(args[0]))
+    else:
+        args = sys.argv[1:]
+        results_path = osp.abspath(args.pop(1))
+    root_dir = osp.abspath(args[0])
+    processes = int(args[1]) if len(args) > 1 else None
+    statuses = verify_tree(root_dir, results_path, processes)
+    for relpath, status in failures(statuses):
+        print relpath, status
+    print '%s files, %s errors' % (len(statuses), len(failures(statuses)))
+    sys.exit(1 if failures(statuses) else 0)
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+# copyright 2013 CEA (Saclay, FRANCE), all rights reserved.
+# copyright 2013 LOGILAB S.A. (Paris, FRANCE), all rights reserved.
+# contact http://brainomics.cea.fr -- mailto:localizer94@cea.fr
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from cubes.localizer.schema import FACET_ATTRIBUTES
+from cubes.localizer.migration.indexes import INDEXES, create_indexes
+
+# facets indexes, the contrast one is created once Scan has a contrast
+for etype, attr in FACET_ATTRIBUTES:
+    sync_schema_props_perms((etype, attr, 'String'), syncperms=False)
+create_indexes(session, [index for index in INDEXES
+                         if 'cw_contrast' not in index[2]])
+commit()
+
+# snps in genes
+add_relation_definition('Snp', 'in_gene', 'Gene')
+
+# subjects summaries
+add_attribute('Subject', 'localizer_summary')
+from cubes.localizer.summaries import refresh_subject_summaries
+refresh_subject_summaries(session)
+commit()
+
+# cohort statistics
+from cubes.localizer.statistics import refresh_cohort_statistics
+refresh_cohort_statistics(session)
+
+# contrasts of the c-maps and t-maps
+import os.path as osp
+from cubes.localizer.importers.localizer.neuroimaging import ContrastRegistry
+add_entity_type('Contrast')
+contrasts = ContrastRegistry(session)
+for eid, identifier, filepath, root in rql(
+    'Any X, XI, XF, D WHERE X is Scan, X type IN ("c map", "t map"), '
+    'X identifier XI, X filepath XF, X related_study S, S data_filepath D',
+    ask_confirm=False):
+    name = unicode(osp.basename(filepath).split('.nii.gz')[0])
+    definition_path = osp.join(root, osp.dirname(osp.dirname(filepath)),
+                               'contrasts', '%s.json' % name)
+    if not identifier.endswith(name):
+        identifier = u'%s_%s' % (identifier, name)
+    rql('SET X contrast C, X identifier %(i)s WHERE X eid %(x)s, C eid %(c)s',
+        {'x': eid, 'i': identifier,
+         'c': contrasts.eid(name, definition_path)}, ask_confirm=False)
+create_indexes(session)
+commit()
+
+# random access versions of scan files
+add_attribute('Scan', 'localizer_random_access_filepath')
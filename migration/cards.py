@@ -23,12 +23,17 @@ HERE = osp.abspath(osp.dirname(__file__))
 ###############################################################################
 ### CARDS AND IMAGES DEFINITIONS ##############################################
 ###############################################################################
-HTMLS = {u'index': open(osp.join(HERE, 'static_pages/index.html')).read().decode('utf8'),
-         u'brainomics': open(osp.join(HERE, 'static_pages/brainomics.html')).read().decode('utf8'),
-         u'localizer': open(osp.join(HERE, 'static_pages/localizer.html')).read().decode('utf8'),
-         u'license': open(osp.join(HERE, 'static_pages/license.html')).read().decode('utf8'),
-         u'legal': open(osp.join(HERE, 'static_pages/legal.html')).read().decode('utf8'),
-         u'dataset': open(osp.join(HERE, 'static_pages/dataset.html')).read().decode('utf8')}
+STATIC_PAGES = (u'index', u'brainomics', u'localizer', u'license', u'legal',
+                u'dataset')
+
+def static_pages():
+    """ Read the html content of the static pages
+    """
+    htmls = {}
+    for _id in STATIC_PAGES:
+        with open(osp.join(HERE, 'static_pages', '%s.html' % _id)) as stream:
+            htmls[_id] = stream.read().decode('utf8')
+    return htmls
 
 
 ###############################################################################
@@ -37,7 +42,7 @@ HTMLS = {u'index': open(osp.join(HERE, 'static_pages/index.html')).read().decode
 def create_or_update_static_cards(session):
     """ Create or update the cards for static pages
     """
-    for _id, html in HTMLS.iteritems():
+    for _id, html in static_pages().iteritems():
         rset = session.execute('Any X WHERE X is Card, X title %(s)s', {'s': _id})
         if rset:
             session.execute('SET X content %(c)s WHERE X is Card, X title %(s)s',
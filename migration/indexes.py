@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+# copyright 2013 CEA (Saclay, FRANCE), all rights reserved.
+# copyright 2013 LOGILAB S.A. (Paris, FRANCE), all rights reserved.
+# contact http://brainomics.cea.fr -- mailto:localizer94@cea.fr
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""composite indexes used by the localizer facets
+
+Single column indexes are declared in the schema (see `FACET_ATTRIBUTES` in
+schema.py), yams does not support indexes on several columns.
+"""
+
+###############################################################################
+### INDEXES DEFINITIONS #######################################################
+###############################################################################
+INDEXES = (
+    ('localizer_scan_type_label_idx', 'cw_Scan', ('cw_type', 'cw_label')),
+    ('localizer_scan_contrast_type_idx', 'cw_Scan', ('cw_contrast', 'cw_type')),
+    ('localizer_subject_gender_handedness_idx', 'cw_Subject',
+     ('cw_gender', 'cw_handedness')),
+    # center facets, from the centers to the assessments of their subjects
+    ('localizer_holds_to_from_idx', 'holds_relation', ('eid_to', 'eid_from')),
+)
+
+
+###############################################################################
+### CREATE FUNCTION ###########################################################
+###############################################################################
+def create_indexes(session, indexes=INDEXES):
+    """ Create the indexes which do not exist yet
+    """
+    dbhelper = session.repo.system_source.dbhelper
+    existing = set(name.lower() for name in
+                   dbhelper.list_indices(session.cnxset['system']))
+    for name, table, columns in indexes:
+        if name.lower() in existing:
+            continue
+        session.system_sql('CREATE INDEX %s ON %s(%s)'
+                           % (name, table, ', '.join(columns)))
+
+
+###############################################################################
+### MAIN ######################################################################
+###############################################################################
+if __name__ == '__main__':
+    create_indexes(session)
+    session.commit()
@@ -26,3 +26,6 @@ set_property('ui.site-title', 'Brainomics/Localizer')
 
 from cubes.localizer.migration.cards import create_or_update_static_cards
 create_or_update_static_cards(session)
+
+from cubes.localizer.migration.indexes import create_indexes
+create_indexes(session)
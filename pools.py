@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+# copyright 2013 CEA (Saclay, FRANCE), all rights reserved.
+# copyright 2013 LOGILAB S.A. (Paris, FRANCE), all rights reserved.
+# contact http://brainomics.cea.fr -- mailto:localizer94@cea.fr
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""cubicweb-localizer multiprocessing pools of the shell scripts
+
+Scripts such as glm.py or similarity.py are run with `cubicweb-ctl shell`,
+which executes them with execfile: the functions they define belong to a
+`__main__` module which is not the one of the worker processes, so that a
+pool can not pickle them, nor the workers they reference. `importable`
+returns the same function, imported from its cube module instead.
+"""
+
+import os.path as osp
+import sys
+from importlib import import_module
+
+CUBE_DIRECTORY = osp.dirname(osp.realpath(__file__))
+
+
+def importable(function):
+    """Return `function`, imported from its cube module if it was defined by
+    a script executed by the shell"""
+    main = sys.modules.get('__main__')
+    if (function.__module__ != '__main__'
+        or getattr(main, function.__name__, None) is function):
+        return function
+    path = osp.realpath(function.func_code.co_filename)
+    relpath = osp.relpath(osp.splitext(path)[0], CUBE_DIRECTORY)
+    if relpath.startswith(osp.pardir):
+        raise ValueError('%s is not a module of the cube' % path)
+    module = import_module('.'.join(['cubes.localizer']
+                                    + relpath.split(osp.sep)))
+    return getattr(module, function.__name__)
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+# copyright 2013 CEA (Saclay, FRANCE), all rights reserved.
+# copyright 2013 LOGILAB S.A. (Paris, FRANCE), all rights reserved.
+# contact http://brainomics.cea.fr -- mailto:localizer94@cea.fr
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""cubicweb-localizer cache of result sets
+
+Result sets of read-only queries are kept in a LRU cache bounded by their
+number of cells (option `localizer-rql-cache-size`), by:
+
+* the normalized query and its arguments;
+* the groups of the user;
+* the generation of each entity type the query may return or traverse,
+  bumped by hooks when an entity of that type, or a relation from or to it,
+  is added, updated or deleted (see `bump_on_commit` for data written with
+  SQL). Generations are stored in the localizer cache
+  directory, so that changes committed by another web instance or by a
+  `cubicweb-ctl shell` script outdate the result sets of every process;
+* the version of the last import, as the importer does not run hooks.
+
+Only queries on the entity types and relations of the dataset listed in
+`CACHED_ETYPES` and `CACHED_RTYPES` are cached, so that other changes (users,
+properties, metadata relations...) do not outdate anything.
+
+Outdated entries are never returned and are evicted as the cache fills.
+Entity types, and whether a query is cacheable, are computed once for each
+query. Queries on entity types whose read permissions use RQL expressions
+(e.g. on ownership) are not cached, as their result sets do not only depend
+on the groups of the user. Queries of the `rql` parameter are processed by
+the magic search component before being looked up (see
+views/basecontrollers.py).
+"""
+
+import re
+import threading
+
+from rql import nodes
+
+from cubicweb.rset import ResultSet
+
+from cubes.localizer.caches import JSONCache, LRUCache, import_version
+
+# number of distinct queries whose entity types are remembered
+MAX_QUERIES = 1000
+# entity types and relations of the cached listings, whose changes are tracked
+CACHED_ETYPES = frozenset((
+    'Subject', 'Center', 'Study', 'Assessment', 'Scan', 'MRIData',
+    'Contrast', 'QuestionnaireRun', 'Questionnaire', 'Question', 'Answer',
+    'GenomicMeasure', 'GenericTestRun', 'GenericTest', 'ScoreDefinition',
+    'ScoreValue', 'ExternalResource', 'Gene', 'Snp'))
+CACHED_RTYPES = frozenset((
+    'concerns', 'related_study', 'other_studies', 'holds', 'concerned_by',
+    'generates', 'uses', 'measure', 'related_infos', 'definition',
+    'definitions', 'has_data', 'contrast', 'instance_of', 'questionnaire',
+    'questionnaire_run', 'question', 'external_resources', 'in_gene'))
+# relations which do not change, or only with the attributes of an entity
+UNTRACKED_RTYPES = frozenset(('is', 'is_instance_of', 'identity',
+                              'has_text'))
+
+
+def _cells(value):
+    rows = value[0]
+    return max(1, len(rows) * (rows and len(rows[0]) or 0))
+
+
+class Generations(object):
+    """Generation counter by entity type, shared by the processes of an
+    instance"""
+
+    def __init__(self):
+        self.document = JSONCache('rql-generations.json')
+
+    def bump(self, config, *etypes):
+        def update(counters):
+            for etype in etypes:
+                counters[etype] = counters.get(etype, 0) + 1
+            return counters
+        self.document.update(config, update)
+
+    def key(self, config, etypes):
+        counters = self.document.load(config)
+        return tuple(counters.get(etype, 0) for etype in etypes)
+
+GENERATIONS = Generations()
+
+def bump_on_commit(session, *etypes):
+    """Bump the generations of `etypes` once the transaction of `session` is
+    committed, for changes written without hooks (raw SQL)"""
+    from cubes.localizer.hooks import GenerationOp
+    op = GenerationOp.get_instance(session)
+    for etype in etypes:
+        op.add_data(etype)
+
+
+class RQLCache(object):
+    """Result sets cache, see the module docstring"""
+
+    def __init__(self):
+        self.cache = None
+        self._queries = {}
+        self._lock = threading.Lock()
+
+    def _lru(self, config):
+        if self.cache is None:
+            with self._lock:
+                if self.cache is None:
+                    self.cache = LRUCache(config['localizer-rql-cache-size'],
+                                          sizeof=_cells)
+        return self.cache
+
+    def query_etypes(self, req, rql):
+        """Return the entity types involved in a select query, sorted, or
+        None if the query is not cacheable"""
+        try:
+            return self._queries[rql]
+        except KeyError:
+            pass
+        etypes = None
+        try:
+            rqlst = req.vreg.parse(req, rql)
+        except Exception:
+            rqlst = None
+        if rqlst is not None and rqlst.TYPE == 'select':
+            etypes = self._tracked_etypes(req.vreg.schema, rqlst)
+        with self._lock:
+            if len(self._queries) >= MAX_QUERIES:
+                self._queries.clear()
+            self._queries[rql] = etypes
+        return etypes
+
+    def _tracked_etypes(self, schema, rqlst):
+        """Return the sorted entity types of a select query, or None if it
+        involves entity types or relations whose changes are not tracked"""
+        etypes, rtypes = set(), set()
+        for select in rqlst.children:
+            if select.with_:
+                return None
+            for solution in select.solutions:
+                etypes.update(solution.values())
+            for relation in select.iget_nodes(nodes.Relation):
+                rtypes.add(relation.r_type)
+        etypes = set(etype for etype in etypes
+                     if not schema.eschema(etype).final)
+        rtypes = set(rtype for rtype in rtypes - UNTRACKED_RTYPES
+                     if not schema.rschema(rtype).final)
+        if not (etypes <= CACHED_ETYPES and rtypes <= CACHED_RTYPES):
+            return None
+        for etype in etypes:
+            # readable entities depend on more than the user's groups
+            if schema.eschema(etype).get_rqlexprs('read'):
+                return None
+        return tuple(sorted(etypes))
+
+    def execute(self, req, rql, args=None):
+        """Return the result set of `rql`, from the cache when possible"""
+        config = req.vreg.config
+        if not config['localizer-rql-cache-size']:
+            return req.execute(rql, args)
+        rql = normalize(rql)
+        etypes = self.query_etypes(req, rql)
+        if etypes is None:
+            return req.execute(rql, args)
+        key = (rql, tuple(sorted((args or {}).items())),
+               tuple(sorted(req.user.groups)), etypes,
+               GENERATIONS.key(config, etypes), import_version(config))
+        cache = self._lru(config)
+        cached = cache.get(key)
+        if cached is None:
+            rset = req.execute(rql, args)
+            cache.set(key, ([list(row) for row in rset.rows],
+                            [list(row) for row in rset.description]))
+            return rset
+        rows, description = cached
+        rset = ResultSet([list(row) for row in rows], rql, args,
+                         [list(row) for row in description])
+        req.decorate_rset(rset)
+        return rset
+
+    def stats(self):
+        if self.cache is None:
+            return None
+        stats = self.cache.stats()
+        stats['queries'] = len(self._queries)
+        return stats
+
+RQL_CACHE = RQLCache()
+
+
+def normalize(rql):
+    """Collapse the white spaces of a query"""
+    return re.sub(r'\s+', ' ', rql).strip()
@@ -18,12 +18,71 @@
 
 """cubicweb-localizer schema"""
 
+from yams.buildobjs import EntityType, RelationDefinition, String
+
 GENOMIC_FILEPATH_PERMISSIONS = {
     'read': (u'managers',),
     'update': (u'managers',),
 }
 
+# attributes whose permissions are only group based, see
+# `entities.can_read_attribute`
+RESTRICTED_ATTRIBUTES = {
+    ('GenomicMeasure', 'filepath'): GENOMIC_FILEPATH_PERMISSIONS,
+}
+
+# attributes used as search facets, see also migration/indexes.py for the
+# composite indexes
+FACET_ATTRIBUTES = (
+    ('Scan', 'type'),
+    ('Scan', 'label'),
+    ('Subject', 'gender'),
+    ('Subject', 'handedness'),
+    ('Center', 'name'),
+)
+
+
+class Contrast(EntityType):
+    """contrast of the localizer protocol, shared by the c-maps and t-maps of
+    all subjects"""
+    name = String(required=True, unique=True, indexed=True, maxsize=256)
+    definition = String(description='JSON definition of the contrast')
+
+
+class contrast(RelationDefinition):
+    """contrast of a c-map or t-map; inlined, so that the maps of a contrast
+    are found through the index of the cw_Scan.cw_contrast column"""
+    subject = 'Scan'
+    object = 'Contrast'
+    cardinality = '?*'
+    inlined = True
+
+
+class in_gene(RelationDefinition):
+    """SNPs located between the start and stop positions of a gene, computed
+    by the importer"""
+    subject = 'Snp'
+    object = 'Gene'
+    cardinality = '**'
+
+
+class localizer_summary(RelationDefinition):
+    """JSON summary of the subject and related entities, see summaries.py"""
+    subject = 'Subject'
+    object = 'String'
+
+
+class localizer_random_access_filepath(RelationDefinition):
+    """relative path of the random access version of the scan file, see
+    storage.py"""
+    subject = 'Scan'
+    object = 'String'
+
+
 def post_build_callback(schema):
     # genomic measures must not be downloaded
-    rdef = schema['GenomicMeasure'].rdef('filepath')
-    rdef.permissions = GENOMIC_FILEPATH_PERMISSIONS
+    for (etype, attr), permissions in RESTRICTED_ATTRIBUTES.iteritems():
+        schema[etype].rdef(attr).permissions = permissions
+    # facets filter on these attributes
+    for etype, attr in FACET_ATTRIBUTES:
+        schema[etype].rdef(attr).indexed = True
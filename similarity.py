@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+# copyright 2013 CEA (Saclay, FRANCE), all rights reserved.
+# copyright 2013 LOGILAB S.A. (Paris, FRANCE), all rights reserved.
+# contact http://brainomics.cea.fr -- mailto:localizer94@cea.fr
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""cubicweb-localizer similarity search of subjects on their contrast maps
+
+After the import, the c-map of each subject and contrast is downsampled
+inside the subject mask to a fixed length vector: the mean of the map over
+each cell of a `GRID` grid. Vectors of a contrast are stored as a float32
+(subjects x cells) .npy matrix in the localizer cache directory, with their
+means and norms, and are memory-mapped by the web instances. The subjects
+most similar to a given subject are then found with a single
+matrix-vector product, by cosine similarity or correlation.
+
+Subjects are indexed by eid, identifiers being only unique in a study.
+Indexing is incremental: the vectors of maps whose file and mask did not
+change are kept, only new or modified maps are read. Each update writes a new version
+directory, made current by replacing a symbolic link, so that the vectors
+and subjects read by the web instances always match. Run with::
+
+    cubicweb-ctl shell <instance> similarity.py [processes]
+"""
+
+import os
+import os.path as osp
+import sys
+import json
+import shutil
+import tempfile
+import threading
+from multiprocessing import Pool
+
+import numpy as np
+
+from cubes.localizer.caches import cache_directory, file_state
+from cubes.localizer.storage import read_volume, scan_path
+
+GRID = (16, 16, 16)
+METRICS = ('cosine', 'correlation')
+INDEX_FILE = 'index.json'
+VECTORS_FILE = 'vectors.npy'
+STATS_FILE = 'stats.npy'
+CURRENT_LINK = 'current'
+
+MAPS_QUERY = ('Any C, S, SI, F, RF, D WHERE X is Scan, X type "c map", '
+              'X contrast C, X concerns S, S identifier SI, X filepath F, '
+              'X localizer_random_access_filepath RF, X related_study T, '
+              'T data_filepath D')
+MASKS_QUERY = ('Any S, F, RF, D WHERE X is Scan, X type "boolean mask", '
+               'X concerns S, X filepath F, '
+               'X localizer_random_access_filepath RF, X related_study T, '
+               'T data_filepath D')
+
+
+###############################################################################
+### Vectors ###################################################################
+###############################################################################
+def downsample(volume, mask, grid=GRID):
+    """Return the means of `volume` inside `mask` over the cells of
+    `grid`, as a float32 vector; empty cells are null"""
+    cells = 0
+    for axis, (size, count) in enumerate(zip(volume.shape, grid)):
+        index = np.arange(size) * count // size
+        shape = [1, 1, 1]
+        shape[axis] = size
+        cells = cells * count + index.reshape(shape)
+    cells = np.broadcast_to(cells, volume.shape)[mask]
+    values = np.nan_to_num(volume[mask])
+    length = int(np.prod(grid))
+    sums = np.bincount(cells, weights=values, minlength=length)
+    counts = np.bincount(cells, minlength=length)
+    return (sums / np.maximum(counts, 1)).astype(np.float32)
+
+def vector_stats(vectors):
+    """Return the means, norms and centered norms of the rows of
+    `vectors`"""
+    vectors = np.asarray(vectors, dtype=np.float64)
+    means = vectors.mean(axis=1)
+    norms = np.sqrt((vectors ** 2).sum(axis=1))
+    centered = np.sqrt(((vectors - means[:, np.newaxis]) ** 2).sum(axis=1))
+    return np.column_stack((means, norms, centered))
+
+def map_vector(task):
+    """Return (key, vector) for a (key, map path, mask path) task, run in a
+    worker process"""
+    key, map_path, mask_path = task
+    try:
+        return key, downsample(read_volume(map_path),
+                               read_volume(mask_path) > 0)
+    except Exception as exc:
+        return key, 'error: %s' % exc
+
+
+###############################################################################
+### Index #####################################################################
+###############################################################################
+def index_directory(config, contrast_eid):
+    return osp.join(cache_directory(config), 'similarity', str(contrast_eid))
+
+def _current_directory(config, contrast_eid):
+    """Return the directory of the current version of the index of a
+    contrast, or None if the contrast was never indexed"""
+    directory = index_directory(config, contrast_eid)
+    try:
+        return osp.join(directory,
+                        os.readlink(osp.join(directory, CURRENT_LINK)))
+    except OSError:
+        return None
+
+def load_index(config, contrast_eid, version_directory=None):
+    """Return the (index, vectors, stats) of a contrast, vectors being
+    memory-mapped, or None if the contrast was never indexed"""
+    if version_directory is None:
+        version_directory = _current_directory(config, contrast_eid)
+        if version_directory is None:
+            return None
+    with open(osp.join(version_directory, INDEX_FILE)) as stream:
+        index = json.load(stream)
+    vectors = np.load(osp.join(version_directory, VECTORS_FILE),
+                      mmap_mode='r')
+    stats = np.load(osp.join(version_directory, STATS_FILE))
+    if not (vectors.shape[0] == stats.shape[0] == len(index['subjects'])):
+        raise ValueError('inconsistent similarity index %s'
+                         % version_directory)
+    return index, vectors, stats
+
+def _save_index(directory, index, matrix):
+    """Write a new version of an index and make it current, keeping the
+    previous version for the processes still reading it"""
+    if not osp.isdir(directory):
+        os.makedirs(directory)
+    link = osp.join(directory, CURRENT_LINK)
+    previous = osp.islink(link) and os.readlink(link) or None
+    version = tempfile.mkdtemp(dir=directory, prefix='v')
+    os.chmod(version, 0o755)
+    np.save(osp.join(version, VECTORS_FILE), matrix)
+    np.save(osp.join(version, STATS_FILE), vector_stats(matrix))
+    with open(osp.join(version, INDEX_FILE), 'w') as stream:
+        json.dump(index, stream)
+    name = osp.basename(version)
+    tmplink = osp.join(directory, '%s.%s' % (CURRENT_LINK, name))
+    os.symlink(name, tmplink)
+    os.rename(tmplink, link)
+    for old in os.listdir(directory):
+        if old in (name, previous, CURRENT_LINK):
+            continue
+        old = osp.join(directory, old)
+        if osp.isdir(old):
+            shutil.rmtree(old, ignore_errors=True)
+        else:
+            os.remove(old)
+
+def update_index(session, processes=None):
+    """Index the new or modified c-maps, return a {status: count}
+    dictionary"""
+    config = session.repo.config
+    masks = {}
+    for subject, filepath, rapath, root in session.execute(MASKS_QUERY):
+        path = scan_path(root, filepath, rapath)
+        masks[subject] = (path, file_state(path))
+    maps = {}
+    for contrast, subject, identifier, filepath, rapath, root in \
+            session.execute(MAPS_QUERY):
+        if subject in masks:
+            path = scan_path(root, filepath, rapath)
+            # the vector depends on both the map and the mask
+            maps.setdefault(contrast, {})[subject] = (
+                identifier, path, [file_state(path), masks[subject][1]])
+    report = {}
+    rows, tasks = {}, []
+    for contrast, subjects in maps.items():
+        previous = load_index(config, contrast)
+        kept = {}
+        if previous is not None:
+            index, vectors, _ = previous
+            for row, subject in enumerate(index['subjects']):
+                if (subject in subjects
+                    and subjects[subject][2] == index['states'][row]):
+                    kept[subject] = np.array(vectors[row])
+        report['kept'] = report.get('kept', 0) + len(kept)
+        rows[contrast] = kept
+        tasks.extend(((contrast, subject), path, masks[subject][0])
+                     for subject, (_, path, _) in subjects.items()
+                     if subject not in kept)
+    pool = Pool(processes)
+    try:
+        for (contrast, subject), vector in pool.imap_unordered(map_vector,
+                                                               tasks):
+            if isinstance(vector, str):
+                print 'contrast', contrast, 'subject', subject, vector
+                report['error'] = report.get('error', 0) + 1
+                continue
+            rows[contrast][subject] = vector
+            report['indexed'] = report.get('indexed', 0) + 1
+    finally:
+        pool.close()
+        pool.join()
+    for contrast, vectors in rows.items():
+        if not vectors:
+            continue
+        subjects = sorted(vectors)
+        matrix = np.array([vectors[subject] for subject in subjects],
+                          dtype=np.float32)
+        index = {'grid': GRID, 'subjects': subjects,
+                 'identifiers': [maps[contrast][subject][0]
+                                 for subject in subjects],
+                 'states': [maps[contrast][subject][2]
+                            for subject in subjects]}
+        _save_index(index_directory(config, contrast), index, matrix)
+    _INDEXES.clear()
+    return report
+
+
+###############################################################################
+### Search ####################################################################
+###############################################################################
+_INDEXES = {}
+_INDEXES_LOCK = threading.Lock()
+
+def _cached_index(config, contrast_eid):
+    """Return the index of a contrast, reloaded when it is updated"""
+    version_directory = _current_directory(config, contrast_eid)
+    if version_directory is None:
+        return None
+    with _INDEXES_LOCK:
+        cached = _INDEXES.get(contrast_eid)
+        if cached is None or cached[0] != version_directory:
+            cached = (version_directory,
+                      load_index(config, contrast_eid, version_directory))
+            _INDEXES[contrast_eid] = cached
+        return cached[1]
+
+def similarities(vectors, stats, row, metric='cosine'):
+    """Return the similarity of each row of `vectors` to row `row`"""
+    query = np.asarray(vectors[row], dtype=np.float64)
+    products = np.asarray(vectors).dot(query)
+    means, norms, centered = stats[:, 0], stats[:, 1], stats[:, 2]
+    if metric == 'correlation':
+        products = products - vectors.shape[1] * means * means[row]
+        norms = centered
+    denominators = norms * norms[row]
+    return np.where(denominators > 0,
+                    products / np.where(denominators > 0, denominators, 1), 0)
+
+def similar_subjects(config, contrast_eid, subject, k=10, metric='cosine'):
+    """Return the `k` subjects whose map of contrast `contrast_eid` is the
+    most similar to the map of `subject` (an eid), as a list of
+    (eid, identifier, similarity), most similar first; None if the contrast
+    or subject is not indexed"""
+    if metric not in METRICS:
+        raise ValueError('unknown metric %s' % metric)
+    loaded = _cached_index(config, contrast_eid)
+    if loaded is None:
+        return None
+    index, vectors, stats = loaded
+    try:
+        row = index['subjects'].index(subject)
+    except ValueError:
+        return None
+    scores = similarities(vectors, stats, row, metric)
+    scores[row] = -np.inf
+    k = min(k, len(scores) - 1)
+    if k <= 0:
+        return []
+    best = np.argpartition(-scores, k - 1)[:k]
+    best = best[np.argsort(-scores[best])]
+    return [(index['subjects'][i], index['identifiers'][i], float(scores[i]))
+            for i in best]
+
+
+###############################################################################
+### MAIN ######################################################################
+###############################################################################
+if __name__ == '__main__':
+    from cubes.localizer.pools import importable
+    update_index = importable(update_index)
+    processes = int(sys.argv[4]) if len(sys.argv) > 4 else None
+    for status, count in sorted(update_index(session, processes).items()):
+        print '%s: %s' % (status, count)
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+# copyright 2013 CEA (Saclay, FRANCE), all rights reserved.
+# copyright 2013 LOGILAB S.A. (Paris, FRANCE), all rights reserved.
+# contact http://brainomics.cea.fr -- mailto:localizer94@cea.fr
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""cubicweb-localizer site customizations"""
+
+options = (
+    ('localizer-cache-dir',
+     {'type': 'string',
+      'default': None,
+      'help': 'directory where data precomputed by the localizer importer '
+              'are stored (default to a "localizer" sub-directory of the '
+              'instance data directory)',
+      'group': 'localizer', 'level': 2,
+      }),
+    ('localizer-warm-start',
+     {'type': 'yn',
+      'default': False,
+      'help': 'preload the rendered static pages when the repository starts '
+              '(see warmstart.py to precompute them at deployment time)',
+      'group': 'localizer', 'level': 2,
+      }),
+    ('localizer-sendfile',
+     {'type': 'choice',
+      'choices': ('', 'x-sendfile', 'x-accel-redirect'),
+      'default': '',
+      'help': 'let the front-end web server send the scan files: '
+              '"x-sendfile" (apache mod_xsendfile, lighttpd) or '
+              '"x-accel-redirect" (nginx). If empty, files are read and sent '
+              'by the web instance',
+      'group': 'localizer', 'level': 2,
+      }),
+    ('localizer-sendfile-prefix',
+     {'type': 'string',
+      'default': '/protected-data/',
+      'help': 'with x-accel-redirect, internal location of the front-end '
+              'web server mapped to the studies data directories, followed '
+              'by the study name',
+      'group': 'localizer', 'level': 2,
+      }),
+    ('localizer-rql-cache-size',
+     {'type': 'int',
+      'default': 1000000,
+      'help': 'maximum number of cells (rows x columns) of the result sets '
+              'of the listings kept in memory, 0 to disable the cache (see '
+              'rqlcache.py)',
+      'group': 'localizer', 'level': 2,
+      }),
+    ('localizer-instrumentation',
+     {'type': 'yn',
+      'default': False,
+      'help': 'record, for each request, the view, render time and SQL/RQL '
+              'queries (see instrumentation.py)',
+      'group': 'localizer', 'level': 2,
+      }),
+    ('localizer-instrumentation-log',
+     {'type': 'string',
+      'default': None,
+      'help': 'rotating log file of the instrumented requests (default to '
+              'instrumentation.log in the localizer cache directory)',
+      'group': 'localizer', 'level': 2,
+      }),
+    )
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+# copyright 2013 CEA (Saclay, FRANCE), all rights reserved.
+# copyright 2013 LOGILAB S.A. (Paris, FRANCE), all rights reserved.
+# contact http://brainomics.cea.fr -- mailto:localizer94@cea.fr
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""cubicweb-localizer cohort statistics
+
+The demographics (gender, handedness, center) and scores of each subject are
+stored in the `cohort-statistics.json` cache, computed at the end of the
+import and updated by hooks when subjects, score values or the centers of
+their assessments change. Grouped counts and cross-tabulations over these
+variables are then computed in memory, and kept until the cache changes.
+"""
+
+import threading
+
+from cubes.localizer.caches import JSONCache
+from cubes.localizer.importers.localizer import SCORE_TYPES
+
+COHORT_STATISTICS = JSONCache('cohort-statistics.json')
+
+VARIABLES = (u'gender', u'handedness', u'center') + SCORE_TYPES
+
+PROFILE_QUERIES = (
+    ('Any S, SG, SH WHERE S is Subject, S gender SG, S handedness SH%s',
+     (u'gender', u'handedness')),
+    ('Any S, CN WHERE S is Subject, S concerned_by A, C holds A, '
+     'C name CN%s', (u'center',)),
+)
+SCORES_QUERY = ('Any S, DN, V WHERE S is Subject, S related_infos SV, '
+                'SV definition D, D name DN, SV text V%s')
+
+
+def subject_profiles(session, eids=None):
+    """Return a {subject eid: {variable: value}} dictionary for subjects
+    `eids` (all subjects if None), using three queries"""
+    restriction = ''
+    if eids is not None:
+        restriction = ', S eid IN (%s)' % ','.join(str(eid) for eid in eids)
+    profiles = {}
+    for rql, variables in PROFILE_QUERIES:
+        for row in session.execute(rql % restriction):
+            profile = profiles.setdefault(unicode(row[0]), {})
+            profile.update(zip(variables, row[1:]))
+    for eid, name, value in session.execute(SCORES_QUERY % restriction):
+        if name in SCORE_TYPES:
+            profiles.setdefault(unicode(eid), {})[name] = value
+    return profiles
+
+def refresh_cohort_statistics(session, eids=None):
+    """Recompute the profiles of subjects `eids` (all subjects if None) and
+    store them in the cache"""
+    store_profiles(session.repo.config, subject_profiles(session, eids), eids)
+
+def store_profiles(config, profiles, eids=None):
+    """Replace the cached profiles of subjects `eids` (all subjects if None)
+    by `profiles`; subjects of `eids` without a profile are removed. The
+    cache is updated under a lock, so that transactions committed
+    concurrently do not lose each other's updates"""
+    def update(data):
+        cached = data.get('profiles', {}) if eids is not None else {}
+        for eid in eids or ():
+            cached.pop(unicode(eid), None)
+        cached.update(profiles)
+        return {'profiles': cached}
+    COHORT_STATISTICS.update(config, update)
+
+_COUNTS = {}
+_COUNTS_LOCK = threading.Lock()
+
+def cohort_counts(config, variables):
+    """Return a list of (values, count) for each combination of values of
+    `variables` (one variable for grouped counts, several for
+    cross-tabulations), sorted by values"""
+    variables = tuple(variables)
+    for variable in variables:
+        if variable not in VARIABLES:
+            raise ValueError('unknown variable %r' % variable)
+    profiles = COHORT_STATISTICS.load(config).get('profiles', {})
+    with _COUNTS_LOCK:
+        # counts computed from an outdated version of the cache are dropped
+        if _COUNTS.get(None) is not profiles:
+            _COUNTS.clear()
+            _COUNTS[None] = profiles
+        if variables not in _COUNTS:
+            counts = {}
+            for profile in profiles.itervalues():
+                values = tuple(profile.get(variable) for variable in variables)
+                counts[values] = counts.get(values, 0) + 1
+            _COUNTS[variables] = sorted(counts.iteritems())
+        return _COUNTS[variables]
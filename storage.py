@@ -0,0 +1,362 @@
+# -*- coding: utf-8 -*-
+# copyright 2013 CEA (Saclay, FRANCE), all rights reserved.
+# copyright 2013 LOGILAB S.A. (Paris, FRANCE), all rights reserved.
+# contact http://brainomics.cea.fr -- mailto:localizer94@cea.fr
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""cubicweb-localizer random access storage of NIfTI images
+
+Images are imported as `.nii.gz` files made of a single gzip stream: reading
+the header, one volume of a 4D image or a region needs to decompress the
+file up to that point. This module converts the files of some Scans to one of
+two random access formats, written in the `random_access` directory of the
+study, outside of the subjects directories read by the importer and the
+integrity check:
+
+* `uncompressed`: a plain `.nii` file, read with seek() or memory-mapped;
+* `chunked`: a `.chunked.nii.gz` file made of independent gzip members of
+  `BLOCK_SIZE` uncompressed bytes, with the compressed offsets of the blocks
+  in a `.idx` JSON sidecar. The file is still a valid gzip file (readable by
+  nibabel, gunzip, ...), and a read decompresses only the blocks it covers.
+
+The path of the converted file, relative to the study directory, is stored in
+the Scan `localizer_random_access_filepath` attribute, and is used by the
+readers of this cube (derived data, download) when the file exists.
+
+Trade-offs, as measured by test/bench_random_access.py on a synthetic int16
+64x64x40x100 image: the uncompressed file is about 3 times as large as the
+gzip one and reads any volume in well under a millisecond; the chunked file
+is about the size of the gzip one, reads the last volume in a few
+milliseconds instead of about 100ms, but reading the header decompresses a
+whole block (a few milliseconds, where gzip only decompresses the first
+bytes). Converting the `raw fMRI` and `preprocessed fMRI` scans, whose
+volumes are read one at a time, brings the largest gains.
+
+Run the conversion with::
+
+    cubicweb-ctl shell <instance> storage.py [--uncompressed] [scan types]
+"""
+
+import os
+import os.path as osp
+import sys
+import json
+import gzip
+import zlib
+import struct
+import shutil
+
+from cubes.localizer.caches import atomic_write
+
+BLOCK_SIZE = 2**20
+RANDOM_ACCESS_DIRECTORY = 'random_access'
+INDEX_SUFFIX = '.idx'
+CHUNKED_SUFFIX = '.chunked.nii.gz'
+DEFAULT_TYPES = (u'raw fMRI', u'preprocessed fMRI')
+# gzip header and trailer for zlib compression and decompression objects
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+# NIfTI-1 datatype codes
+DATATYPES = {2: 'u1', 4: 'i2', 8: 'i4', 16: 'f4', 64: 'f8', 256: 'i1',
+             512: 'u2', 768: 'u4', 1024: 'i8', 1280: 'u8'}
+
+
+###############################################################################
+### Conversion ################################################################
+###############################################################################
+def random_access_path(filepath, uncompressed=False):
+    """Return the path of the random access version of the `.nii.gz` file
+    `filepath`, both relative to the study directory"""
+    base = (filepath[:-len('.nii.gz')] if filepath.endswith('.nii.gz')
+            else filepath)
+    return osp.join(RANDOM_ACCESS_DIRECTORY,
+                    base + ('.nii' if uncompressed else CHUNKED_SUFFIX))
+
+def convert_uncompressed(src, dst):
+    """Decompress the gzip file `src` into `dst`"""
+    source = gzip.open(src, 'rb')
+    try:
+        atomic_write(dst, lambda stream: shutil.copyfileobj(source, stream,
+                                                             BLOCK_SIZE))
+    finally:
+        source.close()
+
+def convert_chunked(src, dst, block_size=BLOCK_SIZE, level=6):
+    """Recompress the gzip file `src` into `dst` by independent blocks of
+    `block_size` bytes, and write the index of the blocks"""
+    def write(stream):
+        offsets, size = [0], 0
+        while True:
+            block = source.read(block_size)
+            if not block:
+                break
+            compressor = zlib.compressobj(level, zlib.DEFLATED, GZIP_WBITS)
+            stream.write(compressor.compress(block) + compressor.flush())
+            offsets.append(stream.tell())
+            size += len(block)
+        return {'block_size': block_size, 'size': size, 'offsets': offsets}
+    source = gzip.open(src, 'rb')
+    try:
+        index = atomic_write(dst, write)
+    finally:
+        source.close()
+    atomic_write(dst + INDEX_SUFFIX,
+                  lambda stream: stream.write(json.dumps(index).encode('ascii')))
+
+def convert(root, filepath, uncompressed=False):
+    """Convert the `.nii.gz` file `filepath` of the study directory `root`,
+    return the converted file path relative to `root`"""
+    target = random_access_path(filepath, uncompressed)
+    src, dst = osp.join(root, filepath), osp.join(root, target)
+    if not osp.isdir(osp.dirname(dst)):
+        os.makedirs(osp.dirname(dst))
+    if uncompressed:
+        convert_uncompressed(src, dst)
+    else:
+        convert_chunked(src, dst)
+    return target
+
+def remove_converted(root, filepath):
+    """Remove a converted file of the study directory `root` and its index,
+    if any"""
+    path = osp.normpath(osp.join(root, filepath))
+    # only remove files of the random access directory
+    if not path.startswith(osp.join(osp.normpath(root),
+                                    RANDOM_ACCESS_DIRECTORY, '')):
+        return
+    for path in (path, path + INDEX_SUFFIX):
+        if osp.exists(path):
+            os.remove(path)
+
+
+###############################################################################
+### Readers ###################################################################
+###############################################################################
+class UncompressedReader(object):
+    """Random access to an uncompressed file"""
+
+    def __init__(self, path):
+        self.path = path
+        self.stream = open(path, 'rb')
+
+    def read(self, offset, size):
+        self.stream.seek(offset)
+        return self.stream.read(size)
+
+    def close(self):
+        self.stream.close()
+
+
+class ChunkedReader(object):
+    """Random access to a chunked gzip file, decompressing only the blocks
+    covering the bytes read"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path + INDEX_SUFFIX) as stream:
+            index = json.load(stream)
+        self.block_size = index['block_size']
+        self.offsets = index['offsets']
+        self.stream = open(path, 'rb')
+        self._last = (None, None)
+
+    def block(self, number):
+        if self._last[0] != number:
+            start, end = self.offsets[number], self.offsets[number + 1]
+            self.stream.seek(start)
+            self._last = (number, zlib.decompress(self.stream.read(end - start),
+                                                  GZIP_WBITS))
+        return self._last[1]
+
+    def read(self, offset, size):
+        first = offset // self.block_size
+        last = min((offset + size - 1) // self.block_size,
+                   len(self.offsets) - 2)
+        data = b''.join(self.block(number)
+                        for number in range(first, last + 1))
+        start = offset - first * self.block_size
+        return data[start:start + size]
+
+    def close(self):
+        self.stream.close()
+
+
+class GzipReader(UncompressedReader):
+    """Sequential access to a gzip file, the fallback for files which were
+    not converted"""
+
+    def __init__(self, path):
+        self.path = path
+        self.stream = gzip.open(path, 'rb')
+
+
+def open_image(path):
+    """Return a reader of the image file `path`"""
+    if osp.exists(path + INDEX_SUFFIX):
+        return ChunkedReader(path)
+    if path.endswith('.gz'):
+        return GzipReader(path)
+    return UncompressedReader(path)
+
+def read_header(reader):
+    """Return the shape, voxel size, data type, data offset and scaling of a
+    NIfTI-1 image"""
+    return parse_header(reader.read(0, 348), reader.path)
+
+def parse_header(data, path):
+    """Parse the first 348 bytes of the NIfTI-1 image `path`, see
+    `read_header`"""
+    if len(data) < 348:
+        raise ValueError('%s: truncated NIfTI header' % path)
+    endian = '<'
+    if struct.unpack('<i', data[:4])[0] != 348:
+        endian = '>'
+        if struct.unpack('>i', data[:4])[0] != 348:
+            raise ValueError('%s is not a NIfTI-1 image' % path)
+    dim = struct.unpack(endian + '8h', data[40:56])
+    datatype = struct.unpack(endian + 'h', data[70:72])[0]
+    pixdim = struct.unpack(endian + '8f', data[76:108])
+    vox_offset, slope, inter = struct.unpack(endian + '3f', data[108:120])
+    if datatype not in DATATYPES:
+        raise ValueError('unsupported NIfTI datatype %s' % datatype)
+    ndim = dim[0]
+    return {'shape': dim[1:ndim + 1], 'voxel_size': pixdim[1:ndim + 1],
+            'dtype': endian + DATATYPES[datatype],
+            'vox_offset': int(vox_offset), 'slope': slope, 'inter': inter,
+            'raw': data}
+
+def image_header(path):
+    """Return the header of the image file `path`, see `read_header`"""
+    reader = open_image(path)
+    try:
+        return read_header(reader)
+    finally:
+        reader.close()
+
+def _volume(data, header):
+    import numpy as np
+    volume = np.frombuffer(data, np.dtype(header['dtype']))
+    volume = volume.reshape(tuple(header['shape'][:3]), order='F')
+    volume = volume.astype(np.float32)
+    slope, inter = header['slope'], header['inter']
+    # a null or NaN slope means that data are not scaled (nibabel writes NaN)
+    if not np.isfinite(inter):
+        inter = 0
+    if np.isfinite(slope) and slope != 0 and (slope != 1 or inter):
+        volume = volume * slope + inter
+    return volume
+
+def _volume_size(header):
+    size = 1
+    for dim in header['shape'][:3]:
+        size *= dim
+    # data types are numpy type strings, e.g. '<i2'
+    return size * int(header['dtype'][2:])
+
+def read_volume(path, index=0):
+    """Return the volume `index` of the image file `path` (the image itself
+    for 3D images) as a float32 array, reading only that volume"""
+    reader = open_image(path)
+    try:
+        header = read_header(reader)
+        size = _volume_size(header)
+        data = reader.read(header['vox_offset'] + index * size, size)
+    finally:
+        reader.close()
+    return _volume(data, header)
+
+def iter_volumes(path):
+    """Yield the volumes of the image file `path` in order, as float32
+    arrays; gzip files are only decompressed once"""
+    reader = open_image(path)
+    try:
+        header = read_header(reader)
+        size = _volume_size(header)
+        count = header['shape'][3] if len(header['shape']) > 3 else 1
+        for index in range(count):
+            yield _volume(reader.read(header['vox_offset'] + index * size,
+                                      size), header)
+    finally:
+        reader.close()
+
+def write_volume(path, header, volume):
+    """Write the 3D `volume` as a float32 .nii.gz image, with the geometry
+    of `header` (see `read_header`)"""
+    import numpy as np
+    endian = header['dtype'][0]
+    raw = bytearray(header['raw'])
+    struct.pack_into(endian + '8h', raw, 40, 3, *(tuple(volume.shape)
+                                                  + (1, 1, 1, 1)))
+    struct.pack_into(endian + '2h', raw, 70, 16, 32)
+    struct.pack_into(endian + '3f', raw, 108, 352, 1, 0)
+    data = np.asarray(volume, dtype=endian + 'f4').tobytes(order='F')
+    def write(stream):
+        compressed = gzip.GzipFile(fileobj=stream, mode='wb')
+        compressed.write(bytes(raw) + b'\0' * 4 + data)
+        compressed.close()
+    atomic_write(path, write)
+
+def scan_path(root, filepath, random_access_filepath=None):
+    """Return the absolute path of the file to read for a Scan: its random
+    access version when it exists"""
+    if random_access_filepath:
+        path = osp.join(root, random_access_filepath)
+        if osp.exists(path):
+            return path
+    return osp.join(root, filepath)
+
+
+###############################################################################
+### Stage #####################################################################
+###############################################################################
+def convert_scans(session, scan_types=DEFAULT_TYPES, uncompressed=False):
+    """Convert the files of the Scans of `scan_types`, and record the
+    converted files; return the number of converted files"""
+    updates = []
+    for eid, filepath, current, root in session.execute(
+        'Any X, F, RF, D WHERE X is Scan, X type IN (%s), X filepath F, '
+        'X localizer_random_access_filepath RF, X related_study T, '
+        'T data_filepath D' % ','.join('"%s"' % scan_type
+                                       for scan_type in scan_types)):
+        target = random_access_path(filepath, uncompressed)
+        if current == target and osp.exists(osp.join(root, target)):
+            continue
+        convert(root, filepath, uncompressed)
+        if current and current != target:
+            # other format, or written next to the original file by
+            # previous versions
+            remove_converted(root, current)
+        updates.append({'x': eid, 'f': unicode(target)})
+    # derived data, written without going through hooks: the cached result
+    # sets of scans are outdated once committed
+    session.cnxset['system'].executemany(
+        'UPDATE cw_Scan SET cw_localizer_random_access_filepath=%(f)s '
+        'WHERE cw_eid=%(x)s', updates)
+    if updates:
+        from cubes.localizer.rqlcache import bump_on_commit
+        bump_on_commit(session, 'Scan')
+    session.commit()
+    return len(updates)
+
+
+###############################################################################
+### MAIN ######################################################################
+###############################################################################
+if __name__ == '__main__':
+    args = [arg for arg in sys.argv[4:] if not arg.startswith('--')]
+    scan_types = [unicode(arg) for arg in args] or DEFAULT_TYPES
+    count = convert_scans(session, scan_types,
+                          '--uncompressed' in sys.argv[4:])
+    print '%s converted files' % count
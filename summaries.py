@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+# copyright 2013 CEA (Saclay, FRANCE), all rights reserved.
+# copyright 2013 LOGILAB S.A. (Paris, FRANCE), all rights reserved.
+# contact http://brainomics.cea.fr -- mailto:localizer94@cea.fr
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""cubicweb-localizer subjects summaries
+
+The summary of a subject gathers, in a JSON document stored in its
+`localizer_summary` attribute, its demographics and scores, its center and
+assessments, and the scans, questionnaire runs and genomic measures it is
+concerned by. Summaries are built with a few queries for all subjects at the
+end of the import, and updated by hooks when related entities change (see
+hooks.py), so that subject pages and listings need a single query.
+"""
+
+import json
+
+from cubes.localizer.rqlcache import bump_on_commit
+
+SUMMARY_QUERIES = {
+    'subject': ('Any S, SI, SG, SH WHERE S is Subject, S identifier SI, '
+                'S gender SG, S handedness SH%s'),
+    'scores': ('Any S, DN, V WHERE S is Subject, S related_infos SV, '
+               'SV definition D, D name DN, SV text V%s'),
+    'assessments': ('Any S, A, AI, AG, CN WHERE S is Subject, '
+                    'S concerned_by A, A identifier AI, '
+                    'A age_for_assessment AG, C holds A, C name CN%s'),
+    'scans': ('Any S, X, XI, XT, XL WHERE S is Subject, X concerns S, '
+              'X is Scan, X identifier XI, X type XT, X label XL%s'),
+    'questionnaire_runs': ('Any S, X, XI WHERE S is Subject, X concerns S, '
+                           'X is QuestionnaireRun, X identifier XI%s'),
+    'genomic_measures': ('Any S, X, XI, XT WHERE S is Subject, '
+                         'X concerns S, X is GenomicMeasure, '
+                         'X identifier XI, X type XT%s'),
+}
+
+# rql returning the subjects concerned by an entity, by entity type
+SUBJECTS_OF = {
+    'Subject': 'Any S WHERE S eid %(x)s',
+    'Assessment': 'Any S WHERE S concerned_by X, X eid %(x)s',
+    'ScoreValue': 'Any S WHERE S related_infos X, X eid %(x)s',
+    'Center': 'Any S WHERE S concerned_by A, X holds A, X eid %(x)s',
+    'Scan': 'Any S WHERE X concerns S, X eid %(x)s',
+    'QuestionnaireRun': 'Any S WHERE X concerns S, X eid %(x)s',
+    'GenomicMeasure': 'Any S WHERE X concerns S, X eid %(x)s',
+}
+
+
+def _execute(session, kind, eids):
+    rql = SUMMARY_QUERIES[kind]
+    if eids is None:
+        return session.execute(rql % '')
+    return session.execute(rql % (', S eid IN (%s)'
+                                  % ','.join(str(eid) for eid in eids)))
+
+def build_summaries(session, eids=None):
+    """Return a {subject eid: summary} dictionary for subjects `eids` (all
+    subjects if None)"""
+    summaries = {}
+    for eid, identifier, gender, handedness in _execute(session, 'subject',
+                                                        eids):
+        summaries[eid] = {'eid': eid, 'identifier': identifier,
+                          'gender': gender, 'handedness': handedness,
+                          'scores': {}, 'centers': [], 'assessments': [],
+                          'scans': [], 'questionnaire_runs': [],
+                          'genomic_measures': []}
+    for eid, name, value in _execute(session, 'scores', eids):
+        summaries[eid]['scores'][name] = value
+    for eid, aeid, identifier, age, center in _execute(session, 'assessments',
+                                                       eids):
+        summaries[eid]['assessments'].append(
+            {'eid': aeid, 'identifier': identifier, 'age': age})
+        if center not in summaries[eid]['centers']:
+            summaries[eid]['centers'].append(center)
+    for eid, xeid, identifier, scan_type, label in _execute(session, 'scans',
+                                                            eids):
+        summaries[eid]['scans'].append({'eid': xeid, 'identifier': identifier,
+                                        'type': scan_type, 'label': label})
+    for eid, xeid, identifier in _execute(session, 'questionnaire_runs', eids):
+        summaries[eid]['questionnaire_runs'].append(
+            {'eid': xeid, 'identifier': identifier})
+    for eid, xeid, identifier, gtype in _execute(session, 'genomic_measures',
+                                                 eids):
+        summaries[eid]['genomic_measures'].append(
+            {'eid': xeid, 'identifier': identifier, 'type': gtype})
+    return summaries
+
+def refresh_subject_summaries(session, eids=None):
+    """Store the summaries of subjects `eids` (all subjects if None).
+
+    Summaries are derived data: they are written with a single SQL statement,
+    without going through hooks, the generation of subjects being bumped on
+    commit so that cached result sets are outdated.
+    """
+    summaries = build_summaries(session, eids)
+    session.cnxset['system'].executemany(
+        'UPDATE cw_Subject SET cw_localizer_summary=%(s)s WHERE cw_eid=%(x)s',
+        [{'x': eid, 's': unicode(json.dumps(summary))}
+         for eid, summary in summaries.iteritems()])
+    bump_on_commit(session, 'Subject')
+    return len(summaries)
+
+def subjects_of(session, etype, eid):
+    """Return the eids of the subjects concerned by an entity"""
+    return [row[0] for row in session.execute(SUBJECTS_OF[etype], {'x': eid})]
+
+def load_summary(value):
+    """Return the summary stored in a `localizer_summary` attribute"""
+    return value and json.loads(value) or None
+
+def fetch_summaries(req, eids=None, identifiers=None, cursor=None,
+                    limit=None):
+    """Return a {subject eid: summary} dictionary of the stored summaries of
+    subjects `eids` or of identifiers `identifiers` (all subjects if None),
+    using a single query; subjects whose summary was not computed yet are
+    left out. With `limit`, only the first `limit` subjects following eid
+    `cursor` are returned"""
+    restrictions = ['S is Subject', 'S localizer_summary SU',
+                    'NOT S localizer_summary NULL']
+    args = {}
+    if eids is not None:
+        if not eids:
+            return {}
+        restrictions.append('S eid IN (%s)'
+                            % ','.join(str(int(eid)) for eid in eids))
+    if identifiers is not None:
+        if not identifiers:
+            return {}
+        for index, identifier in enumerate(identifiers):
+            args['i%s' % index] = identifier
+        restrictions.append('S identifier IN (%s)' % ','.join(
+            '%%(i%s)s' % index for index in range(len(identifiers))))
+    if limit is None:
+        rql = 'Any S, SU WHERE %s'
+    else:
+        rql = 'Any S, SU ORDERBY S LIMIT %s WHERE %%s' % int(limit)
+        restrictions.append('S eid > %s' % int(cursor or 0))
+    rql %= ', '.join(restrictions)
+    summaries = ((eid, load_summary(value))
+                 for eid, value in req.execute(rql, args))
+    return dict((eid, summary) for eid, summary in summaries
+                if summary is not None)
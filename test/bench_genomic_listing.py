@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+# copyright 2013 CEA (Saclay, FRANCE), all rights reserved.
+# copyright 2013 LOGILAB S.A. (Paris, FRANCE), all rights reserved.
+# contact http://brainomics.cea.fr -- mailto:localizer94@cea.fr
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""cubicweb-localizer benchmark of the genomic measures listing
+
+Time the listing of genomic measures linked from the index card, whose rows
+are completed, for the anonymous user (whose read permission of the
+restricted filepath attribute is refused), with the attributes to complete
+memoized per request and with the completion of CubicWeb. Timings are
+logged, the number of permission checks is compared. Run with::
+
+    python test/bench_genomic_listing.py
+"""
+
+import logging
+from time import time
+
+from cubicweb.devtools import testlib
+
+from cubes.brainomics.entities import BrainomicsGenomicMeasure
+
+from cubes.localizer.entities import LocalizerGenomicMeasure
+from cubes.localizer.warmstart import GENETICS_RQL
+
+NB_MEASURES = 500
+LOGGER = logging.getLogger('cubes.localizer.bench')
+
+
+class GenomicListingBenchmarkTC(testlib.CubicWebTC):
+
+    def setup_database(self):
+        req = self.request()
+        for i in xrange(NB_MEASURES):
+            req.create_entity('GenomicMeasure',
+                              identifier=u'genomic_measure_%s' % i,
+                              type=u'SNP', format=u'plink',
+                              filepath=u'genetics/Localizer94.bed')
+
+    def _time_listing(self):
+        """Return the number of rows, the number of permission checks and the
+        time to view the card listing as the anonymous user"""
+        self.login('anon')
+        try:
+            req = self.request()
+            checks = []
+            matching_groups = req.user.matching_groups
+            def counted_matching_groups(groups):
+                checks.append(groups)
+                return matching_groups(groups)
+            req.user.matching_groups = counted_matching_groups
+            rset = req.execute(GENETICS_RQL)
+            start = time()
+            self.view('table', rset, req=req)
+            return len(rset), len(checks), time() - start
+        finally:
+            self.restore_connection()
+
+    def test_listing(self):
+        rows, memoized_checks, memoized = self._time_listing()
+        to_complete = LocalizerGenomicMeasure._cw_to_complete_attributes
+        LocalizerGenomicMeasure._cw_to_complete_attributes = \
+            BrainomicsGenomicMeasure._cw_to_complete_attributes.im_func
+        try:
+            baseline_rows, baseline_checks, baseline = self._time_listing()
+        finally:
+            LocalizerGenomicMeasure._cw_to_complete_attributes = to_complete
+        LOGGER.info('%s genomic measures listed by the anonymous user: '
+                    '%.3fs (%s permission checks) with the memo, %.3fs '
+                    '(%s permission checks) without', NB_MEASURES, memoized,
+                    memoized_checks, baseline, baseline_checks)
+        self.assertEqual(rows, NB_MEASURES)
+        self.assertEqual(baseline_rows, NB_MEASURES)
+        # attribute permissions are checked once per request, not per row
+        self.assertLess(memoized_checks, NB_MEASURES)
+        self.assertGreaterEqual(baseline_checks, NB_MEASURES)
+        self.assertLess(memoized, baseline)
+
+if __name__ == '__main__':
+    from logilab.common.testlib import unittest_main
+    unittest_main()
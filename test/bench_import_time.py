@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+# copyright 2013 CEA (Saclay, FRANCE), all rights reserved.
+# copyright 2013 LOGILAB S.A. (Paris, FRANCE), all rights reserved.
+# contact http://brainomics.cea.fr -- mailto:localizer94@cea.fr
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""cubicweb-localizer benchmark of the importer import time
+
+Importing the metadata part of the importer (mappings, study, subjects...)
+must not import nibabel and its numpy/scipy dependencies, which make most of
+its import time. The modules loaded by the import are checked, and its
+duration is compared with the import of nibabel, the best of `RUNS` imports
+in fresh interpreters being kept: it must not exceed `MAX_RATIO` times the
+nibabel one, which may be overridden by the `LOCALIZER_BENCH_IMPORT_RATIO`
+environment variable. Run with::
+
+    python test/bench_import_time.py
+"""
+
+import os
+import sys
+import logging
+import subprocess
+
+from logilab.common.testlib import TestCase, unittest_main
+
+METADATA_MODULE = 'cubes.localizer.importers.localizer'
+HEAVY_MODULES = ('nibabel', 'numpy', 'scipy')
+RUNS = 5
+# largest ratio of the metadata import time to the nibabel one, measured in
+# the same run as baseline
+MAX_RATIO = 0.5
+LOGGER = logging.getLogger('cubes.localizer.bench')
+
+
+def _run(code):
+    cmd = [sys.executable, '-c', code]
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE,
+                               universal_newlines=True)
+    stdout, stderr = process.communicate()
+    if process.returncode:
+        raise RuntimeError('%s failed:\n%s' % (' '.join(cmd), stderr))
+    return stdout
+
+def import_time(module):
+    """Return the best duration of the import of `module` in fresh
+    interpreters, in seconds"""
+    code = ('from time import time; start = time(); import %s; '
+            'print(time() - start)' % module)
+    return min(float(_run(code)) for _ in xrange(RUNS))
+
+
+class ImportTimeBenchmarkTC(TestCase):
+
+    def test_metadata_without_heavy_modules(self):
+        stdout = _run('import sys; import %s; print(" ".join(sorted('
+                         'sys.modules)))' % METADATA_MODULE)
+        loaded = set(stdout.split())
+        for module in HEAVY_MODULES:
+            self.assertNotIn(module, loaded)
+
+    def test_import_time(self):
+        metadata = import_time(METADATA_MODULE)
+        nibabel = import_time('nibabel')
+        LOGGER.info('%s: %.1fms, nibabel: %.1fms', METADATA_MODULE,
+                    1000 * metadata, 1000 * nibabel)
+        # the metadata import must be clearly cheaper than nibabel's alone
+        ratio = float(os.environ.get('LOCALIZER_BENCH_IMPORT_RATIO',
+                                     MAX_RATIO))
+        self.assertLess(metadata, nibabel * ratio)
+
+
+if __name__ == '__main__':
+    unittest_main()
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+# copyright 2013 CEA (Saclay, FRANCE), all rights reserved.
+# copyright 2013 LOGILAB S.A. (Paris, FRANCE), all rights reserved.
+# contact http://brainomics.cea.fr -- mailto:localizer94@cea.fr
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""cubicweb-localizer benchmark of the random access storage formats
+
+Write a synthetic 4D NIfTI image as a single stream `.nii.gz` file, convert
+it to the `uncompressed` and `chunked` formats (see storage.py), and
+log the file sizes and the times to read the header, the first and the
+last volumes. The test checks that reading a volume of a chunked file only
+decompresses the blocks covering it, rather than comparing timings. Run
+with::
+
+    python test/bench_random_access.py
+"""
+
+import os
+import os.path as osp
+import gzip
+import logging
+import struct
+import shutil
+import tempfile
+from time import time
+
+import numpy as np
+
+from logilab.common.testlib import TestCase, unittest_main
+
+from cubes.localizer import storage
+
+SHAPE = (64, 64, 40, 100)
+REPEAT = 5
+LOGGER = logging.getLogger('cubes.localizer.bench')
+
+
+def write_image(path, shape=SHAPE):
+    """Write a NIfTI-1 image of int16 smooth noise, compressible as real
+    images are"""
+    rng = np.random.RandomState(0)
+    data = np.cumsum(rng.randint(-3, 4, size=shape), axis=0).astype('<i2')
+    header = bytearray(352)
+    struct.pack_into('<i', header, 0, 348)
+    struct.pack_into('<8h', header, 40, len(shape),
+                     *(shape + (1,) * (7 - len(shape))))
+    struct.pack_into('<2h', header, 70, 4, 16)
+    struct.pack_into('<8f', header, 76, 1, 3, 3, 3, 2.4, 0, 0, 0)
+    struct.pack_into('<3f', header, 108, 352, 1, 0)
+    stream = gzip.open(path, 'wb')
+    try:
+        stream.write(bytes(header) + data.tobytes(order='F'))
+    finally:
+        stream.close()
+    return data
+
+class CountingChunkedReader(storage.ChunkedReader):
+    """Chunked reader counting the blocks it decompresses"""
+    decompressed = 0
+
+    def block(self, number):
+        if self._last[0] != number:
+            self.decompressed += 1
+        return storage.ChunkedReader.block(self, number)
+
+def best_time(func, *args):
+    times = []
+    for _ in range(REPEAT):
+        start = time()
+        func(*args)
+        times.append(time() - start)
+    return min(times)
+
+
+class RandomAccessBenchmarkTC(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.original = osp.join(self.directory, 'bold.nii.gz')
+        self.data = write_image(self.original)
+        self.paths = [('gzip', self.original)]
+        for name, uncompressed in (('uncompressed', True), ('chunked', False)):
+            self.paths.append((name, osp.join(self.directory, storage.convert(
+                self.directory, 'bold.nii.gz', uncompressed))))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_formats(self):
+        last = SHAPE[-1] - 1
+        for name, path in self.paths:
+            np.testing.assert_array_equal(storage.read_volume(path, last),
+                                          self.data[..., last])
+            times = [best_time(storage.image_header, path),
+                     best_time(storage.read_volume, path, 0),
+                     best_time(storage.read_volume, path, last)]
+            LOGGER.info('%s: %.1fMB, header %.2fms, volume 0 %.2fms, '
+                        'volume %s %.2fms', name, os.stat(path).st_size / 1e6,
+                        1000 * times[0], 1000 * times[1], last,
+                        1000 * times[2])
+
+    def test_chunked_blocks(self):
+        reader = CountingChunkedReader(dict(self.paths)['chunked'])
+        try:
+            header = storage.read_header(reader)
+            size = storage._volume_size(header)
+            reader.read(header['vox_offset'] + (SHAPE[-1] - 1) * size, size)
+        finally:
+            reader.close()
+        # the header block, and the blocks covering the last volume
+        self.assertLessEqual(reader.decompressed,
+                             size // reader.block_size + 3)
+        self.assertLess(reader.decompressed, len(reader.offsets) - 1)
+
+if __name__ == '__main__':
+    unittest_main()
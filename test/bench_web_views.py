@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+# copyright 2013 CEA (Saclay, FRANCE), all rights reserved.
+# copyright 2013 LOGILAB S.A. (Paris, FRANCE), all rights reserved.
+# contact http://brainomics.cea.fr -- mailto:localizer94@cea.fr
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""cubicweb-localizer load test of the web views
+
+Start a test instance served over HTTP, populated with a synthetic dataset
+built through the metadata part of the importer (`import_subject`,
+`import_center`, `import_assessment` on generated `subject.json` files),
+and request with concurrent clients:
+
+* the index page (`LocalizerIndexView`);
+* the static pages rewritten from short urls (`LocalizeCardView`);
+* the Scan listing linked from the index card;
+* a Scan page, displaying the zip download box.
+
+For each page, the p50/p95/p99 latencies, the throughput and the number of
+SQL queries per request are logged, and the test fails when the p95 latency
+or the number of queries exceeds its baseline by more than `MARGIN`. The
+baselines are the measures of the first run on the machine, stored in
+`BASELINE_PATH` (`LOCALIZER_BENCH_BASELINE` environment variable), or the
+generous `THRESHOLDS` until then; a new baseline is recorded by removing
+the file. The margin (`LOCALIZER_BENCH_MARGIN`) and the latency threshold
+of a page (e.g. `LOCALIZER_BENCH_P95_SCANS_LISTING=1.5`) may be overridden
+by environment variables. Run with::
+
+    python test/bench_web_views.py
+"""
+
+import os
+import os.path as osp
+import json
+import shutil
+import logging
+import tempfile
+import threading
+import urllib2
+from time import time
+from multiprocessing.pool import ThreadPool
+
+from cubicweb.devtools.httptest import CubicWebServerTC
+
+from cubes.localizer.importers.localizer import (
+    SCORE_TYPES, import_assessment, import_center, import_subject)
+from cubes.localizer.views.urls import CARD_PATHS
+from cubes.localizer.warmstart import CARD_RQLS
+
+NB_SUBJECTS = 50
+SCAN_TYPES = ((u'raw T1', u'raw anatomy'), (u'normalized T1', u'anatomy'),
+              (u'raw fMRI', u'raw bold'), (u'preprocessed fMRI', u'bold'))
+CLIENTS = 8
+REQUESTS = 200
+# page: (p95 latency in seconds, SQL queries per request) without baseline
+THRESHOLDS = {
+    'index': (2., 20),
+    'static pages': (2., 20),
+    'scans listing': (8., 50),
+    'scan page': (4., 100),
+}
+BASELINE_PATH = os.environ.get(
+    'LOCALIZER_BENCH_BASELINE',
+    osp.join(osp.dirname(osp.abspath(__file__)), 'data',
+             'bench-web-views-baseline.json'))
+MARGIN = float(os.environ.get('LOCALIZER_BENCH_MARGIN', 1.5))
+LOGGER = logging.getLogger('cubes.localizer.bench')
+
+
+def load_baseline():
+    """Return the {page: (p95 latency, queries)} baseline measures, empty
+    if none were recorded"""
+    try:
+        with open(BASELINE_PATH) as stream:
+            return dict((page, tuple(measures))
+                        for page, measures in json.load(stream).items())
+    except IOError:
+        return {}
+
+def thresholds(page, baseline):
+    """Return the p95 latency and queries thresholds of a page: its baseline
+    measures with a margin, the p95 one being overridden by a
+    LOCALIZER_BENCH_P95_<PAGE> environment variable"""
+    if page in baseline:
+        p95, queries = [MARGIN * measure for measure in baseline[page]]
+    else:
+        p95, queries = THRESHOLDS[page]
+    variable = 'LOCALIZER_BENCH_P95_%s' % page.upper().replace(' ', '_')
+    return float(os.environ.get(variable, p95)), queries
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100.))]
+
+
+class QueryCounter(object):
+    """Count the SQL statements executed by the system source"""
+
+    def __init__(self, source):
+        self.source = source
+        self.count = 0
+        self._lock = threading.Lock()
+        self._originals = {}
+
+    def _wrap(self, name):
+        original = self._originals[name] = getattr(self.source, name)
+        def wrapper(*args, **kwargs):
+            with self._lock:
+                self.count += 1
+            return original(*args, **kwargs)
+        setattr(self.source, name, wrapper)
+
+    def __enter__(self):
+        self.count = 0
+        for name in ('doexec', 'doexecmany'):
+            self._wrap(name)
+        return self
+
+    def __exit__(self, *exc):
+        for name, original in self._originals.items():
+            setattr(self.source, name, original)
+
+
+class WebViewsBenchmarkTC(CubicWebServerTC):
+
+    def setup_database(self):
+        req = self.request()
+        datadir = tempfile.mkdtemp()
+        try:
+            study = req.create_entity('Study', name=u'localizer',
+                                      description=u'localizer db',
+                                      data_filepath=unicode(datadir))
+            centers = {}
+            for i in xrange(NB_SUBJECTS):
+                self._create_subject(req, study, centers,
+                                     self._subject_dir(datadir, i))
+        finally:
+            shutil.rmtree(datadir)
+
+    def _subject_dir(self, datadir, i):
+        path = osp.join(datadir, 'S%03d' % i)
+        info = {'nip': u'S%03d' % i, 'age': 20 + i % 30,
+                'sex': str(1 + i % 2), 'laterality': 'Right handed',
+                'site': u'Neurospin' if i % 3 else u'SHFJ',
+                'protocol': u'localizer', 'exam': u'E%03d' % i,
+                'date': u'2010-01-01 10:00:00'}
+        for j, score in enumerate(SCORE_TYPES):
+            info[score] = u'%s' % ((i + j) % 2)
+        os.makedirs(path)
+        with open(osp.join(path, 'subject.json'), 'w') as stream:
+            json.dump(info, stream)
+        return path
+
+    def _create_subject(self, req, study, centers, path):
+        subject, age, scores = import_subject(path)
+        subject = req.create_entity('Subject', **subject)
+        center = import_center(path)
+        if center['identifier'] not in centers:
+            centers[center['identifier']] = req.create_entity('Center',
+                                                              **center)
+        assessment = import_assessment(path, age, 'anat', study.eid)
+        assessment = req.create_entity('Assessment', **assessment)
+        centers[center['identifier']].cw_set(holds=assessment)
+        subject.cw_set(concerned_by=assessment)
+        for scan_type, label in SCAN_TYPES:
+            mri = req.create_entity('MRIData', sequence=u'T1')
+            scan = req.create_entity(
+                'Scan', identifier=u'%s_%s' % (subject.identifier, label),
+                label=label, type=scan_type, format=u'nii.gz',
+                filepath=u'%s/%s.nii.gz' % (subject.identifier, label),
+                has_data=mri, related_study=study, concerns=subject)
+            assessment.cw_set(generates=scan)
+
+    def _pages(self):
+        scans_rql = dict((name, rql)
+                         for name, rql, _ in CARD_RQLS)['images-url']
+        scan_eid = self.execute('Any X LIMIT 1 WHERE X is Scan')[0][0]
+        return (('index', ['']),
+                ('static pages', list(CARD_PATHS)),
+                ('scans listing', ['view?rql=%s' % urllib2.quote(scans_rql)]),
+                ('scan page', [str(scan_eid)]))
+
+    def _load(self, paths):
+        """Request `paths` in turn with concurrent clients, return the
+        latencies and the total time"""
+        base_url = self.config['base-url']
+        def fetch(index):
+            start = time()
+            urllib2.urlopen(base_url + paths[index % len(paths)]).read()
+            return time() - start
+        pool = ThreadPool(CLIENTS)
+        try:
+            # warm up caches before measuring
+            pool.map(fetch, range(CLIENTS))
+            start = time()
+            latencies = pool.map(fetch, range(REQUESTS))
+            return latencies, time() - start
+        finally:
+            pool.close()
+            pool.join()
+
+    def test_views(self):
+        baseline = load_baseline()
+        measures, failures = {}, []
+        LOGGER.info('%-15s %8s %8s %8s %10s %10s', 'page', 'p50', 'p95',
+                    'p99', 'req/s', 'queries')
+        for name, paths in self._pages():
+            with QueryCounter(self.repo.system_source) as counter:
+                latencies, duration = self._load(paths)
+            queries = counter.count / float(REQUESTS + CLIENTS)
+            p95 = percentile(latencies, 95)
+            LOGGER.info('%-15s %7.0fms %7.0fms %7.0fms %10.1f %10.1f', name,
+                        1000 * percentile(latencies, 50), 1000 * p95,
+                        1000 * percentile(latencies, 99), REQUESTS / duration,
+                        queries)
+            measures[name] = (p95, queries)
+            max_p95, max_queries = thresholds(name, baseline)
+            if p95 > max_p95:
+                failures.append('%s: p95 %.3fs > %.3fs'
+                                % (name, p95, max_p95))
+            if queries > max_queries:
+                failures.append('%s: %.1f queries per request > %.1f'
+                                % (name, queries, max_queries))
+        if not baseline and not failures:
+            with open(BASELINE_PATH, 'w') as stream:
+                json.dump(measures, stream, indent=2, sort_keys=True)
+            LOGGER.info('baseline recorded in %s', BASELINE_PATH)
+        self.assertFalse(failures, '\n'.join(failures))
+
+
+if __name__ == '__main__':
+    from logilab.common.testlib import unittest_main
+    unittest_main()
@@ -0,0 +1,42 @@
+# copyright 2013 CEA (Saclay, FRANCE), all rights reserved.
+# copyright 2013 LOGILAB S.A. (Paris, FRANCE), all rights reserved.
+# contact http://brainomics.cea.fr -- mailto:localizer94@cea.fr
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""cubicweb-localizer test fixtures standing for the instance configuration
+and a repository session, for the functions run by shell scripts"""
+
+
+class FakeConfig(dict):
+    appdatahome = None
+
+    def __init__(self, cache_dir):
+        super(FakeConfig, self).__init__({'localizer-cache-dir': cache_dir})
+
+
+class FakeRepo(object):
+
+    def __init__(self, config):
+        self.config = config
+
+
+class FakeSession(object):
+    """Session whose `execute` answers the queries of the tested function"""
+
+    def __init__(self, config):
+        self.repo = FakeRepo(config)
+
+    def execute(self, rql, args=None):
+        raise NotImplementedError(rql)
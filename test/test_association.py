@@ -0,0 +1,177 @@
+# copyright 2013 CEA (Saclay, FRANCE), all rights reserved.
+# copyright 2013 LOGILAB S.A. (Paris, FRANCE), all rights reserved.
+# contact http://brainomics.cea.fr -- mailto:localizer94@cea.fr
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""cubicweb-localizer tests of the genotype-phenotype association scan"""
+
+import os.path as osp
+import shutil
+import tempfile
+
+import numpy as np
+from scipy import stats
+
+from logilab.common.testlib import TestCase, unittest_main
+
+from cubicweb.web import RequestError
+
+from cubes.localizer.association import (
+    linear_test, logistic_test, association_scan)
+from cubes.localizer.genotypes import BedFile
+
+from helpers import FakeConfig, FakeSession
+
+# number of copies of A1 -> 2 bits code of the .bed format
+BED_CODES = {2: 0, -1: 1, 1: 2, 0: 3}
+
+
+def plink_files(basepath, subjects, snps, genotypes):
+    """Write the (subjects x SNPs) `genotypes` matrix as a SNP-major PLINK
+    .bed file, with its .bim and .fam companions"""
+    with open(basepath + '.fam', 'w') as stream:
+        for subject in subjects:
+            stream.write('FAM %s 0 0 1 -9\n' % subject)
+    with open(basepath + '.bim', 'w') as stream:
+        for position, snp in enumerate(snps):
+            stream.write('1 %s 0 %s A G\n' % (snp, position + 1))
+    with open(basepath + '.bed', 'wb') as stream:
+        stream.write(b'\x6c\x1b\x01')
+        for column in np.asarray(genotypes).T:
+            record = bytearray((len(subjects) + 3) // 4)
+            for row, genotype in enumerate(column):
+                record[row // 4] |= BED_CODES[int(genotype)] << (2 * (row % 4))
+            stream.write(bytes(record))
+
+
+class AssociationSession(FakeSession):
+    """Answer the genomic measures and phenotype queries of
+    `association_scan`"""
+
+    def __init__(self, config, studies, values):
+        super(AssociationSession, self).__init__(config)
+        self.studies = studies
+        self.values = values
+
+    def execute(self, rql, args=None):
+        if 'GenomicMeasure' in rql:
+            return [(study, osp.basename(path), osp.dirname(path), subject)
+                    for study, (path, subjects) in self.studies.items()
+                    for subject in subjects]
+        return sorted(self.values.items())
+
+
+class StatisticsTC(TestCase):
+
+    def test_linear(self):
+        genotypes = np.random.RandomState(0).randint(-1, 3, (30, 6))
+        phenotype = np.random.RandomState(1).normal(size=30)
+        phenotype[:10] += genotypes[:10, 0]
+        t, pvalue, n = linear_test(genotypes.astype(np.int8), phenotype)
+        for snp in range(6):
+            known = genotypes[:, snp] >= 0
+            expected = stats.linregress(genotypes[known, snp],
+                                        phenotype[known])
+            self.assertEqual(n[snp], known.sum())
+            self.assertAlmostEqual(pvalue[snp], expected.pvalue, 10)
+            self.assertAlmostEqual(
+                t[snp], expected.slope / expected.stderr, 8)
+
+    def test_logistic(self):
+        genotypes = np.array([[0, 0], [1, -1], [2, 2], [2, 1]], dtype=np.int8)
+        phenotype = np.array([0., 0., 1., 1.])
+        chi2, pvalue, n = logistic_test(genotypes, phenotype)
+        # first SNP: sum((g - 1.25) * (y - 0.5))**2 = 1.5**2,
+        # ybar * (1 - ybar) * sum((g - 1.25)**2) = 0.25 * 2.75
+        self.assertAlmostEqual(chi2[0], 36. / 11, 10)
+        self.assertAlmostEqual(pvalue[0], stats.chi2.sf(36. / 11, 1), 10)
+        # second SNP, without the missing genotype: g = (0, 2, 1), y = (0, 1,
+        # 1), sum((g - 1) * (y - 2/3))**2 = 1, 2/9 * sum((g - 1)**2) = 4/9
+        self.assertAlmostEqual(chi2[1], 9. / 4, 10)
+        np.testing.assert_array_equal(n, [4, 3])
+
+
+class AssociationScanTC(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.config = FakeConfig(osp.join(self.tmpdir, 'cache'))
+        random = np.random.RandomState(0)
+        self.genotypes = {}
+        studies = {}
+        for study, subjects in ((1, ['S%s' % i for i in range(9)]),
+                                (2, ['T%s' % i for i in range(7)])):
+            basepath = osp.join(self.tmpdir, 'study%s' % study)
+            genotypes = random.randint(0, 3, (len(subjects), 5))
+            plink_files(basepath, subjects, ['rs%s' % i for i in range(5)],
+                        genotypes)
+            self.genotypes[study] = genotypes
+            studies[study] = (basepath + '.bed', subjects)
+        self.studies = studies
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def scan(self, values, model=None):
+        session = AssociationSession(self.config, self.studies, values)
+        return association_scan(session, 'score:test', model, 1)
+
+    def test_linear_by_study(self):
+        values = dict(('S%s' % i, float(i)) for i in range(9))
+        values.update(('T%s' % i, float(i * i)) for i in range(7))
+        paths = self.scan(values)
+        self.assertEqual(sorted(paths), [1, 2])
+        for study, phenotype in ((1, np.arange(9.)), (2, np.arange(7.) ** 2)):
+            results = np.load(paths[study])
+            self.assertEqual(str(results['model']), 'linear')
+            self.assertEqual(list(results['snps']),
+                             BedFile(self.studies[study][0]).snps)
+            for snp in range(5):
+                expected = stats.linregress(self.genotypes[study][:, snp],
+                                            phenotype)
+                self.assertAlmostEqual(results['pvalue'][snp],
+                                       expected.pvalue, 10)
+        # results are cached until the phenotype values change
+        self.assertEqual(self.scan(values), paths)
+        values['S0'] = 10.
+        self.assertNotEqual(self.scan(values)[1], paths[1])
+
+    def test_logistic(self):
+        values = dict(('S%s' % i, float(i % 2)) for i in range(9))
+        # a single value in the second study, which is not scanned
+        values['T0'] = 1.
+        paths = self.scan(values)
+        self.assertEqual(list(paths), [1])
+        results = np.load(paths[1])
+        self.assertEqual(str(results['model']), 'logistic')
+        expected = logistic_test(self.genotypes[1].astype(np.int8),
+                                 np.arange(9) % 2.)
+        np.testing.assert_allclose(results['statistic'], expected[0])
+
+    def test_invalid_phenotypes(self):
+        self.assertRaises(ValueError, self.scan, {})
+        self.assertRaises(ValueError, self.scan, {'S0': 1., 'S1': 1.})
+        self.assertRaises(ValueError, self.scan, {'S0': 1., 'S1': 2.},
+                          'probit')
+
+    def test_malformed_phenotypes(self):
+        session = AssociationSession(self.config, self.studies, {})
+        for phenotype in ('language', 'score:', 'age:42'):
+            self.assertRaises(RequestError, association_scan, session,
+                              phenotype)
+
+
+if __name__ == '__main__':
+    unittest_main()
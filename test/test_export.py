@@ -0,0 +1,163 @@
+# copyright 2013 CEA (Saclay, FRANCE), all rights reserved.
+# copyright 2013 LOGILAB S.A. (Paris, FRANCE), all rights reserved.
+# contact http://brainomics.cea.fr -- mailto:localizer94@cea.fr
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program. If not, see <http://www.gnu.org/licenses/>.
+
+
+"""cubicweb-localizer tests of the export of the dataset"""
+
+import os
+import os.path as osp
+import csv
+import json
+import shutil
+import tempfile
+
+from logilab.common.testlib import TestCase, unittest_main
+
+from cubes.localizer import export
+from cubes.localizer.export import ASSESSMENT_ATTRIBUTES, export_dataset, link
+
+from helpers import FakeConfig, FakeSession
+
+
+class FakeRelationSchema(object):
+
+    def __init__(self, rtype):
+        self.type = rtype
+
+
+class FakeEntitySchema(object):
+
+    def __init__(self, attributes):
+        self.attributes = attributes
+
+    def attribute_definitions(self):
+        return [(FakeRelationSchema(attr), None) for attr in self.attributes]
+
+
+class ExportSession(FakeSession):
+    """Answer the subjects and scans queries of `export_dataset`, scans being
+    (type, label, filepath, subject identifier) tuples"""
+
+    def __init__(self, root, subjects, scans):
+        super(ExportSession, self).__init__(FakeConfig(None))
+        self.repo.schema = {'MRIData': FakeEntitySchema(['sequence'])}
+        self.root = root
+        self.subjects = subjects
+        self.scans = scans
+
+    def execute(self, rql, args=None):
+        if rql.startswith('Any SI, SG, SH'):
+            return [(identifier, u'male', u'right')
+                    for identifier in self.subjects]
+        assessment = (u'A0', u'localizer', 25, None, None)
+        assert len(assessment) == len(ASSESSMENT_ATTRIBUTES)
+        return [scan + (self.root, u'T1') + assessment for scan in self.scans]
+
+
+class ExportTC(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.root = osp.join(self.tmpdir, 'data')
+        self.destination = osp.join(self.tmpdir, 'export')
+        os.makedirs(self.root)
+        for name in ('anat.nii.gz', 'cmap.nii.gz'):
+            with open(osp.join(self.root, name), 'wb') as stream:
+                stream.write(name)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def session(self, subjects=(u'S1',), scans=None):
+        if scans is None:
+            scans = [(u'raw T1', u'raw anatomy', u'anat.nii.gz', u'S1'),
+                     (u'c map', u'audio - video', u'cmap.nii.gz', u'S1')]
+        return ExportSession(self.root, subjects, scans)
+
+    def test_layout(self):
+        report = export_dataset(self.session(), self.destination,
+                                ('hardlink',))
+        self.assertEqual(report, {'hardlink': 2})
+        anat = osp.join(self.destination, 'sub-S1', 'anat',
+                        'sub-S1_T1w.nii.gz')
+        self.assertEqual(os.stat(anat).st_ino,
+                         os.stat(osp.join(self.root, 'anat.nii.gz')).st_ino)
+        cmap = osp.join(self.destination, 'derivatives', 'contrasts',
+                        'sub-S1', 'func', 'sub-S1_task-localizer_contrast-'
+                        'AudioVideo_stat-effect_statmap.nii.gz')
+        self.assertTrue(osp.exists(cmap))
+        with open(cmap[:-len('.nii.gz')] + '.json') as stream:
+            sidecar = json.load(stream)
+        self.assertEqual(sidecar['sequence'], u'T1')
+        self.assertEqual(sidecar['age_for_assessment'], 25)
+        self.assertEqual(sidecar['Label'], u'audio - video')
+        self.assertNotIn('datetime', sidecar)
+        with open(osp.join(self.destination, 'participants.tsv')) as stream:
+            rows = list(csv.reader(stream, delimiter='\t'))
+        self.assertEqual(rows, [['participant_id', 'sex', 'handedness'],
+                                ['sub-S1', 'male', 'right']])
+        # files are only processed once
+        report = export_dataset(self.session(), self.destination,
+                                ('hardlink',))
+        self.assertEqual(report, {'existing': 2})
+
+    def test_copy(self):
+        report = export_dataset(self.session(), self.destination, ())
+        self.assertEqual(report, {'copy': 2})
+        anat = osp.join(self.destination, 'sub-S1', 'anat',
+                        'sub-S1_T1w.nii.gz')
+        self.assertFalse(osp.islink(anat))
+        self.assertNotEqual(os.stat(anat).st_ino,
+                            os.stat(osp.join(self.root, 'anat.nii.gz')).st_ino)
+        with open(anat, 'rb') as stream:
+            self.assertEqual(stream.read(), 'anat.nii.gz')
+
+    def test_link_fallback(self):
+        src = osp.join(self.root, 'anat.nii.gz')
+        def failing(src, dst):
+            raise OSError('not supported')
+        methods = dict(export.LINK_METHODS, failing=failing)
+        original = export.LINK_METHODS
+        export.LINK_METHODS = methods
+        try:
+            dst = osp.join(self.tmpdir, 'symlink.nii.gz')
+            self.assertEqual(link(src, dst, ('failing', 'symlink')),
+                             'symlink')
+            self.assertEqual(os.readlink(dst), src)
+            dst = osp.join(self.tmpdir, 'copied.nii.gz')
+            self.assertEqual(link(src, dst, ('failing',)), None)
+            self.assertFalse(osp.lexists(dst))
+        finally:
+            export.LINK_METHODS = original
+
+    def test_subject_collision(self):
+        session = self.session(subjects=(u'S-1', u'S1'))
+        self.assertRaises(ValueError, export_dataset, session,
+                          self.destination)
+        self.assertFalse(osp.exists(osp.join(self.destination,
+                                             'participants.tsv')))
+
+    def test_contrast_collision(self):
+        scans = [(u'c map', u'audio - video', u'anat.nii.gz', u'S1'),
+                 (u'c map', u'audio video', u'cmap.nii.gz', u'S1')]
+        self.assertRaises(ValueError, export_dataset,
+                          self.session(scans=scans), self.destination)
+        self.assertFalse(osp.exists(osp.join(self.destination, 'derivatives')))
+
+
+if __name__ == '__main__':
+    unittest_main()
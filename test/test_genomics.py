@@ -0,0 +1,45 @@
+# copyright 2013 CEA (Saclay, FRANCE), all rights reserved.
+# copyright 2013 LOGILAB S.A. (Paris, FRANCE), all rights reserved.
+# contact http://brainomics.cea.fr -- mailto:localizer94@cea.fr
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""cubicweb-localizer tests of the assignment of SNPs to genes"""
+
+from logilab.common.testlib import TestCase, unittest_main
+
+from cubes.localizer.importers.localizer.genomics import (
+    assign_snps_to_genes, snps_in_genes)
+
+
+class SnpsInGenesTC(TestCase):
+
+    def test_assign(self):
+        genes = [(1, 100, 200), (1, 150, 400), (2, 100, 200)]
+        snps = [(1, 50), (1, 160), (1, 300), (2, 160), (3, 160)]
+        pairs = sorted(zip(*assign_snps_to_genes(genes, snps, chunksize=2)))
+        self.assertEqual(pairs, [(1, 0), (1, 1), (2, 1), (3, 2)])
+
+    def test_same_gene_records(self):
+        # two overlapping records (transcripts) of one gene, sharing its eid
+        genes = [(1, 100, 300), (1, 150, 400)]
+        gene_eids = [10, 10]
+        snps = [(1, 120), (1, 200), (1, 350)]
+        snp_eids = [20, 21, 22]
+        self.assertEqual(snps_in_genes(genes, snps, gene_eids, snp_eids),
+                         [(20, 10), (21, 10), (22, 10)])
+
+
+if __name__ == '__main__':
+    unittest_main()
@@ -0,0 +1,98 @@
+# copyright 2013 CEA (Saclay, FRANCE), all rights reserved.
+# copyright 2013 LOGILAB S.A. (Paris, FRANCE), all rights reserved.
+# contact http://brainomics.cea.fr -- mailto:localizer94@cea.fr
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""cubicweb-localizer tests of the first-level contrasts"""
+
+import os.path as osp
+import json
+import shutil
+import tempfile
+
+import numpy as np
+
+from logilab.common.testlib import TestCase, unittest_main
+
+from cubes.localizer.glm import fit_subject, glm_contrast
+from cubes.localizer.storage import read_volume
+
+from test_storage import nifti_image
+
+N_SCANS = 40
+EFFECT = 3.
+
+
+def design_matrix():
+    """Return a block design and a constant regressor"""
+    block = (np.arange(N_SCANS) // 5) % 2
+    return np.column_stack((block, np.ones(N_SCANS)))
+
+
+class GLMContrastTC(TestCase):
+
+    def test_known_effect(self):
+        design = design_matrix()
+        noise = np.random.RandomState(0).normal(0, 0.1, (N_SCANS, 50))
+        timeseries = EFFECT * design[:, :1] + 10 + noise
+        effect, tstat, dof = glm_contrast(timeseries, design,
+                                          np.array([1., 0.]), chunk=16)
+        self.assertEqual(dof, N_SCANS - 2)
+        np.testing.assert_allclose(effect, EFFECT, atol=0.1)
+        self.assertTrue((tstat > 50).all())
+
+
+class FitSubjectTC(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.design_path = osp.join(self.tmpdir, 'design_matrix.json')
+        with open(self.design_path, 'w') as stream:
+            json.dump(design_matrix().tolist(), stream)
+        self.bold_path = osp.join(self.tmpdir, 'bold.nii')
+        self.mask_path = osp.join(self.tmpdir, 'mask.nii')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def fit(self):
+        return fit_subject(('S1', self.bold_path, self.bold_path, 'checksum',
+                            self.mask_path, self.design_path, [1],
+                            osp.join(self.tmpdir, 'contrasts')))
+
+    def test_effect_map(self):
+        mask = np.ones((2, 3, 4), dtype=np.int16)
+        mask[0, 0, 0] = 0
+        nifti_image(self.mask_path, mask)
+        bold = EFFECT * design_matrix()[:, 0] + 10
+        nifti_image(self.bold_path, np.tile(
+            bold.astype(np.float32), (2, 3, 4, 1)))
+        subject, status, outdir = self.fit()
+        self.assertEqual(status, 'done')
+        effect = read_volume(osp.join(outdir, 'effect.nii.gz'))
+        np.testing.assert_allclose(effect[mask > 0], EFFECT, rtol=1e-5)
+        self.assertEqual(effect[0, 0, 0], 0)
+
+    def test_empty_mask(self):
+        nifti_image(self.mask_path, np.zeros((2, 3, 4), dtype=np.int16))
+        nifti_image(self.bold_path, np.zeros((2, 3, 4, N_SCANS),
+                                             dtype=np.float32))
+        subject, status, outdir = self.fit()
+        self.assertTrue(status.startswith('error: empty mask'), status)
+        self.assertEqual(outdir, None)
+
+
+if __name__ == '__main__':
+    unittest_main()
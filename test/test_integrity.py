@@ -0,0 +1,92 @@
+# copyright 2013 CEA (Saclay, FRANCE), all rights reserved.
+# copyright 2013 LOGILAB S.A. (Paris, FRANCE), all rights reserved.
+# contact http://brainomics.cea.fr -- mailto:localizer94@cea.fr
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""cubicweb-localizer tests of the integrity check of the imaging files"""
+
+import os
+import os.path as osp
+import shutil
+import tempfile
+
+import numpy as np
+
+from logilab.common.testlib import TestCase, unittest_main
+
+from cubes.localizer.integrity import (
+    verify_tree, failures, load_results, save_results)
+
+from test_storage import gzipped_nifti_image
+
+GOOD = osp.join('subjects', 'S1', 'anat', 'good.nii.gz')
+TRUNCATED = osp.join('subjects', 'S1', 'anat', 'truncated.nii.gz')
+WRONG_DIMENSIONS = osp.join('subjects', 'S1', 'c_maps', 'wrong.nii.gz')
+
+
+class VerifyTreeTC(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.root_dir = osp.join(self.tmpdir, 'localizer')
+        self.results_path = osp.join(self.tmpdir, 'integrity.json')
+        self.write_image(GOOD, np.zeros((4, 5, 6), dtype=np.int16))
+        self.write_image(TRUNCATED, np.arange(4 * 5 * 6, dtype=np.int16)
+                         .reshape((4, 5, 6)))
+        path = osp.join(self.root_dir, TRUNCATED)
+        with open(path, 'rb') as stream:
+            data = stream.read()
+        with open(path, 'wb') as stream:
+            stream.write(data[:len(data) // 2])
+        self.write_image(WRONG_DIMENSIONS, np.zeros((4, 5, 6, 2),
+                                                    dtype=np.float32))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write_image(self, relpath, data):
+        gzipped_nifti_image(osp.join(self.root_dir, relpath), data)
+
+    def test_statuses(self):
+        statuses = verify_tree(self.root_dir, self.results_path, 1)
+        self.assertEqual(sorted(statuses),
+                         sorted([GOOD, TRUNCATED, WRONG_DIMENSIONS]))
+        self.assertEqual(statuses[GOOD], 'ok')
+        self.assertTrue(statuses[TRUNCATED].startswith('error'),
+                        statuses[TRUNCATED])
+        self.assertEqual(statuses[WRONG_DIMENSIONS],
+                         'error: 4 dimensions, expected 3')
+        self.assertEqual([relpath for relpath, _ in failures(statuses)],
+                         sorted([TRUNCATED, WRONG_DIMENSIONS]))
+
+    def test_unchanged_files_skipped(self):
+        verify_tree(self.root_dir, self.results_path, 1)
+        # mark the stored results to see which files are checked again
+        results = load_results(self.results_path)
+        for entry in results.values():
+            entry['status'] = 'previous'
+        save_results(self.results_path, results)
+        path = osp.join(self.root_dir, WRONG_DIMENSIONS)
+        mtime = os.stat(path).st_mtime + 10
+        os.utime(path, (mtime, mtime))
+        statuses = verify_tree(self.root_dir, self.results_path, 1)
+        self.assertEqual(statuses[GOOD], 'previous')
+        self.assertEqual(statuses[TRUNCATED], 'previous')
+        self.assertEqual(statuses[WRONG_DIMENSIONS],
+                         'error: 4 dimensions, expected 3')
+
+
+if __name__ == '__main__':
+    unittest_main()
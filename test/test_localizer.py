@@ -40,11 +40,53 @@ uncomment code below if you want to activate automatic test for your cube:
 
 from cubicweb.devtools import testlib
 
+from cubes.localizer.entities import (_request_data, can_read_attribute,
+                                      completed_attributes)
+
 class DefaultTC(testlib.CubicWebTC):
     def test_something(self):
         self.skipTest('this cube has no test')
 
 
+class RestrictedAttributesTC(testlib.CubicWebTC):
+
+    def test_managers(self):
+        req = self.request()
+        self.assertTrue(can_read_attribute(req, 'GenomicMeasure', 'filepath'))
+
+    def test_anonymous(self):
+        self.login('anon')
+        try:
+            req = self.request()
+            self.assertFalse(can_read_attribute(req, 'GenomicMeasure',
+                                                'filepath'))
+            memo = _request_data(req)['localizer.readable-attributes']
+            self.assertEqual(memo[('GenomicMeasure', 'filepath')], False)
+        finally:
+            self.restore_connection()
+
+    def test_completion(self):
+        req = self.request()
+        measure = req.create_entity('GenomicMeasure',
+                                    identifier=u'genomic_measure',
+                                    type=u'SNP', format=u'plink',
+                                    filepath=u'genetics/Localizer94.bed')
+        self.commit()
+        self.login('anon')
+        try:
+            req = self.request()
+            eschema = self.schema['GenomicMeasure']
+            fetched, unreadable = completed_attributes(req, eschema)
+            self.assertIn('identifier', fetched)
+            self.assertEqual(unreadable, ['filepath'])
+            measure = req.entity_from_eid(measure.eid)
+            measure.complete()
+            self.assertEqual(measure.identifier, u'genomic_measure')
+            self.assertEqual(measure.filepath, None)
+        finally:
+            self.restore_connection()
+
+
 if __name__ == '__main__':
     from logilab.common.testlib import unittest_main
     unittest_main()
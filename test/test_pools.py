@@ -0,0 +1,49 @@
+# copyright 2013 CEA (Saclay, FRANCE), all rights reserved.
+# copyright 2013 LOGILAB S.A. (Paris, FRANCE), all rights reserved.
+# contact http://brainomics.cea.fr -- mailto:localizer94@cea.fr
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""cubicweb-localizer tests of the functions of the shell scripts"""
+
+import os.path as osp
+
+from logilab.common.testlib import TestCase, unittest_main
+
+from cubes.localizer import caches
+from cubes.localizer.pools import CUBE_DIRECTORY, importable
+
+
+def execfile_function(filename, name):
+    """Return the function `name` of a cube file executed as by the shell"""
+    namespace = {'__name__': '__main__'}
+    path = osp.join(CUBE_DIRECTORY, filename)
+    with open(path) as stream:
+        exec compile(stream.read(), path, 'exec') in namespace
+    return namespace[name]
+
+
+class ImportableTC(TestCase):
+
+    def test_module_function(self):
+        self.assertIs(importable(caches.file_state), caches.file_state)
+
+    def test_script_function(self):
+        function = execfile_function('caches.py', 'file_state')
+        self.assertIsNot(function, caches.file_state)
+        self.assertIs(importable(function), caches.file_state)
+
+
+if __name__ == '__main__':
+    unittest_main()
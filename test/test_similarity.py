@@ -0,0 +1,182 @@
+# copyright 2013 CEA (Saclay, FRANCE), all rights reserved.
+# copyright 2013 LOGILAB S.A. (Paris, FRANCE), all rights reserved.
+# contact http://brainomics.cea.fr -- mailto:localizer94@cea.fr
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""cubicweb-localizer tests of the similarity search of subjects"""
+
+import os
+import os.path as osp
+import shutil
+import tempfile
+
+import numpy as np
+
+from logilab.common.testlib import TestCase, unittest_main
+
+from cubes.localizer import similarity
+from cubes.localizer.similarity import (
+    MAPS_QUERY, MASKS_QUERY, downsample, vector_stats, similarities,
+    similar_subjects, update_index, load_index, index_directory, _save_index)
+
+from helpers import FakeConfig, FakeSession
+from test_storage import nifti_image
+
+SHAPE = (4, 4, 4)
+CONTRAST = 1
+
+
+class SimilaritySession(FakeSession):
+    """Answer the maps and masks queries of `update_index` for `subjects`, a
+    {eid: identifier} dictionary"""
+
+    def __init__(self, config, root, subjects):
+        super(SimilaritySession, self).__init__(config)
+        self.root = root
+        self.subjects = subjects
+
+    def execute(self, rql, args=None):
+        if rql == MASKS_QUERY:
+            return [(eid, 'mask_%s.nii' % eid, None, self.root)
+                    for eid in self.subjects]
+        assert rql == MAPS_QUERY, rql
+        return [(CONTRAST, eid, identifier, 'map_%s.nii' % eid, None,
+                 self.root)
+                for eid, identifier in self.subjects.items()]
+
+
+class DownsampleTC(TestCase):
+
+    def test_cell_means(self):
+        volume = np.arange(64, dtype=np.float32).reshape(SHAPE)
+        mask = np.ones(SHAPE, dtype=bool)
+        vector = downsample(volume, mask, (2, 2, 2))
+        self.assertEqual(vector.dtype, np.float32)
+        expected = volume.reshape(2, 2, 2, 2, 2, 2).mean(axis=(1, 3, 5))
+        np.testing.assert_allclose(vector, expected.ravel())
+
+    def test_mask(self):
+        volume = np.arange(64, dtype=np.float32).reshape(SHAPE)
+        volume[0, 0, 0] = np.nan
+        mask = np.zeros(SHAPE, dtype=bool)
+        mask[:2, :2, :2] = True
+        mask[0, 0, 0] = False
+        mask[3, 3, 3] = True
+        vector = downsample(volume, mask, (2, 2, 2))
+        self.assertAlmostEqual(vector[0], volume[:2, :2, :2][mask[:2, :2, :2]]
+                               .mean(), 5)
+        self.assertEqual(vector[-1], volume[3, 3, 3])
+        self.assertFalse(vector[1:-1].any())
+
+
+class SimilaritiesTC(TestCase):
+
+    def setUp(self):
+        self.vectors = np.random.RandomState(0).normal(
+            1, 1, (5, 20)).astype(np.float32)
+        self.vectors[4] = 0
+        self.stats = vector_stats(self.vectors)
+
+    def test_cosine(self):
+        vectors = self.vectors.astype(np.float64)
+        norms = np.sqrt((vectors ** 2).sum(axis=1))
+        scores = similarities(self.vectors, self.stats, 1, 'cosine')
+        np.testing.assert_allclose(scores[:4], vectors[:4].dot(vectors[1])
+                                   / norms[:4] / norms[1], rtol=1e-5)
+        self.assertAlmostEqual(scores[1], 1, 5)
+        self.assertEqual(scores[4], 0)
+
+    def test_correlation(self):
+        scores = similarities(self.vectors, self.stats, 1, 'correlation')
+        np.testing.assert_allclose(scores[:4],
+                                   np.corrcoef(self.vectors[:4])[1],
+                                   rtol=1e-4)
+        self.assertEqual(scores[4], 0)
+
+
+class IndexTC(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.config = FakeConfig(osp.join(self.tmpdir, 'cache'))
+        similarity._INDEXES.clear()
+
+    def tearDown(self):
+        similarity._INDEXES.clear()
+        shutil.rmtree(self.tmpdir)
+
+    def test_similar_subjects(self):
+        matrix = np.array([[1, 1, 0], [1, 0, 0], [0, 1, 0], [1, 0.1, 0],
+                           [-1, 0, 0]], dtype=np.float32)
+        _save_index(index_directory(self.config, CONTRAST),
+                    {'subjects': [11, 10, 12, 13, 14],
+                     'identifiers': ['S1', 'S0', 'S2', 'S3', 'S4'],
+                     'states': [None] * 5}, matrix)
+        self.assertEqual(
+            [(eid, identifier) for eid, identifier, _ in
+             similar_subjects(self.config, CONTRAST, 10, k=3)],
+            [(13, 'S3'), (11, 'S1'), (12, 'S2')])
+        results = similar_subjects(self.config, CONTRAST, 10, k=10)
+        self.assertEqual([eid for eid, _, _ in results], [13, 11, 12, 14])
+        self.assertAlmostEqual(results[-1][2], -1, 5)
+        self.assertEqual(similar_subjects(self.config, CONTRAST, 19), None)
+        self.assertEqual(similar_subjects(self.config, 2, 10), None)
+        self.assertRaises(ValueError, similar_subjects, self.config,
+                          CONTRAST, 10, metric='euclidean')
+
+    def write_map(self, eid, value):
+        nifti_image(osp.join(self.tmpdir, 'map_%s.nii' % eid),
+                    np.full(SHAPE, value, dtype=np.float32))
+
+    def touch(self, filename):
+        path = osp.join(self.tmpdir, filename)
+        mtime = os.stat(path).st_mtime + 10
+        os.utime(path, (mtime, mtime))
+
+    def test_update_index(self):
+        # subjects of different studies may share their identifier
+        subjects = {1: 'S0', 2: 'S1', 3: 'S0'}
+        for eid in subjects:
+            nifti_image(osp.join(self.tmpdir, 'mask_%s.nii' % eid),
+                        np.ones(SHAPE, dtype=np.int16))
+            self.write_map(eid, eid)
+        session = SimilaritySession(self.config, self.tmpdir, subjects)
+        self.assertEqual(update_index(session, 1), {'kept': 0, 'indexed': 3})
+        index, vectors, stats = load_index(self.config, CONTRAST)
+        self.assertEqual(index['subjects'], [1, 2, 3])
+        self.assertEqual(index['identifiers'], ['S0', 'S1', 'S0'])
+        np.testing.assert_array_equal(vectors[:, 0], [1, 2, 3])
+        self.assertEqual(update_index(session, 1), {'kept': 3})
+        # a modified map is indexed again, the other vectors are kept
+        self.write_map(2, 5)
+        self.touch('map_2.nii')
+        self.assertEqual(update_index(session, 1), {'kept': 2, 'indexed': 1})
+        index, vectors, stats = load_index(self.config, CONTRAST)
+        np.testing.assert_array_equal(vectors[:, 0], [1, 5, 3])
+        # so is the map of a modified mask
+        mask = np.zeros(SHAPE, dtype=np.int16)
+        mask[0] = 1
+        nifti_image(osp.join(self.tmpdir, 'mask_3.nii'), mask)
+        self.touch('mask_3.nii')
+        self.assertEqual(update_index(session, 1), {'kept': 2, 'indexed': 1})
+        # a removed subject leaves the index
+        session.subjects = {1: 'S0', 3: 'S0'}
+        self.assertEqual(update_index(session, 1), {'kept': 2})
+        index, vectors, stats = load_index(self.config, CONTRAST)
+        self.assertEqual(index['subjects'], [1, 3])
+        self.assertEqual(vectors.shape[0], 2)
+
+if __name__ == '__main__':
+    unittest_main()
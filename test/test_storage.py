@@ -0,0 +1,147 @@
+# copyright 2013 CEA (Saclay, FRANCE), all rights reserved.
+# copyright 2013 LOGILAB S.A. (Paris, FRANCE), all rights reserved.
+# contact http://brainomics.cea.fr -- mailto:localizer94@cea.fr
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""cubicweb-localizer tests of the random access to the images"""
+
+import os
+import os.path as osp
+import gzip
+import json
+import shutil
+import struct
+import tempfile
+
+import numpy as np
+
+from logilab.common.testlib import TestCase, unittest_main
+
+from cubes.localizer.storage import convert, read_volume
+from cubes.localizer.integrity import image_files
+from cubes.localizer.importers.localizer import neuroimaging
+
+
+def nifti_image(path, data, slope=0, inter=0):
+    """Write the int16 or float32 array `data` as an uncompressed NIfTI-1
+    image"""
+    datatype, bitpix = (16, 32) if data.dtype == np.float32 else (4, 16)
+    header = bytearray(348)
+    struct.pack_into('<i', header, 0, 348)
+    struct.pack_into('<8h', header, 40, data.ndim,
+                     *(data.shape + (1,) * (7 - data.ndim)))
+    struct.pack_into('<2h', header, 70, datatype, bitpix)
+    struct.pack_into('<8f', header, 76, 1, 2, 2, 2, 1, 1, 1, 1)
+    struct.pack_into('<3f', header, 108, 352, slope, inter)
+    header[344:348] = b'n+1\0'
+    with open(path, 'wb') as stream:
+        stream.write(bytes(header) + b'\0' * 4
+                     + data.astype(data.dtype.newbyteorder('<')).tobytes(
+                         order='F'))
+
+
+def gzipped_nifti_image(path, data):
+    """Write `data` as a single stream `.nii.gz` NIfTI-1 image, as imported
+    images are"""
+    if not osp.isdir(osp.dirname(path)):
+        os.makedirs(osp.dirname(path))
+    nifti_image(path[:-3], data)
+    with open(path[:-3], 'rb') as stream:
+        gzstream = gzip.open(path, 'wb')
+        try:
+            gzstream.write(stream.read())
+        finally:
+            gzstream.close()
+    os.remove(path[:-3])
+
+
+class ReadVolumeTC(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = osp.join(self.tmpdir, 'image.nii')
+        self.data = np.arange(24, dtype=np.int16).reshape((2, 3, 4))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_nan_slope(self):
+        # nibabel writes a NaN slope and intercept for unscaled data
+        nifti_image(self.path, self.data, float('nan'), float('nan'))
+        volume = read_volume(self.path)
+        self.assertTrue(np.isfinite(volume).all())
+        np.testing.assert_array_equal(volume, self.data)
+
+    def test_null_slope(self):
+        nifti_image(self.path, self.data, 0, 5)
+        np.testing.assert_array_equal(read_volume(self.path), self.data)
+
+    def test_scaled(self):
+        nifti_image(self.path, self.data, 0.5, -1)
+        np.testing.assert_allclose(read_volume(self.path),
+                                   self.data * 0.5 - 1)
+
+    def test_nan_intercept(self):
+        nifti_image(self.path, self.data, 2, float('nan'))
+        np.testing.assert_allclose(read_volume(self.path), self.data * 2)
+
+
+class ConvertedTreeTC(TestCase):
+    """converted files must not be read as images of the subjects"""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.subject_dir = osp.join(self.root, 'subjects', 'S1')
+        os.makedirs(self.subject_dir)
+        with open(osp.join(self.subject_dir, 'subject.json'), 'w') as stream:
+            json.dump({'exam': 'E1', 'date': '2010-01-01 10:00:00'}, stream)
+        self.filepaths = [osp.join('subjects', 'S1', 'fmri', 'bold.nii.gz'),
+                          osp.join('subjects', 'S1', 'c_maps', 'audio.nii.gz')]
+        for filepath in self.filepaths:
+            gzipped_nifti_image(osp.join(self.root, filepath),
+                                np.zeros((2, 3, 4, 2), dtype=np.int16))
+        self.converted = [convert(self.root, filepath, uncompressed)
+                          for filepath in self.filepaths
+                          for uncompressed in (False, True)]
+        # image headers are not read
+        self._get_image_info = neuroimaging.get_image_info
+        neuroimaging.get_image_info = lambda path, get_tr=True: {}
+
+    def tearDown(self):
+        neuroimaging.get_image_info = self._get_image_info
+        shutil.rmtree(self.root)
+
+    def test_converted_files(self):
+        for filepath in self.converted:
+            self.assertTrue(osp.isfile(osp.join(self.root, filepath)))
+            self.assertFalse(filepath.startswith('subjects'), filepath)
+        for uncompressed in (False, True):
+            np.testing.assert_array_equal(
+                read_volume(osp.join(self.root, self.converted[uncompressed])),
+                read_volume(osp.join(self.root, self.filepaths[0])))
+
+    def test_import_maps(self):
+        scans = list(neuroimaging.import_maps(self.subject_dir, 'c'))
+        self.assertEqual([scan['identifier'] for scan, _, _, _ in scans],
+                         [u'E1_c_map_audio'])
+
+    def test_integrity_check(self):
+        self.assertEqual(sorted(osp.relpath(path, self.root)
+                                for path, _ in image_files(self.root)),
+                         sorted(self.filepaths))
+
+
+if __name__ == '__main__':
+    unittest_main()
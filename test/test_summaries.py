@@ -0,0 +1,100 @@
+# copyright 2013 CEA (Saclay, FRANCE), all rights reserved.
+# copyright 2013 LOGILAB S.A. (Paris, FRANCE), all rights reserved.
+# contact http://brainomics.cea.fr -- mailto:localizer94@cea.fr
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program. If not, see <http://www.gnu.org/licenses/>.
+
+
+"""cubicweb-localizer tests of the subjects summaries and of their JSON API"""
+
+import json
+
+from cubicweb.devtools import testlib
+
+from cubes.localizer.summaries import (fetch_summaries,
+                                       refresh_subject_summaries)
+
+
+class SubjectsSummariesTC(testlib.CubicWebTC):
+
+    def setup_database(self):
+        req = self.request()
+        # summaries are left empty, as before the rebuild of an import
+        with self.session.allow_all_hooks_but('localizer.cache'):
+            for i in xrange(5):
+                req.create_entity('Subject', identifier=u'S%s' % i,
+                                  gender=u'male', handedness=u'right')
+
+    def setUp(self):
+        super(SubjectsSummariesTC, self).setUp()
+        self.eids = [eid for eid, in self.execute(
+            'Any S ORDERBY SI WHERE S is Subject, S identifier SI')]
+
+    def test_rebuild(self):
+        req = self.request()
+        self.assertEqual(fetch_summaries(req), {})
+        self.assertEqual(refresh_subject_summaries(self.session), 5)
+        self.commit()
+        summaries = fetch_summaries(req)
+        self.assertEqual(sorted(summaries), self.eids)
+        summary = summaries[self.eids[0]]
+        self.assertEqual(summary['identifier'], u'S0')
+        self.assertEqual(summary['gender'], u'male')
+        self.assertEqual(summary['scans'], [])
+
+    def test_missing_summaries(self):
+        refresh_subject_summaries(self.session, self.eids[::2])
+        self.commit()
+        req = self.request()
+        self.assertEqual(sorted(fetch_summaries(req)), self.eids[::2])
+        self.assertEqual(
+            sorted(fetch_summaries(req, identifiers=[u'S0', u'S1'])),
+            [self.eids[0]])
+        # subjects without summary don't shorten the pages
+        summaries = fetch_summaries(req, limit=2)
+        self.assertEqual(sorted(summaries), [self.eids[0], self.eids[2]])
+
+    def test_pagination(self):
+        refresh_subject_summaries(self.session)
+        self.commit()
+        pages, cursor = [], None
+        while True:
+            form = {'limit': '2'}
+            if cursor is not None:
+                form['cursor'] = cursor
+            req = self.request(**form)
+            page = json.loads(self.ctrl_publish(req,
+                                                'localizer-subjects-summary'))
+            pages.append([summary['eid'] for summary in page])
+            cursor = req.get_response_header('X-Next-Cursor')
+            if cursor is None:
+                break
+        self.assertEqual(pages, [self.eids[:2], self.eids[2:4],
+                                 self.eids[4:]])
+
+    def test_pagination_identifiers(self):
+        refresh_subject_summaries(self.session)
+        self.commit()
+        req = self.request(identifiers=u'S3,S1', limit='1')
+        page = json.loads(self.ctrl_publish(req,
+                                            'localizer-subjects-summary'))
+        self.assertEqual([summary['identifier'] for summary in page],
+                         [u'S1'])
+        self.assertEqual(req.get_response_header('X-Next-Cursor'),
+                         str(self.eids[1]))
+
+
+if __name__ == '__main__':
+    from logilab.common.testlib import unittest_main
+    unittest_main()
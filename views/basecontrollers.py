@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+# copyright 2013 CEA (Saclay, FRANCE), all rights reserved.
+# copyright 2013 LOGILAB S.A. (Paris, FRANCE), all rights reserved.
+# contact http://brainomics.cea.fr -- mailto:localizer94@cea.fr
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""cubicweb-localizer view controller: instrumentation of the requests (see
+instrumentation.py) and cache of the result sets of the listings (see
+rqlcache.py)"""
+
+from rql import RQLSyntaxError
+
+from cubicweb import BadRQLQuery
+from cubicweb.web.views.basecontrollers import ViewController
+
+from cubes.localizer.instrumentation import (current_request, end_request,
+                                             start_request)
+from cubes.localizer.rqlcache import RQL_CACHE, normalize
+
+
+class LocalizerViewController(ViewController):
+    """record the view, render time and queries of each request when the
+    localizer-instrumentation option is set, and read the result sets of
+    the `rql` parameter from the cache"""
+
+    def publish(self, rset=None):
+        if not self._cw.vreg.config['localizer-instrumentation']:
+            return super(LocalizerViewController, self).publish(rset)
+        start_request(self._cw.relative_path(includeparams=False))
+        try:
+            return super(LocalizerViewController, self).publish(rset)
+        finally:
+            end_request()
+
+    def _select_view_and_rset(self, rset):
+        view, rset = super(LocalizerViewController,
+                           self)._select_view_and_rset(rset)
+        record = current_request()
+        if record is not None:
+            record.vid = view.__regid__
+        return view, rset
+
+    def process_rql(self):
+        req = self._cw
+        rql = req.form.get('rql')
+        if not rql or not req.vreg.config['localizer-rql-cache-size']:
+            return super(LocalizerViewController, self).process_rql()
+        req.ensure_ro_rql(rql)
+        if not isinstance(rql, unicode):
+            rql = unicode(rql, req.encoding)
+        query = magicsearch_query(req, rql)
+        if query is None or RQL_CACHE.query_etypes(
+            req, normalize(query[0])) is None:
+            # not understood, or not cacheable: let the magic search
+            # component execute it (or report the error)
+            return super(LocalizerViewController, self).process_rql()
+        return RQL_CACHE.execute(req, *query)
+
+
+def magicsearch_query(req, rql):
+    """Return the (rql, args) the magic search component executes for the
+    `rql` parameter (e.g. a query with translated entity types, or a
+    full-text search), or None if none of its processors understands it"""
+    magicsearch = req.vreg['components'].select_or_none('magicsearch', req)
+    if magicsearch is None:
+        return rql, None
+    processors = magicsearch.processors
+    # explicitly specified processor, as in `MagicSearchComponent`
+    if ':' in rql:
+        name, query = rql.split(':', 1)
+        processor = magicsearch.by_name.get(name.strip().lower())
+        if processor is not None:
+            processors, rql = [processor], query.strip()
+    for processor in processors:
+        try:
+            query = processor.preprocess_query(rql)
+            args = len(query) > 1 and query[1] or None
+            # syntax and entity types are checked as the query is executed
+            req.vreg.parse(req, query[0], args)
+        except (RQLSyntaxError, BadRQLQuery):
+            continue
+        return query[0], args
+    return None
+
+
+def registration_callback(vreg):
+    vreg.register_and_replace(LocalizerViewController, ViewController)
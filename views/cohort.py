@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+# copyright 2013 CEA (Saclay, FRANCE), all rights reserved.
+# copyright 2013 LOGILAB S.A. (Paris, FRANCE), all rights reserved.
+# contact http://brainomics.cea.fr -- mailto:localizer94@cea.fr
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""cubicweb-localizer bulk export of the cohort metadata
+
+Return subjects with their scores, assessments and scans as newline
+delimited JSON, one subject per line, e.g.::
+
+    /localizer-cohort?limit=500
+    /localizer-cohort?limit=500&cursor=1234
+
+Subjects are returned by pages of `limit` subjects ordered by eid. The
+cursor of the next page is given in the `X-Next-Cursor` header (and in a
+`Link` header), which is missing on the last page. Each page is fetched with
+a fixed number of queries whatever its size, see `COHORT_QUERIES`.
+"""
+
+import json
+
+from cubicweb.web import RequestError
+from cubicweb.web.controller import Controller
+
+DEFAULT_PAGE_SIZE = 200
+MAX_PAGE_SIZE = 2000
+
+COHORT_QUERIES = {
+    'subjects': ('Any S, SI, SG, SH ORDERBY S LIMIT %(limit)s '
+                 'WHERE S is Subject, S identifier SI, S gender SG, '
+                 'S handedness SH, S eid > %(cursor)s'),
+    'scores': ('Any S, DN, V WHERE S related_infos SV, SV definition D, '
+               'D name DN, SV text V, S eid IN (%(eids)s)'),
+    'assessments': ('Any S, A, AI, AG, CN WHERE S concerned_by A, '
+                    'A identifier AI, A age_for_assessment AG, C holds A, '
+                    'C name CN, S eid IN (%(eids)s)'),
+    'scans': ('Any S, A, X, XI, XT, XL, XF%(mri_selection)s WHERE '
+              'X is Scan, X concerns S, A generates X, X identifier XI, '
+              'X type XT, X label XL, X filepath XF, X has_data M'
+              '%(mri_restrictions)s, S eid IN (%(eids)s)'),
+}
+
+
+def mri_attributes(schema):
+    """Return the names of the MRIData attributes describing the shape and
+    voxel size of the images"""
+    return sorted(rschema.type for rschema, _ in
+                  schema['MRIData'].attribute_definitions()
+                  if rschema.type.startswith(('shape_', 'voxel_res_')))
+
+def cohort_page(req, cursor=0, limit=DEFAULT_PAGE_SIZE):
+    """Return the subjects following eid `cursor`, with their scores,
+    assessments and scans, using four queries"""
+    subjects, order = {}, []
+    for eid, identifier, gender, handedness in req.execute(
+        COHORT_QUERIES['subjects'] % {'limit': int(limit),
+                                      'cursor': int(cursor)}):
+        subjects[eid] = {'eid': eid, 'identifier': identifier,
+                         'gender': gender, 'handedness': handedness,
+                         'scores': {}, 'assessments': []}
+        order.append(eid)
+    if not order:
+        return []
+    eids = ','.join(str(eid) for eid in order)
+    for eid, name, value in req.execute(COHORT_QUERIES['scores']
+                                        % {'eids': eids}):
+        subjects[eid]['scores'][name] = value
+    assessments = {}
+    for eid, aeid, identifier, age, center in req.execute(
+        COHORT_QUERIES['assessments'] % {'eids': eids}):
+        assessments[aeid] = {'eid': aeid, 'identifier': identifier,
+                             'age': age, 'center': center, 'scans': []}
+        subjects[eid]['assessments'].append(assessments[aeid])
+    attributes = mri_attributes(req.vreg.schema)
+    rql = COHORT_QUERIES['scans'] % {
+        'eids': eids,
+        'mri_selection': ''.join(', M%s' % i for i in range(len(attributes))),
+        'mri_restrictions': ''.join(', M %s M%s' % (attr, i)
+                                    for i, attr in enumerate(attributes))}
+    for row in req.execute(rql):
+        aeid, xeid, identifier, scan_type, label, filepath = row[1:7]
+        if aeid not in assessments:
+            continue
+        assessments[aeid]['scans'].append(
+            {'eid': xeid, 'identifier': identifier, 'type': scan_type,
+             'label': label, 'filepath': filepath,
+             'mri': dict(zip(attributes, row[7:]))})
+    return [subjects[eid] for eid in order]
+
+
+def _int_param(req, name, default):
+    try:
+        return int(req.form.get(name) or default)
+    except ValueError:
+        raise RequestError(req._('%s should be an integer') % name)
+
+
+class CohortController(Controller):
+    __regid__ = 'localizer-cohort'
+
+    def publish(self, rset=None):
+        req = self._cw
+        cursor = _int_param(req, 'cursor', 0)
+        limit = min(max(_int_param(req, 'limit', DEFAULT_PAGE_SIZE), 1),
+                    MAX_PAGE_SIZE)
+        subjects = cohort_page(req, cursor, limit)
+        req.set_content_type('application/x-ndjson')
+        if len(subjects) == limit:
+            next_cursor = str(subjects[-1]['eid'])
+            req.set_header('X-Next-Cursor', next_cursor)
+            req.set_header('Link', '<%s>; rel="next"' % req.build_url(
+                'localizer-cohort', cursor=next_cursor, limit=limit))
+        return ''.join(json.dumps(subject, default=unicode) + '\n'
+                       for subject in subjects)
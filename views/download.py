@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+# copyright 2013 CEA (Saclay, FRANCE), all rights reserved.
+# copyright 2013 LOGILAB S.A. (Paris, FRANCE), all rights reserved.
+# contact http://brainomics.cea.fr -- mailto:localizer94@cea.fr
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""cubicweb-localizer download of scan files
+
+The web instance only checks permissions and resolves the file path; the
+transfer itself is delegated to the front-end web server according to the
+`localizer-sendfile` option:
+
+* `x-sendfile`: the absolute path is given in a `X-Sendfile` header;
+* `x-accel-redirect`: an internal uri, `localizer-sendfile-prefix` followed
+  by the study name and the relative filepath, is given in a
+  `X-Accel-Redirect` header, e.g. for nginx::
+
+      location /protected-data/localizer/ {
+          internal;
+          alias /path/to/localizer/data/;
+      }
+
+Otherwise the file is read by chunks and returned by the web instance, as
+the download actions of brainomics and the zip box do; controllers return
+their body as a string, so that the file is held in memory until it is sent.
+A warning is logged at startup so that a front-end web server is configured
+in production.
+
+With `random_access=1`, the random access version of a Scan file is sent
+when there is one (see storage.py): served by the front-end web server, its
+header or volumes may then be read with HTTP range requests.
+"""
+
+import os.path as osp
+import logging
+from urllib import quote
+
+from cubicweb import NotFound
+from cubicweb.predicates import is_instance, one_line_rset
+from cubicweb.web.action import Action
+from cubicweb.web.controller import Controller
+
+DOWNLOADABLE = ('Scan', 'ExternalResource')
+LOGGER = logging.getLogger('cubicweb.localizer.download')
+# size of the reads of the files sent by the web instance
+CHUNK_SIZE = 2**20
+
+
+def resolve_filepath(req, eid):
+    """Return (study name, study directory, relative filepath) of a readable
+    downloadable entity, raise NotFound if there is none"""
+    rset = req.execute('Any N, D, F WHERE X eid %%(x)s, X is IN (%s), '
+                       'X filepath F, X related_study S, S name N, '
+                       'S data_filepath D' % ','.join(DOWNLOADABLE),
+                       {'x': eid})
+    if not rset:
+        raise NotFound()
+    name, root, filepath = rset[0]
+    path = osp.normpath(osp.join(root, filepath))
+    # do not serve files outside of the study directory
+    if not path.startswith(osp.join(osp.normpath(root), '')):
+        raise NotFound()
+    return name, root, osp.relpath(path, root)
+
+def random_access_filepath(req, eid, root, filepath):
+    """Return the relative path of the random access version of a Scan file
+    if it exists, else `filepath`"""
+    rset = req.execute('Any RF WHERE X eid %(x)s, X is Scan, '
+                       'X localizer_random_access_filepath RF, '
+                       'NOT X localizer_random_access_filepath NULL',
+                       {'x': eid})
+    if rset:
+        path = osp.normpath(osp.join(root, rset[0][0]))
+        if (path.startswith(osp.join(osp.normpath(root), ''))
+            and osp.exists(path)):
+            return osp.relpath(path, root)
+    return filepath
+
+
+def read_chunks(path, chunk_size=CHUNK_SIZE):
+    """Return the content of a file read by chunks"""
+    chunks = []
+    with open(path, 'rb') as stream:
+        for chunk in iter(lambda: stream.read(chunk_size), b''):
+            chunks.append(chunk)
+    return b''.join(chunks)
+
+
+class FileDownloadController(Controller):
+    __regid__ = 'localizer-download'
+
+    def publish(self, rset=None):
+        req = self._cw
+        try:
+            eid = int(req.form['eid'])
+        except (KeyError, ValueError):
+            raise NotFound()
+        name, root, filepath = resolve_filepath(req, eid)
+        if req.form.get('random_access'):
+            filepath = random_access_filepath(req, eid, root, filepath)
+        path = osp.join(root, filepath)
+        if not osp.isfile(path):
+            raise NotFound()
+        mode = req.vreg.config['localizer-sendfile']
+        req.set_content_type('application/octet-stream')
+        req.set_header('Content-Disposition', 'attachment; filename="%s"'
+                       % osp.basename(path).encode('utf-8'))
+        if mode == 'x-sendfile':
+            req.set_header('X-Sendfile', path.encode('utf-8'))
+            return ''
+        if mode == 'x-accel-redirect':
+            prefix = req.vreg.config['localizer-sendfile-prefix']
+            uri = '%s/%s/%s' % (prefix.rstrip('/'), name, filepath)
+            req.set_header('X-Accel-Redirect', quote(uri.encode('utf-8')))
+            return ''
+        # no front-end web server configured: the web instance sends it
+        req.set_header('Content-Length', str(osp.getsize(path)))
+        return read_chunks(path)
+
+
+class FileDownloadAction(Action):
+    __regid__ = 'localizer-download'
+    __select__ = is_instance(*DOWNLOADABLE) & one_line_rset()
+    category = 'mainactions'
+    title = _('Download file')
+
+    def url(self):
+        entity = self.cw_rset.get_entity(self.cw_row or 0, self.cw_col or 0)
+        return self._cw.build_url('localizer-download', eid=entity.eid)
+
+
+def registration_callback(vreg):
+    vreg.register_all(globals().values(), __name__)
+    if not vreg.config['localizer-sendfile']:
+        LOGGER.warning('localizer-sendfile is not set: files are read and '
+                       'sent by the web instance')
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+# copyright 2013 CEA (Saclay, FRANCE), all rights reserved.
+# copyright 2013 LOGILAB S.A. (Paris, FRANCE), all rights reserved.
+# contact http://brainomics.cea.fr -- mailto:localizer94@cea.fr
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""cubicweb-localizer facets"""
+
+from rql import nodes
+
+from cubicweb.predicates import is_instance
+from cubicweb.web.facet import (AttributeFacet, RelationFacet, RQLPathFacet,
+                                cleanup_select, prepare_vocabulary_select)
+
+from cubes.localizer.caches import facet_counts
+from cubes.localizer.statistics import cohort_counts
+
+
+class CountedAttributeFacet(AttributeFacet):
+    """Attribute facet displaying the number of entities of the current
+    result set for each value.
+
+    When the result set holds all entities of the type, counts are read from
+    the caches kept current by hooks, so that no grouped count query runs on
+    each page view: the cohort statistics for the facets of a
+    `statistics_variable`, the facet counts otherwise. Otherwise they are
+    computed by the vocabulary query itself, grouped by value.
+    """
+    __abstract__ = True
+    etype = None
+    statistics_variable = None
+
+    def vocabulary(self):
+        if self._unrestricted():
+            counts = self._cached_counts()
+            if counts:
+                return self._counted_vocabulary(counts)
+        select = self.select
+        select.save_state()
+        try:
+            filtered_variable = self.filtered_variable
+            cleanup_select(select, filtered_variable)
+            newvar = prepare_vocabulary_select(select, filtered_variable,
+                                               self.rtype, self.role)
+            count = nodes.Function('COUNT')
+            count.append(nodes.variable_ref(filtered_variable))
+            select.add_selected(count)
+            select.add_group_var(newvar)
+            args = self.cw_rset.args if self.cw_rset else None
+            try:
+                rset = self.rqlexec(select.as_string(), args)
+            except Exception:
+                self.exception('error while getting vocabulary for %s, rql: %s',
+                               self, select.as_string())
+                return ()
+        finally:
+            select.recover()
+        return rset and self._counted_vocabulary(rset)
+
+    def _cached_counts(self):
+        """Return the cached (value, count) of all entities of `etype`"""
+        config = self._cw.vreg.config
+        if self.statistics_variable is not None:
+            return [(values[0], count) for values, count in
+                    cohort_counts(config, (self.statistics_variable,))
+                    if values[0] is not None]
+        return facet_counts(config, self.etype, self.rtype).items()
+
+    def _unrestricted(self):
+        """Return True if the result set holds all entities of `etype`"""
+        select = self.select
+        select.save_state()
+        try:
+            filtered_variable = self.filtered_variable
+            # drop the relations which do not restrict the result set
+            cleanup_select(select, filtered_variable)
+            typerel = filtered_variable.stinfo['typerel']
+            if select.having or not (select.where is None
+                                     or select.where is typerel):
+                return False
+            etypes = set(solution[filtered_variable.name]
+                         for solution in select.solutions)
+            return etypes == set([self.etype])
+        finally:
+            select.recover()
+
+    def _counted_vocabulary(self, counts):
+        """Return the vocabulary of (value, count) `counts`, sorted by value"""
+        _ = self.i18nable and self._cw._ or unicode
+        if self.sortasc is not None:
+            counts = sorted(counts, reverse=not self.sortasc)
+        return [(u'%s (%s)' % (_(value), count), value)
+                for value, count in counts]
+
+
+class ScanTypeFacet(CountedAttributeFacet):
+    __regid__ = 'localizer.scan-type-facet'
+    __select__ = CountedAttributeFacet.__select__ & is_instance('Scan')
+    etype, rtype = 'Scan', 'type'
+
+
+class ScanLabelFacet(CountedAttributeFacet):
+    __regid__ = 'localizer.scan-label-facet'
+    __select__ = CountedAttributeFacet.__select__ & is_instance('Scan')
+    etype, rtype = 'Scan', 'label'
+
+
+class ScanContrastFacet(RelationFacet):
+    __regid__ = 'localizer.scan-contrast-facet'
+    __select__ = RelationFacet.__select__ & is_instance('Scan')
+    rtype = 'contrast'
+    role = 'subject'
+    target_attr = 'name'
+
+
+class ScanCenterFacet(RQLPathFacet):
+    __regid__ = 'localizer.scan-center-facet'
+    __select__ = RQLPathFacet.__select__ & is_instance('Scan')
+    path = ['A generates X', 'C holds A', 'C name N']
+    filter_variable = 'N'
+    title = _('center')
+
+
+class SubjectGenderFacet(CountedAttributeFacet):
+    __regid__ = 'localizer.subject-gender-facet'
+    __select__ = CountedAttributeFacet.__select__ & is_instance('Subject')
+    etype, rtype = 'Subject', 'gender'
+    statistics_variable = u'gender'
+
+
+class SubjectHandednessFacet(CountedAttributeFacet):
+    __regid__ = 'localizer.subject-handedness-facet'
+    __select__ = CountedAttributeFacet.__select__ & is_instance('Subject')
+    etype, rtype = 'Subject', 'handedness'
+    statistics_variable = u'handedness'
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+# copyright 2013 CEA (Saclay, FRANCE), all rights reserved.
+# copyright 2013 LOGILAB S.A. (Paris, FRANCE), all rights reserved.
+# contact http://brainomics.cea.fr -- mailto:localizer94@cea.fr
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""cubicweb-localizer genotypes endpoint, restricted to managers
+
+Return the genotypes of some SNPs for some subjects as a (subjects x SNPs)
+int8 matrix, e.g.::
+
+    /localizer-genotypes?snps=rs3094315,rs12562034&subjects=S1,S2
+
+SNPs are given by rs id (`snps`), by index in the .bim file (`snp_indexes`)
+or by gene name (`gene`, SNPs located in the gene), subjects by identifier
+(all subjects with genomic measures by default). Genotypes of each subject
+are read in the PLINK file of its study; SNPs given by index require the
+subjects of a single study. The matrix is returned in numpy's .npy format, or
+as JSON with `format=json`.
+"""
+
+import json
+from cStringIO import StringIO
+
+from cubicweb import NotFound, Unauthorized
+from cubicweb.web import RequestError
+from cubicweb.web.controller import Controller
+
+from cubes.localizer.entities import can_read_attribute
+
+
+def _list_param(form, name):
+    value = form.get(name)
+    if not value:
+        return None
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+class GenotypesController(Controller):
+    __regid__ = 'localizer-genotypes'
+
+    def publish(self, rset=None):
+        req = self._cw
+        if not can_read_attribute(req, 'GenomicMeasure', 'filepath'):
+            raise Unauthorized(req._('genotypes are restricted to managers'))
+        # imported here, so numpy is only loaded when genotypes are requested
+        import numpy as np
+        from cubes.localizer.genotypes import bed_file, study_bed_paths
+        subject_ids = _list_param(req.form, 'subjects')
+        studies = study_bed_paths(req, subject_ids)
+        if not studies:
+            raise NotFound()
+        # genotypes of each subject are read in the .bed file of its study
+        groups = [(bed_file(path), identifiers)
+                  for path, identifiers in (studies[study]
+                                            for study in sorted(studies))]
+        identifiers = [identifier for _, group in groups
+                       for identifier in group]
+        try:
+            if subject_ids is None:
+                subject_ids = identifiers
+            else:
+                unknown = set(subject_ids).difference(identifiers)
+                if unknown:
+                    raise KeyError(', '.join(sorted(unknown)))
+            snp_ids = _list_param(req.form, 'snps')
+            if req.form.get('gene'):
+                snp_ids = [rs_id for rs_id, in req.execute(
+                    'Any R WHERE S in_gene G, G name %(g)s, S rs_id R',
+                    {'g': req.form['gene']})]
+            if snp_ids is None:
+                # indexes in the .bim file only make sense in a single study
+                if len(groups) > 1:
+                    raise RequestError(req._('SNP indexes require subjects '
+                                             'of a single study'))
+                bed = groups[0][0]
+                snps = [int(index) for index in
+                        _list_param(req.form, 'snp_indexes') or ()]
+                for index in snps:
+                    if not 0 <= index < bed.n_snps:
+                        raise ValueError(index)
+                snp_ids = [bed.snps[index] for index in snps]
+            if not snp_ids:
+                raise RequestError(req._('no SNP requested'))
+            genotypes = np.concatenate([
+                bed.genotypes(bed.snp_indexes(snp_ids),
+                              bed.subject_indexes(group))
+                for bed, group in groups])
+        except (KeyError, ValueError) as exc:
+            raise RequestError(req._('unknown SNP or subject: %s') % exc)
+        rows = dict((identifier, row)
+                    for row, identifier in enumerate(identifiers))
+        genotypes = genotypes[[rows[identifier] for identifier in subject_ids]]
+        if req.form.get('format') == 'json':
+            req.set_content_type('application/json')
+            return json.dumps({
+                'subjects': subject_ids,
+                'snps': snp_ids,
+                'genotypes': genotypes.tolist()})
+        stream = StringIO()
+        np.save(stream, genotypes)
+        req.set_content_type('application/octet-stream')
+        req.set_header('Content-Disposition',
+                       'attachment; filename="genotypes.npy"')
+        return stream.getvalue()
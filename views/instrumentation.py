@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+# copyright 2013 CEA (Saclay, FRANCE), all rights reserved.
+# copyright 2013 LOGILAB S.A. (Paris, FRANCE), all rights reserved.
+# contact http://brainomics.cea.fr -- mailto:localizer94@cea.fr
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""cubicweb-localizer endpoint of the statistics of the instrumented requests
+(see instrumentation.py, the view controller is instrumented in
+basecontrollers.py)"""
+
+import json
+
+from cubicweb import Unauthorized
+from cubicweb.web.controller import Controller
+
+from cubes.localizer.instrumentation import STATISTICS
+from cubes.localizer.rqlcache import RQL_CACHE
+
+
+class InstrumentationController(Controller):
+    """return the statistics of the instrumented requests by view, and of
+    the result sets cache, as JSON; reset them with `reset=1`; restricted to
+    managers"""
+    __regid__ = 'localizer-instrumentation'
+
+    def publish(self, rset=None):
+        req = self._cw
+        if not req.user.is_in_group('managers'):
+            raise Unauthorized(req._('instrumentation is restricted to '
+                                     'managers'))
+        data = STATISTICS.as_dict()
+        data['enabled'] = req.vreg.config['localizer-instrumentation']
+        data['rql_cache'] = RQL_CACHE.stats()
+        if req.form.get('reset'):
+            STATISTICS.clear()
+        req.set_content_type('application/json')
+        return json.dumps(data)
+
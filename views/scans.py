@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+# copyright 2013 CEA (Saclay, FRANCE), all rights reserved.
+# copyright 2013 LOGILAB S.A. (Paris, FRANCE), all rights reserved.
+# contact http://brainomics.cea.fr -- mailto:localizer94@cea.fr
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""cubicweb-localizer views of scans derived data and files checksums"""
+
+import os.path as osp
+
+from logilab.mtconverter import xml_escape
+
+from cubicweb import NotFound
+from cubicweb.predicates import is_instance
+from cubicweb.web.component import EntityCtxComponent
+from cubicweb.web.controller import Controller
+from cubicweb.web.views import uicfg
+
+from cubes.localizer.caches import derived_data, derived_data_directory
+from cubes.localizer.checksums import checksum
+
+# internal cache path, set by storage.py: neither displayed nor edited
+uicfg.primaryview_section.tag_attribute(
+    ('Scan', 'localizer_random_access_filepath'), 'hidden')
+uicfg.autoform_section.tag_attribute(
+    ('Scan', 'localizer_random_access_filepath'), 'main', 'hidden')
+
+STATS_LABELS = (
+    ('nvoxels', _('number of voxels')),
+    ('mean', _('mean')),
+    ('std', _('standard deviation')),
+    ('min', _('minimum')),
+    ('median', _('median')),
+    ('max', _('maximum')),
+)
+HISTOGRAM_WIDTH, HISTOGRAM_HEIGHT = 300, 80
+
+
+def histogram_svg(histogram, width=HISTOGRAM_WIDTH, height=HISTOGRAM_HEIGHT):
+    """Return the histogram computed after the import ({'counts': [...],
+    'edges': [...]}) as an SVG bar chart"""
+    counts = histogram['counts']
+    top = float(max(counts) or 1)
+    bar = float(width) / len(counts)
+    bars = u''.join(
+        u'<rect x="%.1f" y="%.1f" width="%.1f" height="%.1f"/>'
+        % (i * bar, height * (1 - count / top), bar, height * count / top)
+        for i, count in enumerate(counts) if count)
+    return (u'<svg class="localizer-histogram" width="%s" height="%s" '
+            u'viewBox="0 0 %s %s">%s</svg>' % (width, height, width, height,
+                                               bars))
+
+
+class ScanPreviewComponent(EntityCtxComponent):
+    """display the thumbnail, statistics and histogram computed after the
+    import"""
+    __regid__ = 'localizer.scan-preview'
+    __select__ = EntityCtxComponent.__select__ & is_instance('Scan')
+    context = 'navcontenttop'
+    title = _('Preview')
+
+    def render_body(self, w):
+        _ = self._cw._
+        eid = self.entity.eid
+        data = derived_data(self._cw.vreg.config, eid)
+        if data is None:
+            w(u'<p>%s</p>' % xml_escape(_('no preview available')))
+            return
+        w(u'<img class="localizer-thumbnail" src="%s" alt="%s"/>'
+          % (xml_escape(self._cw.build_url('localizer-thumbnail', eid=eid)),
+             xml_escape(_('thumbnail'))))
+        w(u'<table class="table table-condensed">')
+        for key, label in STATS_LABELS:
+            if key in data:
+                w(u'<tr><th>%s</th><td>%s</td></tr>'
+                  % (xml_escape(_(label)), self._cw.format_float(data[key])
+                     if isinstance(data[key], float) else data[key]))
+        w(u'</table>')
+        if data.get('histogram'):
+            edges = data['histogram']['edges']
+            w(u'<div>%s<br/>%s &#8211; %s</div>'
+              % (histogram_svg(data['histogram']),
+                 self._cw.format_float(edges[0]),
+                 self._cw.format_float(edges[-1])))
+        w(u'<p><a href="%s">%s</a></p>'
+          % (xml_escape(self._cw.build_url('localizer-checksums', eid=eid)),
+             xml_escape(_('SHA-256 checksum'))))
+
+
+class ScanThumbnailController(Controller):
+    """serve the thumbnail of a scan the user can read"""
+    __regid__ = 'localizer-thumbnail'
+
+    def publish(self, rset=None):
+        try:
+            eid = int(self._cw.form['eid'])
+        except (KeyError, ValueError):
+            raise NotFound()
+        # check the scan is readable by the user
+        if not self._cw.execute('Any X WHERE X eid %(x)s, X is Scan',
+                                {'x': eid}):
+            raise NotFound()
+        path = osp.join(derived_data_directory(self._cw.vreg.config, eid),
+                        'thumbnail.png')
+        if not osp.exists(path):
+            raise NotFound()
+        self._cw.set_content_type('image/png')
+        self._cw.set_header('Cache-Control', 'max-age=86400')
+        with open(path, 'rb') as stream:
+            return stream.read()
+
+
+class ChecksumsController(Controller):
+    """serve the recorded checksums of the files of readable entities, in the
+    format of the sha256sum command, e.g.::
+
+        /localizer-checksums?eid=1234,1235
+    """
+    __regid__ = 'localizer-checksums'
+
+    def publish(self, rset=None):
+        try:
+            eids = [int(eid) for eid in self._cw.form['eid'].split(',')]
+        except (KeyError, ValueError):
+            raise NotFound()
+        config = self._cw.vreg.config
+        lines = []
+        # permissions apply, e.g. GenomicMeasure.filepath is restricted
+        for filepath, root in self._cw.execute(
+            'Any F, D WHERE X eid IN (%s), X filepath F, X related_study S, '
+            'S data_filepath D' % ','.join(str(eid) for eid in eids)):
+            sha256 = checksum(config, osp.join(root, filepath))
+            if sha256 is not None:
+                lines.append(u'%s  %s\n' % (sha256, filepath))
+        self._cw.set_content_type('text/plain')
+        return u''.join(lines).encode('utf-8')
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+# copyright 2013 CEA (Saclay, FRANCE), all rights reserved.
+# copyright 2013 LOGILAB S.A. (Paris, FRANCE), all rights reserved.
+# contact http://brainomics.cea.fr -- mailto:localizer94@cea.fr
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""cubicweb-localizer view of the subjects most similar to a subject, on
+their maps of a contrast (see similarity.py)"""
+
+from logilab.mtconverter import xml_escape
+
+from cubicweb.predicates import is_instance, one_line_rset
+from cubicweb.view import EntityView
+from cubicweb.web import RequestError
+from cubicweb.web.action import Action
+
+from cubes.localizer.similarity import METRICS, similar_subjects
+
+MAX_NEIGHBOURS = 100
+
+
+class SimilarSubjectsView(EntityView):
+    """subjects most similar to the subject, for the `contrast` form
+    parameter (a Contrast name); the contrasts are listed without it"""
+    __regid__ = 'localizer-similar-subjects'
+    __select__ = (EntityView.__select__ & is_instance('Subject')
+                  & one_line_rset())
+    title = _('similar subjects')
+
+    def entity_call(self, entity):
+        req, w = self._cw, self.w
+        _ = req._
+        form = req.form
+        name = form.get('contrast')
+        if not name:
+            w(u'<h2>%s</h2><ul>' % xml_escape(_('contrasts')))
+            for contrast, in req.execute('Any CN ORDERBY CN WHERE '
+                                         'C is Contrast, C name CN'):
+                url = entity.absolute_url(vid=self.__regid__,
+                                          contrast=contrast)
+                w(u'<li><a href="%s">%s</a></li>' % (xml_escape(url),
+                                                     xml_escape(contrast)))
+            w(u'</ul>')
+            return
+        metric = form.get('metric', 'cosine')
+        try:
+            k = min(int(form.get('k', 10)), MAX_NEIGHBOURS)
+        except ValueError:
+            raise RequestError(_('k should be an integer'))
+        if metric not in METRICS:
+            raise RequestError(_('metric should be in %s')
+                               % u', '.join(METRICS))
+        rset = req.execute('Any C WHERE C is Contrast, C name %(n)s',
+                           {'n': name})
+        neighbours = rset and similar_subjects(
+            req.vreg.config, rset[0][0], entity.eid, k, metric)
+        w(u'<h2>%s</h2>' % xml_escape(_('subjects similar to %s for %s')
+                                      % (entity.identifier, name)))
+        if not neighbours:
+            w(u'<p>%s</p>' % xml_escape(_('no similarity index for this '
+                                          'subject and contrast')))
+            return
+        w(u'<table class="table table-condensed"><tr><th>%s</th><th>%s</th>'
+          u'</tr>' % (xml_escape(_('subject')), xml_escape(_(metric))))
+        for eid, identifier, score in neighbours:
+            w(u'<tr><td><a href="%s">%s</a></td><td>%.3f</td></tr>'
+              % (xml_escape(req.build_url(str(eid))), xml_escape(identifier),
+                 score))
+        w(u'</table>')
+
+
+class SimilarSubjectsAction(Action):
+    __regid__ = 'localizer-similar-subjects'
+    __select__ = is_instance('Subject') & one_line_rset()
+    category = 'mainactions'
+    title = _('Similar subjects')
+
+    def url(self):
+        entity = self.cw_rset.get_entity(self.cw_row or 0, self.cw_col or 0)
+        return entity.absolute_url(vid='localizer-similar-subjects')
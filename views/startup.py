@@ -23,6 +23,7 @@ from cubicweb.web.views.primary import PrimaryView
 from cubicweb.web.action import Action
 from cubes.brainomics.views.startup import BrainomicsIndexView
 from cubes.brainomics.views.actions import BrainomicsAbstractDownloadAction, ScanZipFileBox
+from cubes.localizer.warmstart import render_card
 ZIP_DOWNLOADABLE = ('Scan',)
 
 ###############################################################################
@@ -44,34 +45,9 @@ class LocalizeCardView(PrimaryView):
 
     def call(self, rset=None, **kwargs):
         rset = self.cw_rset or rset
+        entity = rset.get_entity(0, 0)
         # Add links to content
-        content = rset.get_entity(0, 0).content
-        content = content % {'dataset-url': self._cw.build_url('dataset'),
-                             'localizer-url': self._cw.build_url('localizer'),
-                             'brainomics-url': self._cw.build_url('brainomics'),
-                             'license-url': self._cw.build_url('license'),
-                             'fmri-image': self._cw.data_url('dreamstime_s_33211444.jpg'),
-                             'localizer-image': self._cw.data_url('dreamstime_s_28829039.jpg'),
-                             'database-image': self._cw.data_url('dreamstime_s_32994616.jpg'),
-                             'brainomics-image': self._cw.data_url('dreamstime_s_28730600.jpg'),
-                             # Brainomics content
-                             'subject-image': self._cw.data_url('images/subject.png'),
-                             'images-image': self._cw.data_url('images/images.png'),
-                             'genetics-image': self._cw.data_url('images/genetics.png'),
-                             'questionnaire-image': self._cw.data_url('images/questionnaire.png'),
-                             'subject-url': self._cw.build_url(rql='Any X WHERE X is Subject'),
-                             'images-url': self._cw.build_url(rql='Any X, XT, XL, XI, XF, XD '
-                                                              'WHERE X is Scan, '
-                                                              'X type XT, X label XL, X identifier XI, '
-                                                              'X format XF, X description XD'),
-                             'genetics-url': self._cw.build_url(rql='(Any X WHERE X is GenomicMeasure) '
-                                                                'UNION (Any X WHERE X is GenericTestRun, '
-                                                                'X instance_of T, T type "genomics")'),
-                             'questionnaire-url': self._cw.build_url(rql='Any X, XI, XD '
-                                                                     'WHERE X is QuestionnaireRun, '
-                                                                     'X identifier XI, X datetime XD'),
-                             }
-        self.w(content)
+        self.w(render_card(self._cw, entity.eid, entity.content))
 
 
 ###############################################################################
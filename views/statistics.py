@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+# copyright 2013 CEA (Saclay, FRANCE), all rights reserved.
+# copyright 2013 LOGILAB S.A. (Paris, FRANCE), all rights reserved.
+# contact http://brainomics.cea.fr -- mailto:localizer94@cea.fr
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""cubicweb-localizer cohort statistics endpoint
+
+Return the number of subjects for each value of one or several variables
+(gender, handedness, center or a score), e.g.::
+
+    /localizer-statistics?by=gender
+    /localizer-statistics?by=gender,dyslexic
+
+Counts are read from the cohort statistics cache, without querying the
+database, see statistics.py.
+"""
+
+import json
+
+from cubicweb.web import RequestError
+from cubicweb.web.controller import Controller
+
+from cubes.localizer.statistics import VARIABLES, cohort_counts
+
+
+class CohortStatisticsController(Controller):
+    __regid__ = 'localizer-statistics'
+
+    def publish(self, rset=None):
+        req = self._cw
+        variables = [variable.strip() for variable in
+                     req.form.get('by', u'gender').split(',')
+                     if variable.strip()]
+        try:
+            counts = cohort_counts(req.vreg.config, variables)
+        except ValueError:
+            raise RequestError(req._('variables should be in %s')
+                               % u', '.join(VARIABLES))
+        req.set_content_type('application/json')
+        return json.dumps({'variables': variables,
+                           'counts': [dict(zip(variables, values),
+                                           count=count)
+                                      for values, count in counts]})
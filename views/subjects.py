@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+# copyright 2013 CEA (Saclay, FRANCE), all rights reserved.
+# copyright 2013 LOGILAB S.A. (Paris, FRANCE), all rights reserved.
+# contact http://brainomics.cea.fr -- mailto:localizer94@cea.fr
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""cubicweb-localizer subjects views, using the subjects summaries"""
+
+import json
+
+from logilab.mtconverter import xml_escape
+
+from cubicweb.predicates import is_instance
+from cubicweb.view import EntityView
+from cubicweb.web.component import EntityCtxComponent
+from cubicweb.web.controller import Controller
+from cubicweb.web.views import uicfg
+
+from cubes.localizer.summaries import fetch_summaries, load_summary
+from cubes.localizer.views.cohort import (DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE,
+                                          _int_param)
+from cubes.localizer.importers.localizer import SCORE_TYPES
+
+# the summary is computed from the database: neither displayed as is nor edited
+uicfg.primaryview_section.tag_attribute(('Subject', 'localizer_summary'),
+                                        'hidden')
+uicfg.autoform_section.tag_attribute(('Subject', 'localizer_summary'),
+                                     'main', 'hidden')
+# the relations displayed by the summary component, which would otherwise be
+# fetched again, one query per relation
+for rtype in ('related_infos', 'concerned_by'):
+    uicfg.primaryview_section.tag_subject_of(('Subject', rtype, '*'),
+                                             'hidden')
+uicfg.primaryview_section.tag_object_of(('*', 'concerns', 'Subject'), 'hidden')
+
+
+def _link(req, eid, label):
+    return u'<a href="%s">%s</a>' % (xml_escape(req.build_url(str(eid))),
+                                     xml_escape(label))
+
+
+class SubjectSummaryComponent(EntityCtxComponent):
+    """display the subject's summary: center, scores and data"""
+    __regid__ = 'localizer.subject-summary'
+    __select__ = EntityCtxComponent.__select__ & is_instance('Subject')
+    context = 'navcontenttop'
+    title = _('Summary')
+
+    def render_body(self, w):
+        _ = self._cw._
+        summary = load_summary(self.entity.localizer_summary)
+        if summary is None:
+            return
+        w(u'<table class="table table-condensed">')
+        w(u'<tr><th>%s</th><td>%s</td></tr>'
+          % (xml_escape(_('center')),
+             xml_escape(u', '.join(summary['centers']))))
+        if summary['assessments']:
+            w(u'<tr><th>%s</th><td>%s</td></tr>'
+              % (xml_escape(_('assessments')), u', '.join(
+                  _link(self._cw, item['eid'], item['identifier'])
+                  for item in summary['assessments'])))
+        for name in SCORE_TYPES:
+            if name in summary['scores']:
+                w(u'<tr><th>%s</th><td>%s</td></tr>'
+                  % (xml_escape(_(name)), xml_escape(summary['scores'][name])))
+        scans = {}
+        for scan in summary['scans']:
+            scans.setdefault(scan['type'], []).append(scan)
+        for scan_type in sorted(scans):
+            w(u'<tr><th>%s</th><td>%s</td></tr>'
+              % (xml_escape(_(scan_type)), u', '.join(
+                  _link(self._cw, scan['eid'], scan['label'])
+                  for scan in sorted(scans[scan_type],
+                                     key=lambda scan: scan['label']))))
+        for key, label in (('questionnaire_runs', _('questionnaire runs')),
+                           ('genomic_measures', _('genomic measures'))):
+            if summary[key]:
+                w(u'<tr><th>%s</th><td>%s</td></tr>'
+                  % (xml_escape(label), u', '.join(
+                      _link(self._cw, item['eid'], item['identifier'])
+                      for item in summary[key])))
+        w(u'</table>')
+
+
+class SubjectsSummaryView(EntityView):
+    """table of subjects, built from their summaries with a single query"""
+    __regid__ = 'localizer-subjects'
+    __select__ = EntityView.__select__ & is_instance('Subject')
+    title = _('subjects')
+
+    def call(self, **kwargs):
+        _ = self._cw._
+        eids = [row[self.cw_col or 0] for row in self.cw_rset]
+        summaries = fetch_summaries(self._cw, eids)
+        w = self.w
+        w(u'<table class="table table-striped table-condensed">')
+        w(u'<tr>%s</tr>' % u''.join(
+            u'<th>%s</th>' % xml_escape(_(label)) for label in
+            ('identifier', 'gender', 'handedness', 'center', 'scans')
+            + SCORE_TYPES))
+        for eid in eids:
+            summary = summaries.get(eid)
+            if summary is None:
+                continue
+            cells = [_link(self._cw, eid, summary['identifier']),
+                     xml_escape(_(summary['gender'])),
+                     xml_escape(_(summary['handedness'])),
+                     xml_escape(u', '.join(summary['centers'])),
+                     unicode(len(summary['scans']))]
+            cells += [xml_escape(summary['scores'].get(name) or u'')
+                      for name in SCORE_TYPES]
+            w(u'<tr>%s</tr>' % u''.join(u'<td>%s</td>' % cell
+                                        for cell in cells))
+        w(u'</table>')
+
+
+class SubjectsSummaryController(Controller):
+    """return the summaries of subjects as a JSON list, by pages of `limit`
+    subjects ordered by eid, e.g.::
+
+        /localizer-subjects-summary?identifiers=S1,S2
+        /localizer-subjects-summary?limit=500&cursor=1234
+
+    The cursor of the next page is given in the `X-Next-Cursor` header (and in
+    a `Link` header), which is missing on the last page, as for the cohort
+    export.
+    """
+    __regid__ = 'localizer-subjects-summary'
+
+    def publish(self, rset=None):
+        req = self._cw
+        cursor = _int_param(req, 'cursor', 0)
+        limit = min(max(_int_param(req, 'limit', DEFAULT_PAGE_SIZE), 1),
+                    MAX_PAGE_SIZE)
+        identifiers = req.form.get('identifiers')
+        if identifiers:
+            identifiers = sorted(set(identifiers.split(',')))
+        summaries = fetch_summaries(req, identifiers=identifiers or None,
+                                    cursor=cursor, limit=limit)
+        summaries = [summaries[eid] for eid in sorted(summaries)]
+        req.set_content_type('application/json')
+        if len(summaries) == limit:
+            next_cursor = str(summaries[-1]['eid'])
+            params = {'cursor': next_cursor, 'limit': limit}
+            if identifiers:
+                params['identifiers'] = ','.join(identifiers)
+            req.set_header('X-Next-Cursor', next_cursor)
+            req.set_header('Link', '<%s>; rel="next"' % req.build_url(
+                'localizer-subjects-summary', **params))
+        return json.dumps(summaries)
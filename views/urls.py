@@ -18,19 +18,18 @@
 
 """cubicweb-brainomics views/forms/actions/components for web ui"""
 
-from cubicweb.web.views.urlrewrite import SimpleReqRewriter, rgx
+from cubicweb.web.views.urlrewrite import SimpleReqRewriter
+
+CARD_PATHS = (u'brainomics', u'localizer', u'license', u'legal', u'dataset')
+
+
+def _card_rules(titles):
+    """Return the rewriting rules of the `/<title>` paths of cards"""
+    return [('/%s' % title,
+             dict(rql=u'Any X WHERE X is Card, X title "%s"' % title))
+            for title in titles]
 
 
 class LocalizerReqRewriter(SimpleReqRewriter):
-    rules = [
-        (rgx('/brainomics'),
-         dict(rql=r'Any X WHERE X is Card, X title "brainomics"')),
-        (rgx('/localizer'),
-         dict(rql=r'Any X WHERE X is Card, X title "localizer"')),
-        (rgx('/license'),
-         dict(rql=r'Any X WHERE X is Card, X title "license"')),
-        (rgx('/legal'),
-         dict(rql=r'Any X WHERE X is Card, X title "legal"')),
-        (rgx('/dataset'),
-         dict(rql=r'Any X WHERE X is Card, X title "dataset"')),
-        ]
+    # plain strings are compared to the uri, no regular expression involved
+    rules = _card_rules(CARD_PATHS)
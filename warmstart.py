@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+# copyright 2013 CEA (Saclay, FRANCE), all rights reserved.
+# copyright 2013 LOGILAB S.A. (Paris, FRANCE), all rights reserved.
+# contact http://brainomics.cea.fr -- mailto:localizer94@cea.fr
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""cubicweb-localizer warm start
+
+The pages of the site are cards whose HTML content is a template filled with
+links to the other pages. Rendered cards are kept in memory by the card view;
+when the `localizer-warm-start` option is set, they are also persisted in the
+localizer cache directory and preloaded when the repository starts, i.e.
+before a preforking WSGI server forks its workers. Persisted cards are
+rendered again when a card, the cube version or the card links change.
+
+When a card is modified, a generation stored in the localizer cache
+directory is bumped, so that every process forgets its rendered cards.
+
+Run at deployment time to compile the message catalogs and render the cards::
+
+    cubicweb-ctl shell <instance> warmstart.py
+"""
+
+import hashlib
+
+from cubes.localizer.__pkginfo__ import version
+from cubes.localizer.caches import JSONCache
+
+WARM_START = JSONCache('warm-start.json')
+CARDS_GENERATION = JSONCache('cards-generation.json')
+
+# rendered card contents, by (card eid, base url), and the cards generation
+# they were rendered at
+RENDERED_CARDS = {}
+_RENDERED_GENERATION = [None]
+
+
+###############################################################################
+### CARD LINKS ################################################################
+###############################################################################
+GENETICS_RQL = ('(Any X WHERE X is GenomicMeasure) '
+                'UNION (Any X WHERE X is GenericTestRun, '
+                'X instance_of T, T type "genomics")')
+
+CARD_URLS = (
+    ('dataset-url', 'dataset'),
+    ('localizer-url', 'localizer'),
+    ('brainomics-url', 'brainomics'),
+    ('license-url', 'license'),
+)
+
+CARD_IMAGES = (
+    ('fmri-image', 'dreamstime_s_33211444.jpg'),
+    ('localizer-image', 'dreamstime_s_28829039.jpg'),
+    ('database-image', 'dreamstime_s_32994616.jpg'),
+    ('brainomics-image', 'dreamstime_s_28730600.jpg'),
+    # Brainomics content
+    ('subject-image', 'images/subject.png'),
+    ('images-image', 'images/images.png'),
+    ('genetics-image', 'images/genetics.png'),
+    ('questionnaire-image', 'images/questionnaire.png'),
+)
+
+# (name, rql, view identifier)
+CARD_RQLS = (
+    ('subject-url', 'Any X WHERE X is Subject', 'localizer-subjects'),
+    ('images-url', 'Any X, XT, XL, XI, XF, XD WHERE X is Scan, '
+                   'X type XT, X label XL, X identifier XI, '
+                   'X format XF, X description XD', None),
+    ('genetics-url', GENETICS_RQL, None),
+    ('questionnaire-url', 'Any X, XI, XD WHERE X is QuestionnaireRun, '
+                          'X identifier XI, X datetime XD', None),
+)
+
+# changes of the card links outdate the persisted cards
+RENDERING_KEY = hashlib.sha1(repr((CARD_URLS, CARD_IMAGES,
+                                   CARD_RQLS))).hexdigest()
+
+def card_links(req):
+    """Return the links to substitute in the cards content"""
+    links = {}
+    for name, path in CARD_URLS:
+        links[name] = req.build_url(path)
+    for name, path in CARD_IMAGES:
+        links[name] = req.data_url(path)
+    for name, rql, vid in CARD_RQLS:
+        if vid is None:
+            links[name] = req.build_url(rql=rql)
+        else:
+            links[name] = req.build_url(rql=rql, vid=vid)
+    return links
+
+def _check_generation(config):
+    generation = CARDS_GENERATION.load(config).get('generation')
+    if generation != _RENDERED_GENERATION[0]:
+        RENDERED_CARDS.clear()
+        _RENDERED_GENERATION[0] = generation
+
+def render_card(req, eid, content):
+    """Return the content of the card with links added"""
+    _check_generation(req.vreg.config)
+    key = (eid, req.base_url())
+    try:
+        return RENDERED_CARDS[key]
+    except KeyError:
+        html = RENDERED_CARDS[key] = content % card_links(req)
+        return html
+
+
+###############################################################################
+### PRECOMPUTE / PRELOAD ######################################################
+###############################################################################
+class ConfigURLBuilder(object):
+    """Build urls as a web request would do, using the instance configuration"""
+
+    def __init__(self, session):
+        self.session = session
+        self.vreg = session.vreg
+        self.config = session.vreg.config
+
+    def base_url(self):
+        return self.config['base-url']
+
+    def build_url(self, *args, **kwargs):
+        return self.session.build_url(*args, **kwargs)
+
+    def data_url(self, relpath):
+        # repository-only configurations have no data directory url, derive
+        # it from the base url as web configurations do
+        datadir_url = getattr(self.config, 'datadir_url', None)
+        if datadir_url is None:
+            datadir_url = self.base_url() + 'data/'
+        return datadir_url + relpath
+
+
+def _cards_state(session):
+    return dict((unicode(eid), unicode(mdate))
+                for eid, mdate in session.execute(
+                    'Any X, D WHERE X is Card, X modification_date D'))
+
+def precompute(session, compile_catalogs=False):
+    """Render the cards and persist them in the localizer cache directory"""
+    config = session.vreg.config
+    if compile_catalogs:
+        config.i18ncompile()
+    req = ConfigURLBuilder(session)
+    cards = []
+    for eid, content in session.execute('Any X, C WHERE X is Card, '
+                                        'X content C'):
+        cards.append((eid, req.base_url(), render_card(req, eid, content)))
+    data = {'version': version,
+            'rendering': RENDERING_KEY,
+            'cards-state': _cards_state(session),
+            'cards': cards}
+    WARM_START.dump(config, data)
+    return data
+
+def preload(repo):
+    """Fill the in-memory caches from the persisted data, computing them first
+    if they are missing or outdated"""
+    session = repo.internal_session()
+    try:
+        data = WARM_START.load(repo.config)
+        if (data.get('version') != version
+            or data.get('rendering') != RENDERING_KEY
+            or data.get('cards-state') != _cards_state(session)):
+            data = precompute(session)
+    finally:
+        session.close()
+    _check_generation(repo.config)
+    for eid, base_url, html in data['cards']:
+        RENDERED_CARDS[(eid, base_url)] = html
+
+def forget_cards(config):
+    """Outdate the rendered cards of every process, after a card was
+    modified"""
+    def update(data):
+        data['generation'] = data.get('generation', 0) + 1
+        return data
+    CARDS_GENERATION.update(config, update)
+
+
+###############################################################################
+### MAIN ######################################################################
+###############################################################################
+if __name__ == '__main__':
+    precompute(session, compile_catalogs=True)